@@ -4,7 +4,6 @@ from dotenv import load_dotenv
 from flask import Flask, redirect, url_for, request, render_template
 from flask_admin import Admin
 from flask_admin.contrib.sqla import ModelView
-from flask_apscheduler import APScheduler
 from flask_babel import Babel
 from flask_bcrypt import Bcrypt
 from flask_caching import Cache
@@ -51,12 +50,11 @@ def init_logging():
 init_logging()
 
 from SIMS_Portal import models
-from SIMS_Portal.main.utils import get_ns_list
+from SIMS_Portal.main.utils import LazyNSList, register_ns_list_invalidation
 
-# run utility to generate active NS list
+# NS list for the navbar dropdown; only queried when a template renders it, and then from a per-worker snapshot
 def build_ns_dropdown():
-	ns_list = get_ns_list()
-	return {'ns_list': ns_list}
+	return {'ns_list': LazyNSList()}
 
 # AdminView inherits from ModelView to only show tables in the admin page if user is logged in AND is listed as an admin
 class AdminView(ModelView):
@@ -90,8 +88,24 @@ def create_app(config_class=Config):
 	Markdown(app)
 	cache.init_app(app)
 	
+	# committed model writes invalidate the cache entries tagged with their table and row
+	from SIMS_Portal.caching.utils import register_cache_invalidation
+	register_cache_invalidation()
+	register_ns_list_invalidation()
+	from SIMS_Portal.portfolios.utils import register_emergency_products_invalidation
+	register_emergency_products_invalidation()
+	
+	# ORM writes to searchable records reindex them in the same transaction, see search/utils.py
+	from SIMS_Portal.search.utils import register_search_indexing
+	register_search_indexing()
+	
 	csrf = CSRFProtect(app)
 	
+	# opt-in per-request SQL statement counts and timings, see /admin/query_profile
+	if app.config['QUERY_PROFILER']:
+		from SIMS_Portal.profiling.utils import init_query_profiler
+		init_query_profiler(app)
+	
 	# @babel.localeselector
 	# def get_locale():
 	# 	user_lang = request.accept_languages.best_match(app.config['LANGUAGES'])
@@ -112,44 +126,7 @@ def create_app(config_class=Config):
 		app.logger.setLevel(logging.INFO)
 		app.logger.info('SIMS Portal Started Up')
 	
-	# only turn scheduled tasks on in production
-	if app.config['DEBUG'] == False:
-	
-		scheduler = APScheduler()
-		scheduler.init_app(app)
-		scheduler.start()
-		
-		@scheduler.task('cron', id='run_surge_alert_refresh', hour='1,4,7,10,13,16')
-		def run_surge_alert_refresh():
-			with scheduler.app.app_context():
-				from SIMS_Portal.alerts.utils import refresh_surge_alerts_latest
-				from SIMS_Portal.main.utils import heartbeats
-				refresh_surge_alerts_latest()
-				heartbeats('run_surge_alert_refresh', 'https://uptime.betterstack.com/api/v1/heartbeat/7DQYkNR4cM96cKsY69xQah4k')
-				
-		@scheduler.task('cron', id='run_auto_badge_assigners', hour='17')
-		def run_auto_badge_assigners():
-			with scheduler.app.app_context():
-				from SIMS_Portal.main.utils import auto_badge_assigner_big_wig, auto_badge_assigner_maiden_voyage, auto_badge_assigner_self_promoter, auto_badge_assigner_polyglot, auto_badge_assigner_autobiographer, auto_badge_assigner_world_traveler, auto_badge_assigner_edward_tufte, auto_badge_assigner_old_salt
-				from SIMS_Portal.main.utils import heartbeats
-				auto_badge_assigner_maiden_voyage()
-				auto_badge_assigner_big_wig()
-				auto_badge_assigner_self_promoter()
-				auto_badge_assigner_polyglot()
-				auto_badge_assigner_autobiographer()
-				auto_badge_assigner_edward_tufte()
-				auto_badge_assigner_world_traveler()
-				auto_badge_assigner_old_salt()
-				heartbeats('run_auto_badge_assigners', 'https://uptime.betterstack.com/api/v1/heartbeat/QWvz7BCEoLnpKeCFMFbK3d2a')
-		
-		# scheduler to automatically ping all associated members to active disasters to request availability
-		# @scheduler.task('cron', id='request_availability', week='*', day_of_week='mon', hour=8)
-		# def run_request_availability():
-		# 	with scheduler.app.app_context():
-		# 		from SIMS_Portal.availability.utils import request_availability_updates
-		# 		from SIMS_Portal.main.utils import heartbeats
-		# 		request_availability_updates()
-		# 		heartbeats('request_availability', 'https://uptime.betterstack.com/api/v1/heartbeat/5WUSoe7kqnkKxQVLr1iKTFuq')
+	# scheduled jobs (surge alerts, auto badges) run in the separate worker process, see worker.py and SIMS_Portal/jobs/utils.py
 	
 	from SIMS_Portal.main.routes import main
 	from SIMS_Portal.assignments.routes import assignments
@@ -163,6 +140,7 @@ def create_app(config_class=Config):
 	from SIMS_Portal.errors.handlers import errors
 	from SIMS_Portal.availability.routes import availability
 	from SIMS_Portal.acronym.routes import acronym
+	from SIMS_Portal.search.routes import search
 
 	app.register_blueprint(main)
 	app.register_blueprint(assignments)
@@ -176,6 +154,7 @@ def create_app(config_class=Config):
 	app.register_blueprint(errors)
 	app.register_blueprint(availability)
 	app.register_blueprint(acronym)
+	app.register_blueprint(search)
 	
 	from SIMS_Portal.models import User, Assignment, Emergency, Portfolio, NationalSociety, Story, Learning, Review, Alert, Badge, Availability, Documentation
 	admin.add_view(AdminView(User, db.session))
@@ -200,4 +179,8 @@ def create_app(config_class=Config):
 	# required to reinit logging after flask_migrate
 	init_logging()
 	
+	# local SQLite databases search FTS5 tables instead of the Postgres search_vector columns
+	from SIMS_Portal.search.utils import init_search_index
+	init_search_index(app)
+	
 	return app
\ No newline at end of file
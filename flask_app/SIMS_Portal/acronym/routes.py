@@ -1,9 +1,11 @@
+import csv
+import io
 import logging
 from datetime import datetime, date, timedelta
 
 from flask import (
     request, render_template, url_for, flash, redirect,
-    jsonify, Blueprint, current_app, redirect, abort, session
+    jsonify, Blueprint, current_app, redirect, abort, session, Response
 )
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import (
@@ -16,12 +18,35 @@ from SIMS_Portal.models import Acronym, User, Log, NationalSociety
 from SIMS_Portal.users.utils import send_slack_dm, new_acronym_alert
 from SIMS_Portal import db, login_manager
 from SIMS_Portal.acronym.forms import NewAcronymForm, NewAcronymFormPublic, EditAcronymForm
+from SIMS_Portal.acronym.utils import get_acronym_index, refresh_acronym, acronym_dict
 
 acronym = Blueprint('acronym', __name__)
 
+def get_acronym_page(per_page):
+    """
+    One page of the glossary for the list pages, from this worker's acronym index: everything in order, or the matches for ?q= best first.
+    """
+    q = request.args.get('q', '').strip()
+    page = request.args.get('page', '1')
+    page = int(page) if page.isdigit() and int(page) > 0 else 1
+    
+    index = get_acronym_index()
+    ids = index.search(q) if q else None
+    count_acronyms = len(ids) if ids is not None else len(index)
+    count_pages = max(1, (count_acronyms + per_page - 1) // per_page)
+    page = min(page, count_pages)
+    
+    return {
+        'all_acronyms': index.page((page - 1) * per_page, per_page, ids),
+        'q': q,
+        'page': page,
+        'count_pages': count_pages,
+        'count_acronyms': count_acronyms,
+    }
+
 @acronym.route('/acronyms')
 def acronyms():
-    all_acronyms = db.session.query(Acronym).filter(Acronym.approved_by > 0).all()
+    acronym_page = get_acronym_page(current_app.config['ACRONYMS_PER_PAGE'])
     
     # check if user is admin for edit power
     try:
@@ -39,13 +64,70 @@ def acronyms():
 
 
     
-    return render_template('acronyms.html', all_acronyms=all_acronyms, user_is_admin=user_is_admin, user_info=user_info)
+    return render_template('acronyms.html', user_is_admin=user_is_admin, user_info=user_info, **acronym_page)
 
 @acronym.route('/acronyms/compact')
 def acronyms_compact():
-    all_acronyms = db.session.query(Acronym).filter(Acronym.approved_by > 0).order_by(Acronym.acronym_eng).all()
+    acronym_page = get_acronym_page(current_app.config['ACRONYMS_COMPACT_PER_PAGE'])
+    
+    return render_template('acronyms_compact.html', **acronym_page)
+
+@acronym.route('/acronyms/export.csv')
+def acronyms_export():
+    """
+    The whole approved glossary as CSV, in list order. Streamed row by row from the acronym index.
+    """
+    columns = ['acronym_eng', 'def_eng', 'expl_eng', 'acronym_esp', 'def_esp', 'expl_esp', 'acronym_fra', 'def_fra', 'expl_fra', 'relevant_link']
+    
+    # taken while the app context is still around; the generator runs as the response is sent
+    entries = get_acronym_index().all()
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for entry in entries:
+            writer.writerow([entry[column] or '' for column in columns])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    response = Response(generate(), mimetype='text/csv')
+    response.headers['Content-Disposition'] = 'attachment; filename=SIMS_Portal_Acronyms.csv'
+    return response
+
+@acronym.route('/api/acronyms/typeahead', methods=['GET'])
+def api_acronyms_typeahead():
+    """
+    Acronym suggestions as the user types
+    
+    URL: /api/acronyms/typeahead?q=<partial acronym or definition>&limit=<n>
+    
+    Method: GET
+    
+    Parameters:
+        q (str): Part of an acronym or of a definition, in English, Spanish or French. Case, accents and punctuation are ignored, and a typo or two is tolerated when there aren't enough exact matches.
+        limit (int): Optional number of suggestions, capped at ACRONYM_TYPEAHEAD_MAX_LIMIT.
+    
+    Returns:
+        list: Approved acronyms, best match first, each with id, the acronym, definition and explanation in all three languages, relevant_link and url.
+    """
+    q = request.args.get('q', '').strip()
+    limit = request.args.get('limit', str(current_app.config['ACRONYM_TYPEAHEAD_LIMIT']))
+    if not limit.isdigit() or int(limit) < 1:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    limit = min(int(limit), current_app.config['ACRONYM_TYPEAHEAD_MAX_LIMIT'])
+    
+    if not q:
+        return jsonify([])
     
-    return render_template('acronyms_compact.html', all_acronyms=all_acronyms)
+    index = get_acronym_index()
+    results = []
+    for entry in index.page(0, limit, index.search(q, limit=limit)):
+        result = acronym_dict(entry)
+        result['url'] = url_for('acronym.view_acronym', id=entry['id'])
+        results.append(result)
+    return jsonify(results)
 
 @acronym.route('/view_acronym/<int:id>')
 def view_acronym(id):
@@ -56,7 +138,7 @@ def view_acronym(id):
             abort(404)
     
         try:
-            similar_matches = db.session.query(Acronym).filter(Acronym.acronym_eng == acronym_info.Acronym.acronym_eng, Acronym.id != id).all()
+            similar_matches = get_acronym_index().similar(id)
         except:
             similar_matches = None
     except NoResultFound:
@@ -182,6 +264,7 @@ def approve_acronym(id):
     if current_user.is_admin == 1:
         db.session.query(Acronym).filter(Acronym.id == id).update({'approved_by':current_user.id})
         db.session.commit()
+        refresh_acronym(id)
         flash('Acronym has been approved and is now listed for all viewers.', 'success')
         return redirect(url_for('main.admin_process_acronyms'))
     else:
@@ -197,6 +280,7 @@ def delete_acronym(id):
             try:
                 db.session.delete(acronym_to_delete)
                 db.session.commit()
+                refresh_acronym(id)
                 flash('Acronym has been deleted.', 'success')
             except IntegrityError:
                 db.session.rollback()
@@ -236,6 +320,7 @@ def edit_acronym(id):
         
         if current_user.is_admin or acronym_info.added_by == current_user.id:
             db.session.commit()
+            refresh_acronym(id)
             flash('Acronym record updated.', 'success')
         
             log_message = f"[INFO] User {current_user.id} edited acronym {acronym_info.id}."
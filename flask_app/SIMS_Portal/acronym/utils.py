@@ -0,0 +1,365 @@
+import bisect
+import re
+import threading
+import unicodedata
+from collections import Counter, deque
+from datetime import timedelta
+
+from sqlalchemy import func
+from SIMS_Portal import db
+from SIMS_Portal.models import Acronym
+from SIMS_Portal.caching.utils import get_tag_versions
+
+# columns copied into the index for every approved acronym; the list pages render straight from these
+ACRONYM_INDEX_COLUMNS = [
+    'id', 'acronym_eng', 'def_eng', 'expl_eng', 'acronym_esp', 'def_esp', 'expl_esp',
+    'acronym_fra', 'def_fra', 'expl_fra', 'relevant_link', 'added_by', 'approved_by'
+]
+ACRONYM_KEY_COLUMNS = ['acronym_eng', 'acronym_esp', 'acronym_fra']
+ACRONYM_WORD_COLUMNS = ['def_eng', 'def_esp', 'def_fra']
+
+# any write to the acronym table bumps this tag (see caching/utils.py), which tells every worker its copy is out of date
+ACRONYM_INDEX_TAGS = ['acronym']
+
+# rows changed this long before the last sync are fetched again, so an edit committed while a sync was running isn't missed
+ACRONYM_SYNC_MARGIN = timedelta(minutes=5)
+
+# fuzzy matching compares at most this many trigram candidates, and allows one typo in short strings and two in longer ones
+FUZZY_CANDIDATES = 200
+
+def fold(text):
+    """
+    Lowercases and strips accents, so 'Fédération' and 'federacion' index alike.
+    """
+    return ''.join(c for c in unicodedata.normalize('NFKD', (text or '').lower()) if not unicodedata.combining(c))
+
+def acronym_key(text):
+    # 'I.F.R.C.' and 'ifrc' are the same acronym
+    return re.sub(r'[\W_]+', '', fold(text))
+
+def definition_words(text):
+    return [word for word in re.findall(r'[^\W_]+', fold(text)) if len(word) > 1]
+
+def trigrams(text):
+    padded = '  {} '.format(text)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def max_typos(text):
+    return 1 if len(text) <= 5 else 2
+
+def edit_distance(a, b, limit):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transpositions, so 'ifcr' is one typo from 'ifrc'). Gives up and returns limit + 1 as soon as the distance must exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+class TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = set()
+
+class Trie:
+    """
+    Maps strings to sets of acronym ids and finds every string that starts with a prefix, shortest first.
+    """
+    def __init__(self):
+        self.root = TrieNode()
+
+    def add(self, text, acronym_id):
+        node = self.root
+        for character in text:
+            node = node.children.setdefault(character, TrieNode())
+        node.ids.add(acronym_id)
+
+    def remove(self, text, acronym_id):
+        path = [self.root]
+        for character in text:
+            node = path[-1].children.get(character)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].ids.discard(acronym_id)
+        # prune the branch back up to the last node still in use
+        for depth in range(len(text), 0, -1):
+            node = path[depth]
+            if node.ids or node.children:
+                break
+            del path[depth - 1].children[text[depth - 1]]
+
+    def complete(self, prefix, limit=None):
+        """
+        Yields the ids of every string starting with prefix, breadth first, so exact and short completions come before long ones. Stops after limit distinct ids.
+        """
+        node = self.root
+        for character in prefix:
+            node = node.children.get(character)
+            if node is None:
+                return
+        seen = set()
+        queue = deque([node])
+        while queue:
+            node = queue.popleft()
+            for acronym_id in node.ids:
+                if acronym_id not in seen:
+                    seen.add(acronym_id)
+                    yield acronym_id
+                    if limit is not None and len(seen) >= limit:
+                        return
+            queue.extend(node.children[character] for character in sorted(node.children))
+
+class AcronymIndex:
+    """
+    In-memory index of approved acronyms in all three languages. Acronyms (normalized with acronym_key) and the words of their definitions each go into a trie for prefix lookups and a trigram index for typo-tolerant ones, and the entries are kept sorted for the paginated list pages. Built once per worker and then updated a row at a time.
+    """
+    def __init__(self, rows=()):
+        self.entries = {}
+        self.sorted_keys = []
+        self.key_ids = {}
+        self.word_ids = {}
+        self.key_trie = Trie()
+        self.word_trie = Trie()
+        self.key_trigrams = {}
+        self.word_trigrams = {}
+        for row in rows:
+            self.upsert(row, keep_sorted=False)
+        # sorted once at the end rather than kept sorted through every insert
+        self.sorted_keys.sort()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _sort_key(self, entry):
+        return (acronym_key(entry['acronym_eng'] or entry['acronym_esp'] or entry['acronym_fra']), entry['id'])
+
+    def _link(self, strings, ids_by_string, trie, trigram_index, text, acronym_id):
+        ids = ids_by_string.setdefault(text, set())
+        if not ids:
+            for trigram in trigrams(text):
+                trigram_index.setdefault(trigram, set()).add(text)
+        ids.add(acronym_id)
+        trie.add(text, acronym_id)
+        strings.add(text)
+
+    def _unlink(self, ids_by_string, trie, trigram_index, text, acronym_id):
+        ids = ids_by_string.get(text)
+        if ids is None:
+            return
+        ids.discard(acronym_id)
+        trie.remove(text, acronym_id)
+        if not ids:
+            del ids_by_string[text]
+            for trigram in trigrams(text):
+                texts = trigram_index.get(trigram)
+                if texts is not None:
+                    texts.discard(text)
+                    if not texts:
+                        del trigram_index[trigram]
+
+    def upsert(self, row, keep_sorted=True):
+        """
+        Adds or replaces one acronym; row is anything with the ACRONYM_INDEX_COLUMNS as attributes or keys.
+        """
+        entry = {column: (row[column] if isinstance(row, dict) else getattr(row, column)) for column in ACRONYM_INDEX_COLUMNS}
+        self.remove(entry['id'])
+
+        keys, words = set(), set()
+        for column in ACRONYM_KEY_COLUMNS:
+            key = acronym_key(entry[column])
+            if key:
+                self._link(keys, self.key_ids, self.key_trie, self.key_trigrams, key, entry['id'])
+        for column in ACRONYM_WORD_COLUMNS:
+            for word in definition_words(entry[column]):
+                self._link(words, self.word_ids, self.word_trie, self.word_trigrams, word, entry['id'])
+
+        entry['_keys'], entry['_words'], entry['_sort_key'] = keys, words, self._sort_key(entry)
+        self.entries[entry['id']] = entry
+        if keep_sorted:
+            bisect.insort(self.sorted_keys, entry['_sort_key'])
+        else:
+            self.sorted_keys.append(entry['_sort_key'])
+
+    def remove(self, acronym_id):
+        entry = self.entries.pop(acronym_id, None)
+        if entry is None:
+            return
+        for key in entry['_keys']:
+            self._unlink(self.key_ids, self.key_trie, self.key_trigrams, key, acronym_id)
+        for word in entry['_words']:
+            self._unlink(self.word_ids, self.word_trie, self.word_trigrams, word, acronym_id)
+        position = bisect.bisect_left(self.sorted_keys, entry['_sort_key'])
+        if position < len(self.sorted_keys) and self.sorted_keys[position] == entry['_sort_key']:
+            del self.sorted_keys[position]
+
+    def _fuzzy(self, text, ids_by_string, trigram_index):
+        """
+        Strings within max_typos() edits of text, closest first, found by comparing only the strings that share the most trigrams with it.
+        """
+        if len(text) < 3:
+            return []
+        shared = Counter()
+        for trigram in trigrams(text):
+            shared.update(trigram_index.get(trigram, ()))
+        limit = max_typos(text)
+        matches = []
+        for candidate, count in shared.most_common(FUZZY_CANDIDATES):
+            distance = edit_distance(text, candidate, limit)
+            if distance <= limit:
+                matches.append((distance, candidate))
+        return [candidate for distance, candidate in sorted(matches)]
+
+    def _word_matches(self, terms, fuzzy, limit):
+        """
+        Ids whose definitions contain every term, the last one as a prefix (or, with fuzzy, words a typo or two away from each term).
+        """
+        matched = None
+        for position, term in enumerate(terms):
+            last = position == len(terms) - 1
+            if fuzzy:
+                ids = set()
+                for word in self._fuzzy(term, self.word_ids, self.word_trigrams):
+                    ids.update(self.word_ids[word])
+            elif last:
+                ids = set(self.word_trie.complete(term, limit if len(terms) == 1 else None))
+            else:
+                ids = set(self.word_ids.get(term, ()))
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                return set()
+        return matched
+
+    def search(self, q, limit=None, fuzzy=True):
+        """
+        Returns acronym ids for a query, best first: exact acronyms, then acronyms starting with q, then definitions containing every word of q (the last word as a prefix), then near misses of both when there aren't already limit results. Ties are in list order.
+        """
+        terms = definition_words(q) or [acronym_key(q)]
+        key = acronym_key(q)
+        if not key:
+            return []
+
+        ranked, seen = [], set()
+        def add(ids):
+            for acronym_id in sorted(ids, key=lambda acronym_id: self.entries[acronym_id]['_sort_key']):
+                if acronym_id not in seen:
+                    seen.add(acronym_id)
+                    ranked.append(acronym_id)
+            return limit is not None and len(ranked) >= limit
+
+        groups = [
+            lambda: self.key_ids.get(key, ()),
+            lambda: self.key_trie.complete(key, None if limit is None else limit + len(seen)),
+            lambda: self._word_matches(terms, False, None if limit is None else limit + len(seen)),
+        ]
+        if fuzzy:
+            groups += [
+                lambda: {acronym_id for match in self._fuzzy(key, self.key_ids, self.key_trigrams) for acronym_id in self.key_ids[match]},
+                lambda: self._word_matches(terms, True, None),
+            ]
+        for group in groups:
+            if add(group()):
+                break
+        return ranked[:limit] if limit is not None else ranked
+
+    def similar(self, acronym_id, limit=12):
+        """
+        Other acronyms that share an acronym with this one in any language, or are a typo away from one.
+        """
+        entry = self.entries.get(acronym_id)
+        if entry is None:
+            return []
+        ids = set()
+        for key in entry['_keys']:
+            ids.update(self.key_ids.get(key, ()))
+            for match in self._fuzzy(key, self.key_ids, self.key_trigrams):
+                ids.update(self.key_ids[match])
+        ids.discard(acronym_id)
+        exact = {other_id for key in entry['_keys'] for other_id in self.key_ids.get(key, ())}
+        ordered = sorted(ids, key=lambda other_id: (other_id not in exact, self.entries[other_id]['_sort_key']))
+        return [self.entries[other_id] for other_id in ordered[:limit]]
+
+    def page(self, offset, count, ids=None):
+        """
+        One page of entries in list order, from all of them or from the result of search().
+        """
+        if ids is None:
+            return [self.entries[sort_key[1]] for sort_key in self.sorted_keys[offset:offset + count]]
+        return [self.entries[acronym_id] for acronym_id in ids[offset:offset + count]]
+
+    def all(self):
+        # a list rather than a generator, so later updates to the index can't disturb a caller still iterating
+        return [self.entries[sort_key[1]] for sort_key in self.sorted_keys]
+
+def approved_acronyms_query():
+    return db.session.query(*[getattr(Acronym, column) for column in ACRONYM_INDEX_COLUMNS]).filter(Acronym.approved_by > 0)
+
+# this worker's index, the tag versions it's current with and when it was last synced against the database
+_acronym_index = {'index': None, 'versions': None, 'synced_at': None}
+_acronym_index_lock = threading.Lock()
+
+def _database_now():
+    return db.session.query(func.now()).scalar()
+
+def sync_acronym_index(index, since):
+    """
+    Brings index up to date with the database: rows changed since the last sync are reloaded, and the set of approved ids catches rows that were deleted, unapproved or approved without a newer date_modified.
+    """
+    changed_since = since - ACRONYM_SYNC_MARGIN
+    changed = approved_acronyms_query().filter(func.coalesce(Acronym.date_modified, Acronym.date_added) >= changed_since).all()
+    for row in changed:
+        index.upsert(row)
+
+    approved_ids = {row[0] for row in db.session.query(Acronym.id).filter(Acronym.approved_by > 0)}
+    for acronym_id in set(index.entries) - approved_ids:
+        index.remove(acronym_id)
+    missing_ids = approved_ids - set(index.entries)
+    if missing_ids:
+        for row in approved_acronyms_query().filter(Acronym.id.in_(missing_ids)):
+            index.upsert(row)
+
+def get_acronym_index():
+    """
+    Returns this worker's acronym index, building it on first use and syncing it whenever another worker (or this one) has written to the acronym table since.
+    """
+    versions = get_tag_versions(ACRONYM_INDEX_TAGS)
+    with _acronym_index_lock:
+        if _acronym_index['index'] is None:
+            synced_at = _database_now()
+            _acronym_index['index'] = AcronymIndex(approved_acronyms_query())
+            _acronym_index['synced_at'] = synced_at
+        elif versions != _acronym_index['versions']:
+            synced_at = _database_now()
+            sync_acronym_index(_acronym_index['index'], _acronym_index['synced_at'])
+            _acronym_index['synced_at'] = synced_at
+        _acronym_index['versions'] = versions
+        return _acronym_index['index']
+
+def refresh_acronym(acronym_id):
+    """
+    Updates this worker's index for one acronym straight after a route changed it, so the change shows without a sync. Other workers pick it up from the tag version.
+    """
+    with _acronym_index_lock:
+        index = _acronym_index['index']
+        if index is None:
+            return
+        row = approved_acronyms_query().filter(Acronym.id == acronym_id).first()
+        if row is None:
+            index.remove(acronym_id)
+        else:
+            index.upsert(row)
+
+def acronym_dict(entry):
+    return {column: entry[column] for column in ACRONYM_INDEX_COLUMNS if column not in ('added_by', 'approved_by')}
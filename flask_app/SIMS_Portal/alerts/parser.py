@@ -0,0 +1,104 @@
+from collections import namedtuple
+
+# columns written to the alert table, in the order SurgeAlertRecord stores them
+SURGE_ALERT_COLUMNS = (
+	'molnix_id', 'alert_record_created_at', 'event', 'role_profile', 'rotation', 'modality',
+	'language_required', 'molnix_status', 'alert_status', 'opens', 'start', 'end_time', 'sectors',
+	'role_tags', 'scope', 'im_filter', 'iso3', 'country_name', 'disaster_type_id', 'disaster_type_name',
+	'disaster_go_id', 'ifrc_severity_level_display', 'alert_id', 'region_id'
+)
+
+# a plain tuple per alert, so rows can be handed straight to a bulk insert
+SurgeAlertRecord = namedtuple('SurgeAlertRecord', SURGE_ALERT_COLUMNS)
+
+# convert region name to ID compatible with GO
+REGION_IDS = {
+	"Europe Region": 4,
+	"Asia Pacific Region": 3,
+	"Americas Region": 2,
+	"Africa Region": 1,
+	"Middle East & North Africa Region": 5
+}
+
+def parse_surge_alert(result):
+	"""
+	Parses a single result from the GO surge_alert endpoint into a SurgeAlertRecord. The molnix_tags list is walked once; where several tags share a group, the last one wins for role, region, modality and scope, and the first one wins for language and rotation, matching what the cron jobs have always stored.
+	"""
+	sectors = []
+	roles = []
+	role_profile = None
+	region_name = None
+	modality = None
+	scope = None
+	language_required = None
+	rotation = None
+	found_language = False
+	found_rotation = False
+
+	for tag in result.get("molnix_tags") or ():
+		if not found_language and tag.get("tag_type") == "language":
+			language_required = tag.get("description")
+			found_language = True
+
+		for group in tag.get("groups") or ():
+			if group == "SECTOR":
+				sectors.append(tag.get("description"))
+			elif group == "ROLES":
+				role_profile = tag.get("description")
+				roles.append(role_profile)
+			elif group == "REGION":
+				region_name = tag.get("description")
+			elif group == "Modality":
+				modality = tag.get("name")
+			elif group == "ALERT TYPE":
+				scope = (tag.get("name") or '').title() or None
+			elif group == "rotation" and not found_rotation:
+				rotation = tag.get("name")
+				found_rotation = True
+
+	country = result.get("country") or {}
+	event = result.get("event") or {}
+	dtype = event.get("dtype") or {}
+
+	return SurgeAlertRecord(
+		result.get("molnix_id"),
+		result.get("created_at"),
+		event.get("name"),
+		role_profile,
+		rotation,
+		modality,
+		language_required,
+		result.get("molnix_status"),
+		result.get("status_display"),
+		result.get("opens"),
+		result.get("start"),
+		result.get("end"),
+		', '.join(sector for sector in sectors if sector),
+		', '.join(role for role in roles if role),
+		scope,
+		"Information Management" in sectors,
+		country.get("iso3"),
+		country.get("name"),
+		dtype.get("id"),
+		dtype.get("name"),
+		event.get("id"),
+		event.get("ifrc_severity_level_display"),
+		result.get("id"),
+		REGION_IDS.get(region_name)
+	)
+
+def parse_surge_alerts(results):
+	"""
+	Parses a page of GO surge_alert results into a list of SurgeAlertRecord rows.
+	"""
+	return [parse_surge_alert(result) for result in results]
+
+def parse_surge_alerts_columnar(results):
+	"""
+	Batch version of parse_surge_alerts() that returns the page as columns: a dict keyed by column name, each holding one list with a value per alert. Useful for set-based comparisons, e.g. `columns['alert_id']` is the list of IDs to look up in one query.
+	"""
+	records = parse_surge_alerts(results)
+	if not records:
+		return {column: [] for column in SURGE_ALERT_COLUMNS}
+
+	return {column: list(values) for column, values in zip(SURGE_ALERT_COLUMNS, zip(*records))}
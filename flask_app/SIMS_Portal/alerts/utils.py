@@ -1,12 +1,19 @@
 from SIMS_Portal import db
 from flask_sqlalchemy import SQLAlchemy
 from flask import current_app
-from SIMS_Portal.models import Alert, Log, RegionalFocalPoint, User
+from SIMS_Portal.models import Alert, AlertCrawlCursor, Log, RegionalFocalPoint, User
 from SIMS_Portal.users.utils import new_surge_alert, test_surge_alert
 from SIMS_Portal.main.utils import send_error_message
+from SIMS_Portal.alerts.parser import parse_surge_alerts
+from SIMS_Portal.jobs.utils import report_progress, JobCancelled
 from flask_apscheduler import APScheduler
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import math
 import requests
 import logging
@@ -112,408 +119,205 @@ def send_im_alert_to_slack(alert_info):
 	new_surge_alert(message)
 	# test_surge_alert(message)
 
+def upsert_surge_alerts(records):
+	"""
+	Writes a batch of SurgeAlertRecord rows (see alerts/parser.py) in a single transaction. Only the rows whose `alert_id` appears in the batch are read back to work out which alerts are new, which have a changed `alert_status`, and which are unchanged; everything is then applied with one `INSERT ... ON CONFLICT (alert_id) DO UPDATE` statement that relies on the unique index on `alert.alert_id`. Returns a dict with the inserted, updated and unchanged counts plus the list of newly inserted alert_ids.
+	"""
+	# the same alert can't be upserted twice in one statement, so keep the last copy of each alert_id
+	records_by_alert_id = {record.alert_id: record for record in records if record.alert_id is not None}
+	
+	counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'new_alert_ids': []}
+	if not records_by_alert_id:
+		return counts
+	
+	existing_statuses = dict(db.session.query(Alert.alert_id, Alert.alert_status).filter(Alert.alert_id.in_(list(records_by_alert_id))).all())
+	
+	rows_to_write = []
+	for alert_id, record in records_by_alert_id.items():
+		if alert_id not in existing_statuses:
+			counts['inserted'] += 1
+			counts['new_alert_ids'].append(alert_id)
+		elif existing_statuses[alert_id] != record.alert_status:
+			counts['updated'] += 1
+		else:
+			counts['unchanged'] += 1
+			continue
+		rows_to_write.append(record._asdict())
+	
+	if rows_to_write:
+		alert_table = Alert.__table__
+		insert_statement = postgresql.insert(alert_table).values(rows_to_write)
+		upsert_statement = insert_statement.on_conflict_do_update(
+			index_elements=[alert_table.c.alert_id],
+			set_={'alert_status': insert_statement.excluded.alert_status, 'updated_at': func.now()},
+			where=alert_table.c.alert_status.is_distinct_from(insert_statement.excluded.alert_status)
+		)
+		try:
+			db.session.execute(upsert_statement)
+			db.session.commit()
+		except Exception:
+			db.session.rollback()
+			raise
+	
+	return counts
+
 def refresh_surge_alerts_latest():
 	"""
 	Queries the GO API to get the latest surge alerts. This version of the function only looks at the latest page in the results. If this function is run daily, that should catch all alerts that come out. To run the same version of this function but loop through all pages, use the `refresh_surge_alerts()` function available in this same utility file.
+	
+	Returns the inserted, updated and unchanged counts (recorded as the job run's result). A failure is logged and sent to Slack, then re-raised so the job run is marked Failed and its heartbeat isn't sent.
 	"""
 	
+	counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'new_alert_ids': []}
+	
 	try:
 		log_message = f"[INFO] The Surge Alert (Latest) cron job has started."
 		new_log = Log(message=log_message, user_id=0)
 		db.session.add(new_log)
 		db.session.commit()
 		
-		existing_alerts = db.session.query(Alert).order_by(Alert.molnix_id.desc()).all()
-		existing_alert_ids = []
-		existing_statuses = []
-		for alert in existing_alerts:
-			existing_alert_ids.append(alert.alert_id)
-			alert_dict = {}
-			alert_dict['molnix_id'] = alert.alert_id
-			alert_dict['alert_status'] = alert.alert_status
-			existing_statuses.append(alert_dict)
-		
-		url = "https://goadmin.ifrc.org/api/v2/surge_alert/"
-		result_list = []
+		url = current_app.config['SURGE_ALERT_API_URL']
 		
 		response = requests.get(url)
+		response.raise_for_status()
 		data = response.json()
-		results = data.get("results", [])
-		
-		for result in results:
-			molnix_tags = result.get("molnix_tags", [])
-		
-			sectors = []
-			roles = []
-			
-			alert_id = result.get("id", None)
-			molnix_id = result.get("molnix_id", None)
-			alert_record_created_at = result.get("created_at", None)
-			molnix_status = result.get("molnix_status", None)
-			alert_status = result.get("status_display", None)
-			opens = result.get("opens", None)
-			start = result.get("start", None)
-			end = result.get("end", None)
-		
-			modality = None
-			im_filter = False
-		
-			for tag in molnix_tags:
-				groups = tag.get("groups", [])
-				
-				if "REGION" in groups:
-					region_id = tag.get("description", None)
-				
-				if "SECTOR" in groups:
-					sector = tag.get("description", None)
-					sectors.append(sector)
+		alert_records = parse_surge_alerts(data.get("results", []))
 		
-				if "ROLES" in groups:
-					role_profile = tag.get("description", None)
-					roles.append(role_profile)
+		counts = upsert_surge_alerts(alert_records)
 		
-				if "Modality" in groups:
-					modality = tag.get("name", None)
-				
-				if "ALERT TYPE" in groups:
-					scope = tag.get("name", None).title()
-		
-			im_filter = "Information Management" in sectors
-		
-			language_required = next((tag.get("description", None) for tag in molnix_tags if tag.get("tag_type") == "language"), None)
-			rotation = next((group.get("name", None) for group in molnix_tags if "rotation" in group.get("groups", [])), None)
-		
-			country = result.get("country", {})
-			iso3 = country.get("iso3", None)
-			country_name = country.get("name", None)
-			
-			# convert region name to ID compatible with GO
-			region_ids_dict = {
-				"Europe Region": 4,
-				"Asia Pacific Region": 3,
-				"Americas Region": 2, 
-				"Africa Region": 1, 
-				"Middle East & North Africa Region": 5
-			}
-			
-			event = result.get("event", {})
-			disaster_type_id = event.get("dtype", {}).get("id", None)
-			disaster_type_name = event.get("dtype", {}).get("name", None)
-			ifrc_severity_level_display = event.get("ifrc_severity_level_display", None)
-			event_name = event.get("name", None)
-			disaster_go_id = event.get("id", None)
-		
-			result_dict = {
-				"molnix_id": molnix_id,
-				"alert_record_created_at": alert_record_created_at,
-				"event": event_name,
-				"role_profile": role_profile,
-				"rotation": rotation,
-				"modality": modality,
-				"language_required": language_required,
-				"molnix_status": molnix_status,
-				"alert_status": alert_status,
-				"opens": opens,
-				"start": start,
-				"end_time": end,
-				"sectors": sectors,
-				"role_tags": roles,
-				"scope": scope,
-				"im_filter": im_filter,
-				"iso3": iso3,
-				"country_name": country_name,
-				"disaster_type_id": disaster_type_id,
-				"disaster_type_name": disaster_type_name,
-				"disaster_go_id": disaster_go_id,
-				"ifrc_severity_level_display": ifrc_severity_level_display,
-				"alert_id": alert_id, 
-				"region_id": region_ids_dict.get(region_id, None),
-			}
-		
-			result_list.append(result_dict)
-		
-		count_new_records = 0
-		count_updated_records = 0
-		
-		for result in result_list:
-			
-			# these fields can have multiple values, so strip curly brackets and save as comma-separated strings
-			result['sectors'] = ', '.join(result['sectors'])
-			result['role_tags'] = ', '.join(result['role_tags'])
-			
-			existing_alert = next((alert for alert in existing_alerts if alert.alert_id == result['alert_id']), None)
-			
-			if existing_alert:
-				# check if alert_status has changed
-				if existing_alert.alert_status != result['alert_status']:
-					try:
-						# update the existing alert in the database
-						existing_alert.alert_status = result['alert_status']
-						db.session.commit()
-						count_updated_records += 1
-					except Exception as e:
-						log_message = f"[ERROR] Failed to update alert_status for alert_id {result['alert_id']}: {e}"
-						new_log = Log(message=log_message, user_id=0)
-						db.session.add(new_log)
-						db.session.commit()
-			
-			else:
-				# this is a new alert; add it to the database
-				if result['alert_id'] not in existing_alert_ids:
-					try:
-						individual_alert = Alert(
-							molnix_id = result['molnix_id'],
-							alert_record_created_at = result['alert_record_created_at'],
-							event = result['event'],
-							role_profile = result['role_profile'],
-							rotation = result['rotation'],
-							modality = result['modality'],
-							language_required = result['language_required'],
-							molnix_status = result['molnix_status'],
-							alert_status = result['alert_status'],
-							opens = result['opens'],
-							start = result['start'],
-							end_time = result['end_time'],
-							sectors = result['sectors'],
-							role_tags = result['role_tags'],
-							scope = result['scope'],
-							im_filter = result['im_filter'],
-							iso3 = result['iso3'],
-							country_name = result['country_name'],
-							disaster_type_id = result['disaster_type_id'],
-							disaster_type_name = result['disaster_type_name'],
-							disaster_go_id = result['disaster_go_id'],
-							ifrc_severity_level_display = result['ifrc_severity_level_display'],
-							alert_id = result['alert_id'], 
-							region_id = result['region_id']
-						)
-					except Exception as e:
-						log_message = f"[WARNING] The refresh_surge_alerts_latest function couldn't parse one of the alerts it found in the Surge Alert cron job as it tried to instantiate a new Alert object: {e}"
-						new_log = Log(message=log_message, user_id=0)
-						db.session.add(new_log)
-						db.session.commit()
-					
-					try:
-						db.session.add(individual_alert)
-						db.session.commit()
-						count_new_records += 1
-						
-						# send IM alerts to availability channel in slack
-						if individual_alert.im_filter == True:
-							send_im_alert_to_slack(individual_alert)
-						
-					except Exception as e:
-						log_message = f"[ERROR] The refresh_surge_alerts_latest function couldn't add one of the alerts (id={individual_alert.id}) to the database: {e}"
-						new_log = Log(message=log_message, user_id=0)
-						db.session.add(new_log)
-						db.session.commit()
+		# send IM alerts to availability channel in slack, re-read so dates come back as datetimes
+		if counts['new_alert_ids']:
+			new_im_alerts = db.session.query(Alert).filter(Alert.alert_id.in_(counts['new_alert_ids']), Alert.im_filter == True).all()
+			for individual_alert in new_im_alerts:
+				try:
+					send_im_alert_to_slack(individual_alert)
+				except Exception as e:
+					log_message = f"[ERROR] The refresh_surge_alerts_latest function couldn't send the Slack message for alert_id {individual_alert.alert_id}: {e}"
+					new_log = Log(message=log_message, user_id=0)
+					db.session.add(new_log)
+					db.session.commit()
 			
 	except Exception as e:
+		db.session.rollback()
 		log_message = f"[ERROR] The Surge Alert cron job has failed: {e}."
 		new_log = Log(message=log_message, user_id=0)
 		db.session.add(new_log)
 		db.session.commit()
 		send_error_message(log_message)
+		raise
 	
-	log_message = f"[INFO] The Surge Alert cron job has finished and logged {count_new_records} new records."
+	log_message = f"[INFO] The Surge Alert cron job has finished and logged {counts['inserted']} new records, {counts['updated']} updated records and {counts['unchanged']} unchanged records."
 	new_log = Log(message=log_message, user_id=0)
 	db.session.add(new_log)
 	db.session.commit()	
+	
+	return {'inserted': counts['inserted'], 'updated': counts['updated'], 'unchanged': counts['unchanged']}
+
+
+def build_surge_alert_session(max_workers):
+	"""
+	Returns a `requests.Session` whose connection pool is sized for the crawler's worker threads, with retries and backoff on transient GO API errors.
+	"""
+	retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+	adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retries)
+	
+	session = requests.Session()
+	session.mount('http://', adapter)
+	session.mount('https://', adapter)
+	
+	return session
 
+def fetch_surge_alert_page(session, url, page_number, page_size):
+	"""
+	Fetches and parses a single page (1-indexed) of the GO surge_alert endpoint using limit/offset pagination. Returns the page number, the parsed results and whether the API reported a following page.
+	"""
+	params = {'limit': page_size, 'offset': (page_number - 1) * page_size}
+	response = session.get(url, params=params, timeout=30)
+	response.raise_for_status()
+	data = response.json()
+	
+	return page_number, parse_surge_alerts(data.get("results", [])), data.get("next") is not None
 
-def refresh_surge_alerts(pages_to_fetch):
+def refresh_surge_alerts(pages_to_fetch=None, resume=True):
 	"""
-	Queries the GO API to get all surge alerts. Unlike the refresh_surge_alerts_latest version which only looks at the most recent page, this one loops through more pages and is thus not suitable or necessary to run frequently. To specify how many pages, use the pages_to_fetch argument with the function. This version also doesn't send alerts to Slack to avoid bombarding that channel with all historical matches. 
+	Queries the GO API to get all surge alerts. Unlike the refresh_surge_alerts_latest version which only looks at the most recent page, this one loops through more pages and is thus not suitable or necessary to run frequently. To specify how many pages, use the pages_to_fetch argument with the function (defaults to the SURGE_ALERT_BACKFILL_PAGES config value). This version also doesn't send alerts to Slack to avoid bombarding that channel with all historical matches. 
+	
+	Pages are fetched concurrently in chunks of SURGE_ALERT_CRAWL_WORKERS through one pooled session, and each chunk is written to the database as soon as it arrives. After every chunk the page cursor in `alert_crawl_cursor` is advanced, so if a page fails the next run with `resume=True` picks up from the first page that wasn't saved.
 	"""
 	
+	url = current_app.config['SURGE_ALERT_API_URL']
+	max_workers = current_app.config['SURGE_ALERT_CRAWL_WORKERS']
+	page_size = current_app.config['SURGE_ALERT_PAGE_SIZE']
+	if pages_to_fetch is None:
+		pages_to_fetch = current_app.config['SURGE_ALERT_BACKFILL_PAGES']
+	
+	totals = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+	
 	try:
-		log_message = f"[INFO] The Surge Alert (full version) function has started."
-		new_log = Log(message=log_message, user_id=0)
-		db.session.add(new_log)
-		db.session.commit()
+		cursor = db.session.query(AlertCrawlCursor).filter(AlertCrawlCursor.name == 'surge_alert').first()
+		if cursor is None:
+			cursor = AlertCrawlCursor(name='surge_alert')
+			db.session.add(cursor)
 		
-		existing_alerts = db.session.query(Alert).order_by(Alert.molnix_id.desc()).all()
-		existing_alert_ids = []
-		existing_statuses = []
-		for alert in existing_alerts:
-			existing_alert_ids.append(alert.alert_id)
-			alert_dict = {}
-			alert_dict['molnix_id'] = alert.alert_id
-			alert_dict['alert_status'] = alert.alert_status
-			existing_statuses.append(alert_dict)
+		# a cursor left behind by an interrupted run only counts if it was paging the same way
+		if resume and cursor.completed_at is None and cursor.next_page and cursor.page_size == page_size:
+			start_page = cursor.next_page
+		else:
+			start_page = 1
 		
-		url = "https://goadmin.ifrc.org/api/v2/surge_alert/"
-		result_list = []
+		cursor.next_page = start_page
+		cursor.page_size = page_size
+		cursor.pages_to_fetch = pages_to_fetch
+		cursor.completed_at = None
+		db.session.commit()
 		
-		current_page = 1
+		log_message = f"[INFO] The Surge Alert (full version) function has started at page {start_page} of {pages_to_fetch}."
+		new_log = Log(message=log_message, user_id=0)
+		db.session.add(new_log)
+		db.session.commit()
 		
-		while url and current_page <= pages_to_fetch:
-			response = requests.get(url)
-			data = response.json()
-			results = data.get("results", [])
+		more_pages = True
+		chunk_start = start_page
 		
-			for result in results:
-				molnix_tags = result.get("molnix_tags", [])
-			
-				sectors = []
-				roles = []
+		with build_surge_alert_session(max_workers) as http_session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+			while more_pages and chunk_start <= pages_to_fetch:
+				chunk_end = min(chunk_start + max_workers - 1, pages_to_fetch)
+				futures = [executor.submit(fetch_surge_alert_page, http_session, url, page_number, page_size) for page_number in range(chunk_start, chunk_end + 1)]
 				
-				alert_id = result.get("id", None)
-				molnix_id = result.get("molnix_id", None)
-				alert_record_created_at = result.get("created_at", None)
-				molnix_status = result.get("molnix_status", None)
-				alert_status = result.get("status_display", None)
-				opens = result.get("opens", None)
-				start = result.get("start", None)
-				end = result.get("end", None)
-			
-				modality = None
-				im_filter = False
-			
-				for tag in molnix_tags:
-					groups = tag.get("groups", [])
-			
-					if "SECTOR" in groups:
-						sector = tag.get("description", None)
-						sectors.append(sector)
-			
-					if "ROLES" in groups:
-						role_profile = tag.get("description", None)
-						roles.append(role_profile)
-			
-					if "Modality" in groups:
-						modality = tag.get("name", None)
-					
-					if "ALERT TYPE" in groups:
-						scope = tag.get("name", None).title()
-			
-				im_filter = "Information Management" in sectors
-			
-				language_required = next((tag.get("description", None) for tag in molnix_tags if tag.get("tag_type") == "language"), None)
-				rotation = next((group.get("name", None) for group in molnix_tags if "rotation" in group.get("groups", [])), None)
-			
-				country = result.get("country", {})
-				iso3 = country.get("iso3", None)
-				country_name = country.get("name", None)
-			
-				event = result.get("event", {})
-				disaster_type_id = event.get("dtype", {}).get("id", None)
-				disaster_type_name = event.get("dtype", {}).get("name", None)
-				ifrc_severity_level_display = event.get("ifrc_severity_level_display", None)
-				event_name = event.get("name", None)
-				disaster_go_id = event.get("id", None)
-			
-				result_dict = {
-					"molnix_id": molnix_id,
-					"alert_record_created_at": alert_record_created_at,
-					"event": event_name,
-					"role_profile": role_profile,
-					"rotation": rotation,
-					"modality": modality,
-					"language_required": language_required,
-					"molnix_status": molnix_status,
-					"alert_status": alert_status,
-					"opens": opens,
-					"start": start,
-					"end_time": end,
-					"sectors": sectors,
-					"role_tags": roles,
-					"scope": scope,
-					"im_filter": im_filter,
-					"iso3": iso3,
-					"country_name": country_name,
-					"disaster_type_id": disaster_type_id,
-					"disaster_type_name": disaster_type_name,
-					"disaster_go_id": disaster_go_id,
-					"ifrc_severity_level_display": ifrc_severity_level_display,
-					"alert_id": alert_id
-				}
-			
-				result_list.append(result_dict)
-			
-			# flip page for pagination
-			url = data.get("next")
-			current_page += 1
+				# wait for the whole chunk so the cursor only ever moves past pages that were saved
+				chunk_results = []
+				for future in futures:
+					page_number, page_results, has_next = future.result()
+					chunk_results.extend(page_results)
+					if not has_next:
+						more_pages = False
+				
+				counts = upsert_surge_alerts(chunk_results)
+				for key in totals:
+					totals[key] += counts[key]
+				
+				chunk_start = chunk_end + 1
+				cursor.next_page = chunk_start
+				db.session.commit()
+				report_progress(chunk_end - start_page + 1, pages_to_fetch - start_page + 1, 'Page {} of {}'.format(chunk_end, pages_to_fetch))
 		
-		count_new_records = 0
-		count_updated_records = 0
+		cursor.completed_at = datetime.utcnow()
+		db.session.commit()
 		
-		for result in result_list:
-			
-			# these fields can have multiple values, so strip curly brackets and save as comma-separated strings
-			result['sectors'] = ', '.join(result['sectors'])
-			result['role_tags'] = ', '.join(result['role_tags'])
-			
-			existing_alert = next((alert for alert in existing_alerts if alert.alert_id == result['alert_id']), None)
-			
-			if existing_alert:
-				# check if alert_status has changed
-				if existing_alert.alert_status != result['alert_status']:
-					try:
-						# update the existing alert in the database
-						existing_alert.alert_status = result['alert_status']
-						db.session.commit()
-						count_updated_records += 1
-					except Exception as e:
-						log_message = f"[ERROR] Failed to update alert_status for alert_id {result['alert_id']}: {e}"
-						new_log = Log(message=log_message, user_id=0)
-						db.session.add(new_log)
-						db.session.commit()
-			
-			else:
-				# this is a new alert; add it to the database
-				if result['alert_id'] not in existing_alert_ids:
-					try:
-						individual_alert = Alert(
-							molnix_id = result['molnix_id'],
-							alert_record_created_at = result['alert_record_created_at'],
-							event = result['event'],
-							role_profile = result['role_profile'],
-							rotation = result['rotation'],
-							modality = result['modality'],
-							language_required = result['language_required'],
-							molnix_status = result['molnix_status'],
-							alert_status = result['alert_status'],
-							opens = result['opens'],
-							start = result['start'],
-							end_time = result['end_time'],
-							sectors = result['sectors'],
-							role_tags = result['role_tags'],
-							scope = result['scope'],
-							im_filter = result['im_filter'],
-							iso3 = result['iso3'],
-							country_name = result['country_name'],
-							disaster_type_id = result['disaster_type_id'],
-							disaster_type_name = result['disaster_type_name'],
-							disaster_go_id = result['disaster_go_id'],
-							ifrc_severity_level_display = result['ifrc_severity_level_display'],
-							alert_id = result['alert_id']
-						)
-					except Exception as e:
-						log_message = f"[WARNING] The refresh_surge_alerts (full version) function couldn't parse one of the alerts it found in the Surge Alert cron job as it tried to instantiate a new Alert object: {e}"
-						new_log = Log(message=log_message, user_id=0)
-						db.session.add(new_log)
-						db.session.commit()
-					
-					try:
-						db.session.add(individual_alert)
-						db.session.commit()
-						count_new_records += 1
-						
-					except Exception as e:
-						log_message = f"[ERROR] The refresh_surge_alerts (full version) function couldn't add one of the alerts (id={individual_alert.id}) to the database: {e}"
-						new_log = Log(message=log_message, user_id=0)
-						db.session.add(new_log)
-						db.session.commit()
-			
+	except JobCancelled:
+		# the cursor already points past the last saved chunk, so the next run resumes from there
+		raise
 	except Exception as e:
-		log_message = f"[ERROR] The Surge Alert (full version) cron job has failed: {e}."
+		db.session.rollback()
+		log_message = f"[ERROR] The Surge Alert (full version) cron job has failed: {e}. Rerun it to resume from the saved page cursor."
 		new_log = Log(message=log_message, user_id=0)
 		db.session.add(new_log)
 		db.session.commit()
 		send_error_message(log_message)
 	
-	log_message = f"[INFO] The Surge Alert (full version) cron job has finished and logged {count_new_records} new records."
+	log_message = f"[INFO] The Surge Alert (full version) cron job has finished and logged {totals['inserted']} new records, {totals['updated']} updated records and {totals['unchanged']} unchanged records."
 	new_log = Log(message=log_message, user_id=0)
 	db.session.add(new_log)
-	db.session.commit()	
\ No newline at end of file
+	db.session.commit()
+	
+	return totals
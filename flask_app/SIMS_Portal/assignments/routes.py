@@ -16,6 +16,7 @@ from SIMS_Portal.assignments.utils import get_dates_current_and_next_week
 from SIMS_Portal.main.utils import check_sims_co, send_error_message
 from SIMS_Portal.models import Assignment, User, Emergency, Portfolio, Log
 from SIMS_Portal.users.utils import send_slack_dm
+from SIMS_Portal.images.utils import flash_image_upload_status
 from SIMS_Portal import db, login_manager
 from SIMS_Portal.assignments.forms import (
 	NewAssignmentForm, UpdateAssignmentForm
@@ -108,6 +109,11 @@ def view_assignment(id):
 	assignment_portfolio = db.session.query(Portfolio).filter(Portfolio.assignment_id==id, Portfolio.product_status != 'Removed').all()
 	count_assignment_portfolio = len(assignment_portfolio)
 	
+	# products uploaded from this page come back here, so this is where a cover image that failed to process gets reported
+	for product in assignment_portfolio:
+		if product.creator_id == current_user.id:
+			flash_image_upload_status('cover', product.id)
+	
 	# get availability if reported and convert to list, else return empty list
 	if assignment_info.Assignment.availability:
 		assignment_availability = assignment_info.Assignment.availability
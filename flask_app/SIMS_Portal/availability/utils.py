@@ -1,19 +1,15 @@
 from flask import current_app
 from SIMS_Portal.models import Emergency
 from SIMS_Portal import db
+from SIMS_Portal.notifications.utils import enqueue_slack_message
 from datetime import datetime, timedelta
-from slack_sdk import WebClient
 
 def send_slack_availability_request(disaster_id, slack_channel):
-    client = WebClient(token = current_app.config['SIMS_PORTAL_SLACK_BOT'])
     link = current_app.config['ROOT_URL'] + '/availability/report/' + str(disaster_id)
-    try:
-        result = client.chat_postMessage(
-            channel = slack_channel,
-            text = 'Hello, <!channel>! In order to help the SIMS Remote Coordinator ensure sufficient coverage for this operation, it is requested that you submit your availability for support. The reporting process involves simply checking off the days when you are volunteering to be ready to work on tasks that match your skill set. <{}|Click this link to report.>'.format(link)
-        )
-    except Exception as e:
-        current_app.logger.error('send_slack_availability_request failed: {}'.format(e))
+    enqueue_slack_message(
+        slack_channel,
+        'Hello, <!channel>! In order to help the SIMS Remote Coordinator ensure sufficient coverage for this operation, it is requested that you submit your availability for support. The reporting process involves simply checking off the days when you are volunteering to be ready to work on tasks that match your skill set. <{}|Click this link to report.>'.format(link)
+    )
 
 def get_dates_current_and_next_week():
     today = datetime.now().date()
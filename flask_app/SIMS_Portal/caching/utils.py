@@ -0,0 +1,153 @@
+import functools
+import logging
+import uuid
+
+from flask import current_app
+from sqlalchemy import event
+from SIMS_Portal import db, cache
+
+logger = logging.getLogger(__name__)
+
+# cached entries are stored as (tag versions, value); an entry is only a hit while every tag still has the version it was stored with
+TAG_VERSION_PREFIX = 'tag-version/'
+
+def _tag_version_keys(tags):
+	return [TAG_VERSION_PREFIX + tag for tag in tags]
+
+def _current_tag_versions(tags):
+	"""
+	Returns the current version of each tag, creating versions for tags that haven't been seen yet.
+	"""
+	tags = list(tags)
+	if not tags:
+		return {}
+	versions = dict(zip(tags, cache.get_many(*_tag_version_keys(tags))))
+	missing = {tag: uuid.uuid4().hex for tag, version in versions.items() if version is None}
+	if missing:
+		cache.set_many({TAG_VERSION_PREFIX + tag: version for tag, version in missing.items()}, timeout=0)
+		versions.update(missing)
+	return versions
+
+def get_tag_versions(tags):
+	"""
+	Returns the current version of each tag (after expanding row tags), for callers that keep their own in-process copy and only need to know whether it's still current.
+	"""
+	return _current_tag_versions(_expand_tags(tags))
+
+def get_tagged(key):
+	"""
+	Returns the cached value for key, or None if it's missing or any of its tags has been invalidated since it was stored.
+	"""
+	entry = cache.get(key)
+	if entry is None:
+		return None
+	stored_versions, value = entry
+	if not stored_versions:
+		return value
+	current_versions = cache.get_many(*_tag_version_keys(stored_versions))
+	if list(stored_versions.values()) != current_versions:
+		return None
+	return value
+
+def _expand_tags(tags):
+	# a row tag like 'emergency:12' also carries 'emergency:*', which bulk updates on the table invalidate
+	expanded = []
+	for tag in tags:
+		expanded.append(tag)
+		table, _, row_id = tag.partition(':')
+		if row_id and row_id != '*':
+			expanded.append(table + ':*')
+	return list(dict.fromkeys(expanded))
+
+def set_tagged(key, value, tags=(), timeout=None, versions=None):
+	"""
+	Caches value under key. Pass the versions get_tag_versions(tags) returned before the value was computed, so that a write committed while it was being computed leaves the entry already stale instead of caching it as current.
+	"""
+	if versions is None:
+		versions = _current_tag_versions(_expand_tags(tags))
+	cache.set(key, (versions, value), timeout=timeout)
+
+def get_or_build(key, builder, tags=(), timeout=None):
+	"""
+	Returns the cached value for key, calling builder() and caching its result under the given tags on a miss.
+	"""
+	value = get_tagged(key)
+	if value is None:
+		# read before building: a tag bumped while builder() runs then no longer matches what the entry is stored with
+		versions = get_tag_versions(tags)
+		value = builder()
+		set_tagged(key, value, timeout=timeout, versions=versions)
+	return value
+
+def cached_with_tags(key_prefix, tags, timeout=None):
+	"""
+	Decorator version of get_or_build(). tags is either a list of tags or a function that takes the wrapped function's arguments and returns one, e.g. lambda id: ['emergency:{}'.format(id)].
+	"""
+	def decorator(f):
+		@functools.wraps(f)
+		def wrapper(*args, **kwargs):
+			key = key_prefix
+			if args or kwargs:
+				key = '{}/{}'.format(key_prefix, '/'.join([str(arg) for arg in args] + ['{}={}'.format(k, kwargs[k]) for k in sorted(kwargs)]))
+			entry_tags = tags(*args, **kwargs) if callable(tags) else tags
+			return get_or_build(key, lambda: f(*args, **kwargs), tags=entry_tags, timeout=timeout)
+		return wrapper
+	return decorator
+
+def invalidate_tags(*tags):
+	"""
+	Invalidates every cached entry carrying any of these tags, in every worker. Giving a tag a new version is enough: entries stored under the old version stop matching and are treated as misses.
+	"""
+	tags = [tag for tag in tags if tag]
+	if not tags:
+		return
+	try:
+		cache.set_many({TAG_VERSION_PREFIX + tag: uuid.uuid4().hex for tag in tags}, timeout=0)
+	except Exception as e:
+		current_app.logger.error('Could not invalidate cache tags {}: {}'.format(', '.join(tags), e))
+
+def tags_for_instance(instance):
+	"""
+	Every model write invalidates the table-wide tag (e.g. 'emergency') and the row tag (e.g. 'emergency:12'). Entries cached under a row tag are left alone by writes to other rows.
+	"""
+	table = getattr(instance, '__tablename__', None)
+	if table is None:
+		return []
+	tags = [table]
+	if getattr(instance, 'id', None) is not None:
+		tags.append('{}:{}'.format(table, instance.id))
+	return tags
+
+def add_pending_tags(session, *tags):
+	"""
+	Queues extra tags to be invalidated when the session's current transaction commits, for listeners that know about finer-grained changes than a whole row. Writes made with raw SQL (text() or db.engine.execute) never reach the listeners below, so they have to queue their tags with this themselves.
+	"""
+	session.info.setdefault('cache_tags', set()).update(tags)
+
+def _collect_flush_tags(session, flush_context):
+	for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+		add_pending_tags(session, *tags_for_instance(instance))
+
+def _collect_bulk_write_tags(orm_execute_state):
+	# query(...).update() and Core inserts (e.g. the surge alert upsert) never reach the flush, so the affected rows aren't known
+	if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+		table = getattr(orm_execute_state.statement, 'table', None)
+		if getattr(table, 'name', None):
+			add_pending_tags(orm_execute_state.session, table.name, table.name + ':*')
+
+def _invalidate_after_commit(session):
+	tags = session.info.pop('cache_tags', None)
+	if tags:
+		invalidate_tags(*tags)
+
+def _discard_after_rollback(session):
+	session.info.pop('cache_tags', None)
+
+def register_cache_invalidation():
+	"""
+	Hooks model writes into the cache: whatever a transaction touched is invalidated once it commits, and forgotten if it rolls back.
+	"""
+	event.listen(db.session, 'after_flush', _collect_flush_tags)
+	event.listen(db.session, 'do_orm_execute', _collect_bulk_write_tags)
+	event.listen(db.session, 'after_commit', _invalidate_after_commit)
+	event.listen(db.session, 'after_rollback', _discard_after_rollback)
@@ -17,12 +17,42 @@ class Config:
 	DATA_FOLDER = os.environ.get('DATA_FOLDER', '/SIMS_Portal/static/data/')
 	SLACK_BOT_TOKEN_NEW_USER = os.environ.get('SLACK_BOT_TOKEN_NEW_USER')
 	SIMS_PORTAL_SLACK_BOT = os.environ.get('SIMS_PORTAL_SLACK_BOT')
+	SLACK_API_URL = os.environ.get('SLACK_API_URL', 'https://slack.com/api/')
+	# the queued slack messages are sent by a dispatcher thread in worker.py only
+	SLACK_QUEUE_DISPATCHER = True
+	SLACK_QUEUE_BATCH_SIZE = 20
+	SLACK_QUEUE_MAX_ATTEMPTS = 5
+	SLACK_QUEUE_BACKOFF_SECONDS = 30
+	SLACK_QUEUE_POLL_SECONDS = 10
+	SLACK_QUEUE_TIMEOUT = 10
+	SLACK_QUEUE_LEASE_SECONDS = 300
+	QUERY_PROFILER = os.environ.get('QUERY_PROFILER', 'false').lower() == 'true'
+	QUERY_PROFILER_SLOW_MS = 500
+	QUERY_PROFILER_MAX_STATEMENTS = 30
+	QUERY_PROFILER_TOP_N = 5
 	ROOT_URL = 'http://rcrcsims.org'
 	DROPBOX_BOT = os.environ.get('DROPBOX_BOT')
 	DROPBOX_APP_KEY = os.environ.get('DROPBOX_APP_KEY')
 	DROPBOX_APP_SECRET = os.environ.get('DROPBOX_APP_SECRET')
 	DROPBOX_REFRESH_TOKEN = os.environ.get('DROPBOX_REFRESH_TOKEN')
+	# portfolio files are queued for Dropbox on upload and copied by worker.py every DROPBOX_MIRROR_POLL_SECONDS, streamed from S3 in chunks of DROPBOX_CHUNK_BYTES; a claimed copy is retried once its lease runs out, failed ones with exponential backoff
+	DROPBOX_CHUNK_BYTES = 8 * 1024 * 1024
+	DROPBOX_MIRROR_POLL_SECONDS = 30
+	DROPBOX_MIRROR_BATCH_SIZE = 5
+	DROPBOX_MIRROR_MAX_ATTEMPTS = 5
+	DROPBOX_MIRROR_BACKOFF_SECONDS = 60
+	DROPBOX_MIRROR_LEASE_SECONDS = 1800
 	SCHEDULER_TIMEZONE = "America/New_York"
+	JOB_HEARTBEAT_POLL_SECONDS = 60
+	JOB_EXECUTOR_WORKERS = 2
+	# every process touches job_run.alive_at on its queued and running runs this often; worker.py fails active runs not touched for JOB_STALE_SECONDS (a recycled or killed worker), checking every JOB_REAPER_POLL_SECONDS
+	JOB_ALIVE_SECONDS = 30
+	JOB_STALE_SECONDS = 300
+	JOB_REAPER_POLL_SECONDS = 60
+	SURGE_ALERT_API_URL = os.environ.get('SURGE_ALERT_API_URL', 'https://goadmin.ifrc.org/api/v2/surge_alert/')
+	SURGE_ALERT_PAGE_SIZE = 50
+	SURGE_ALERT_CRAWL_WORKERS = 4
+	SURGE_ALERT_BACKFILL_PAGES = 100
 	LANGUAGES = ['en', 'es']
 	UPLOAD_EXTENSIONS = ['.jpg', '.png', '.gif', '.jpeg', '.shp', '.py', '.doc', '.docx', '.xls', '.csv', '.dif', '.pdf', '.ppt', '.pptx', '.potx', '.zip', '.txt', '.ai', '.indd']
 	PORTFOLIO_TYPES = ['Map', 'Infographic', 'Dashboard', 'Mobile Data Collection', 'Assessment', 'Internal Analysis', 'External Report', 'Code Snippet', 'Other']
@@ -31,7 +61,44 @@ class Config:
 	GOOGLE_MAPS_TOKEN = os.environ.get('GOOGLE_MAPS_TOKEN')
 	WERKZEUG_DEBUG_PIN = '443-431-665'
 	UPLOAD_BUCKET = 'sims-portal-uploads'
-	CACHE_TYPE = 'simple'
+	# point boto3 at a local S3 stand-in (e.g. moto_server) instead of AWS
+	S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+	# /uploads streams objects in chunks of this size, and redirects to a presigned S3 URL for objects this large or larger (0 to always stream)
+	UPLOAD_STREAM_CHUNK_BYTES = 64 * 1024
+	UPLOAD_PRESIGNED_REDIRECT_BYTES = int(os.environ.get('UPLOAD_PRESIGNED_REDIRECT_BYTES', 25 * 1000 * 1000))
+	UPLOAD_PRESIGNED_URL_SECONDS = 300
+	# portfolio files are uploaded by the browser straight to UPLOAD_BUCKET in parts of this size; the bucket's CORS rules must allow PUT from the portal and expose the ETag header
+	PORTFOLIO_UPLOAD_PART_BYTES = 8 * 1024 * 1024
+	PORTFOLIO_UPLOAD_MAX_BYTES = 75 * 1000 * 1000
+	PORTFOLIO_UPLOAD_URL_SECONDS = 3600
+	PORTFOLIO_UPLOAD_TOKEN_SECONDS = 24 * 3600
+	SLACK_AVATAR_SYNC_WORKERS = 8
+	SLACK_AVATAR_SYNC_BATCH_SIZE = 50
+	# threads per web worker that resize and upload avatars and cover images after the form POST returns
+	IMAGE_EXECUTOR_WORKERS = 2
+	# how long the outcome of a queued image upload is kept for the member to see, and how long one can stay queued before it's taken as lost
+	IMAGE_UPLOAD_STATUS_SECONDS = 24 * 3600
+	IMAGE_UPLOAD_STALE_SECONDS = 600
+	# /search and /api/search, see search/utils.py
+	SEARCH_RESULTS_PER_PAGE = 20
+	SEARCH_MAX_PER_PAGE = 100
+	SEARCH_AUTOCOMPLETE_LIMIT = 8
+	SEARCH_REBUILD_BATCH_SIZE = 500
+	# the acronym pages and typeahead read from each worker's in-memory index, see acronym/utils.py
+	ACRONYMS_PER_PAGE = 100
+	ACRONYMS_COMPACT_PER_PAGE = 250
+	ACRONYM_TYPEAHEAD_LIMIT = 10
+	ACRONYM_TYPEAHEAD_MAX_LIMIT = 50
+	# options per page for member, emergency and country pickers, see main/fields.py
+	TYPEAHEAD_PER_PAGE = 20
+	# FileSystemCache is only shared by the gunicorn workers on one host. worker.py runs in its own container or dyno and invalidates entries the web workers read, so it refuses to start unless CACHE_TYPE is one of SHARED_CACHE_TYPES: docker-compose.yml runs a redis service, and Procfile deployments need a Redis add-on with CACHE_TYPE=RedisCache and CACHE_REDIS_URL set on both processes
+	CACHE_TYPE = os.environ.get('CACHE_TYPE', 'FileSystemCache')
+	CACHE_DIR = os.environ.get('CACHE_DIR', '/tmp/sims-portal-cache')
+	CACHE_THRESHOLD = 5000
+	CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+	SHARED_CACHE_TYPES = ('RedisCache', 'RedisSentinelCache', 'RedisClusterCache')
+	DASHBOARD_SNAPSHOT_SECONDS = 300
+	API_EMERGENCIES_CACHE_SECONDS = 600
 	STATIC_FOLDER = 'static'
 	RECAPTCHA_PUBLIC_KEY = os.environ.get('RECAPTCHA_PUBLIC_KEY')
 	RECAPTCHA_PRIVATE_KEY = os.environ.get('RECAPTCHA_PRIVATE_KEY')
\ No newline at end of file
@@ -4,12 +4,13 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import asc
 from flask_wtf.file import FileField, FileAllowed
 from wtforms_sqlalchemy.fields import QuerySelectField
+from SIMS_Portal.main.fields import RemoteSelectField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
 from SIMS_Portal.models import User, Emergency, NationalSociety, EmergencyType
 
 class NewEmergencyForm(FlaskForm):
 	emergency_name = StringField('Emergency Name', validators=[DataRequired(), Length(min=5, max=100)])
-	emergency_location_id = QuerySelectField('Affected Country (Primary)', query_factory=lambda:NationalSociety.query.all(), get_label='country_name', allow_blank=True, validators=[DataRequired()])
+	emergency_location_id = RemoteSelectField('Affected Country (Primary)', source='national_societies', allow_blank=True, validators=[DataRequired()])
 	emergency_type_id = QuerySelectField('Emergency Type', query_factory=lambda:EmergencyType.query.order_by(asc(EmergencyType.emergency_type_name)).all(), get_label='emergency_type_name', allow_blank=True, validators=[DataRequired()])
 	emergency_glide = StringField('GLIDE Number')
 	emergency_go_id = IntegerField('GO ID Number')
@@ -21,7 +22,7 @@ class NewEmergencyForm(FlaskForm):
 	
 class UpdateEmergencyForm(FlaskForm):
 	emergency_name = StringField('Emergency Name', validators=[DataRequired(), Length(min=5, max=100)])
-	emergency_location_id = QuerySelectField('Affected Country (Primary)', query_factory=lambda:NationalSociety.query.all(), get_label='country_name', allow_blank=True)
+	emergency_location_id = RemoteSelectField('Affected Country (Primary)', source='national_societies', allow_blank=True)
 	emergency_type_id = QuerySelectField('Emergency Type', query_factory=lambda:EmergencyType.query.all(), get_label='emergency_type_name', allow_blank=True)
 	emergency_glide = StringField('GLIDE Number')
 	emergency_go_id = IntegerField('GO ID Number')
@@ -27,10 +27,12 @@ from SIMS_Portal.emergencies.forms import (
 )
 from SIMS_Portal.emergencies.utils import (
 	update_response_locations, update_active_response_locations,
-	get_trello_tasks, emergency_availability_chart_data
+	get_trello_tasks, emergency_availability_chart_data,
+	get_emergencies_watermark, get_api_emergencies
 )
 from SIMS_Portal.assignments.utils import aggregate_availability
 from SIMS_Portal.learnings.utils import request_learnings
+from SIMS_Portal.main.utils import make_etag, not_modified, get_keyset_args, ndjson_response
 
 
 emergencies = Blueprint('emergencies', __name__)
@@ -176,7 +178,7 @@ def view_emergency(id):
 	emergency_info = db.session.query(Emergency, EmergencyType, NationalSociety).join(EmergencyType, EmergencyType.emergency_type_go_id == Emergency.emergency_type_id).join(NationalSociety, NationalSociety.ns_go_id == Emergency.emergency_location_id).filter(Emergency.id == id).first()
 	
 	# count approved products for emergency
-	emergency_portfolio_size = len(db.session.query(Portfolio, Emergency).join(Emergency, Emergency.id == Portfolio.emergency_id).filter(Emergency.id == id, Portfolio.product_status == 'Approved').all())
+	emergency_portfolio_size = db.session.query(Portfolio.id).filter(Portfolio.emergency_id == id, Portfolio.product_status == 'Approved').count()
 	
 	# get 3 portfolio products for emergency
 	emergency_portfolio = db.session.query(Portfolio, Emergency).join(Emergency, Emergency.id == Portfolio.emergency_id).filter(Emergency.id == id, Portfolio.product_status == 'Approved').limit(3).all()
@@ -420,65 +422,60 @@ def delete_emergency(id):
 		list_of_admins = db.session.query(User).filter(User.is_admin==True).all()
 		return render_template('errors/403.html', list_of_admins=list_of_admins), 403
 
+# largest page a single /api/emergencies request can ask for
+API_EMERGENCIES_MAX_LIMIT = 500
+
 @emergencies.route('/api/emergencies', methods=['GET'])
 def api_get_emergencies():
-	status_param = request.args.get('status')
-	emergency_id_param = request.args.get('emergency_id')
-	iso3_param = request.args.get('iso3')
-
-	# subquery establishes custom column for assignment_counter
-	subquery = (
-		db.session.query(
-			Assignment.emergency_id,
-			func.count(Assignment.id).label("assignment_count")
-		)
-		.group_by(Assignment.emergency_id)
-		.subquery()
-	)
-
-	# set aliases for the joined tables to distinguish
-	emergency_alias = aliased(Emergency)
-	emergency_type_alias = aliased(EmergencyType)
-	national_society_alias = aliased(NationalSociety)
-
-	query = (
-		db.session.query(
-			emergency_alias,
-			emergency_type_alias.emergency_type_name,
-			national_society_alias.iso3,
-			national_society_alias.country_name,
-			subquery.c.assignment_count
-		)
-		.outerjoin(subquery, emergency_alias.id == subquery.c.emergency_id)
-		.join(emergency_type_alias, emergency_type_alias.id == emergency_alias.emergency_type_id)
-		.join(national_society_alias, national_society_alias.ns_go_id == emergency_alias.emergency_location_id)
-		.group_by(emergency_alias.id, emergency_type_alias.emergency_type_name, national_society_alias.iso3, national_society_alias.country_name, subquery.c.assignment_count)
-	)
-
-	if status_param:
-		query = query.filter(emergency_alias.emergency_status == status_param)
-
-	if emergency_id_param:
-		query = query.filter(emergency_alias.emergency_go_id == emergency_id_param)
-
-	if iso3_param:
-		query = query.filter(national_society_alias.iso3 == iso3_param)
-
-	emergencies = query.all()
-
-	result = []
-	for emergency, emergency_type_name, iso3, country_name, assignment_count in emergencies:
-		result.append({
-			'emergency_name': emergency.emergency_name,
-			'go_emergency_id': emergency.emergency_go_id,
-			'status': emergency.emergency_status,
-			'emergency_type': emergency_type_name,
-			'iso3': iso3,
-			'country_name': country_name,
-			'slack_channel': emergency.slack_channel,
-			'activation_details': emergency.activation_details,
-			'glide': emergency.emergency_glide,
-			'assignment_count': assignment_count or 0  # set count to 0 if none
-		})
-
-	return jsonify(result)
\ No newline at end of file
+	"""
+	Get emergencies with their type, location and assignment count
+	
+	URL: /api/emergencies?status=<status>&emergency_id=<go_emergency_id>&iso3=<iso3>&limit=<n>&after=<id>&format=ndjson
+	
+	Method: GET
+	
+	Parameters:
+		status (str): Only return emergencies with this status.
+		emergency_id (str): Only return the emergency with this GO ID.
+		iso3 (str): Only return emergencies in this country.
+		limit (int): Page size, capped at API_EMERGENCIES_MAX_LIMIT. Without it every matching emergency is returned.
+		after (int): The next_after of the previous page.
+		format (str): 'ndjson' (or an Accept header of application/x-ndjson) streams one emergency per line.
+	
+	Returns:
+		Without limit, a list of emergency dictionaries as before. With limit, {'emergencies': [...], 'next_after': <id or null>}. Responses carry an ETag built from the emergency and assignment row counts, max ids and updated_at watermarks, plus a Last-Modified header; a poll whose If-None-Match matches gets an empty 304 after a single watermark query. If-Modified-Since alone is not enough for a 304, since deleting a row doesn't move the timestamps.
+	"""
+	ndjson = request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+	
+	try:
+		limit, after = get_keyset_args(API_EMERGENCIES_MAX_LIMIT)
+	except ValueError as e:
+		return jsonify({'error': str(e)}), 400
+	
+	params = {
+		'status': request.args.get('status') or None,
+		'emergency_go_id': request.args.get('emergency_id') or None,
+		'iso3': (request.args.get('iso3') or '').upper() or None,
+		'limit': limit,
+		'after': after
+	}
+	
+	watermark, last_modified = get_emergencies_watermark()
+	etag = make_etag('emergencies', ndjson, *(params[name] for name in sorted(params)), *watermark)
+	cached_response = not_modified(etag, last_modified)
+	if cached_response is not None:
+		return cached_response
+	
+	result, next_after = get_api_emergencies(params, watermark)
+	
+	if ndjson:
+		response = ndjson_response(result)
+	elif limit is not None:
+		response = jsonify({'emergencies': result, 'next_after': next_after})
+	else:
+		response = jsonify(result)
+	
+	response.set_etag(etag)
+	if last_modified:
+		response.last_modified = last_modified
+	return response
\ No newline at end of file
@@ -1,8 +1,9 @@
 from collections import Counter
 from datetime import datetime, timedelta, date
 from flask import url_for, current_app, flash, redirect
-from SIMS_Portal import db
-from SIMS_Portal.models import User, Assignment, Emergency, NationalSociety
+from SIMS_Portal import db, cache
+from SIMS_Portal.models import User, Assignment, Emergency, NationalSociety, EmergencyType
+from sqlalchemy import func, select
 from slack_sdk import WebClient
 import ast
 import csv
@@ -148,3 +149,93 @@ def emergency_availability_chart_data(dis_id):
 	
 	return formatted_week_dates, frequency_count
 
+def get_emergencies_watermark():
+	"""
+	Returns (etag parts, last modified) for the emergency API in one query. Row counts and max ids cover inserts and deletes, the updated_at watermarks cover edits.
+	"""
+	emergency_changed = func.coalesce(Emergency.updated_at, Emergency.created_at)
+	assignment_changed = func.coalesce(Assignment.updated_at, Assignment.created_at)
+	emergency_stats = select([func.count(Emergency.id), func.max(Emergency.id), func.max(emergency_changed)]).subquery()
+	assignment_stats = select([func.count(Assignment.id), func.max(Assignment.id), func.max(assignment_changed)]).subquery()
+	row = db.session.execute(select([emergency_stats, assignment_stats])).fetchone()
+	
+	last_modified = max([changed for changed in (row[2], row[5]) if changed is not None], default=None)
+	return tuple(row), last_modified
+
+def build_api_emergencies(status=None, emergency_go_id=None, iso3=None, limit=None, after=None):
+	"""
+	Runs the /api/emergencies query and returns (list of emergency dicts, next_after). next_after is the id to pass as after for the next page, or None on the last page or when unpaginated.
+	"""
+	# subquery establishes custom column for assignment_counter
+	subquery = (
+		db.session.query(
+			Assignment.emergency_id,
+			func.count(Assignment.id).label("assignment_count")
+		)
+		.group_by(Assignment.emergency_id)
+		.subquery()
+	)
+	
+	query = (
+		db.session.query(
+			Emergency.id,
+			Emergency.emergency_name,
+			Emergency.emergency_go_id,
+			Emergency.emergency_status,
+			Emergency.slack_channel,
+			Emergency.activation_details,
+			Emergency.emergency_glide,
+			EmergencyType.emergency_type_name,
+			NationalSociety.iso3,
+			NationalSociety.country_name,
+			subquery.c.assignment_count
+		)
+		.outerjoin(subquery, Emergency.id == subquery.c.emergency_id)
+		.join(EmergencyType, EmergencyType.id == Emergency.emergency_type_id)
+		.join(NationalSociety, NationalSociety.ns_go_id == Emergency.emergency_location_id)
+		.order_by(Emergency.id)
+	)
+	
+	if status:
+		query = query.filter(Emergency.emergency_status == status)
+	if emergency_go_id:
+		query = query.filter(Emergency.emergency_go_id == emergency_go_id)
+	if iso3:
+		query = query.filter(NationalSociety.iso3 == iso3)
+	if after is not None:
+		query = query.filter(Emergency.id > after)
+	if limit is not None:
+		query = query.limit(limit)
+	
+	rows = query.all()
+	result = [
+		{
+			'emergency_name': row.emergency_name,
+			'go_emergency_id': row.emergency_go_id,
+			'status': row.emergency_status,
+			'emergency_type': row.emergency_type_name,
+			'iso3': row.iso3,
+			'country_name': row.country_name,
+			'slack_channel': row.slack_channel,
+			'activation_details': row.activation_details,
+			'glide': row.emergency_glide,
+			'assignment_count': row.assignment_count or 0  # set count to 0 if none
+		}
+		for row in rows
+	]
+	next_after = rows[-1].id if limit is not None and len(rows) == limit else None
+	return result, next_after
+
+def get_api_emergencies(params, watermark):
+	"""
+	Cached build_api_emergencies(). The key is the normalized query parameters plus the watermark, so any write to emergencies or assignments moves polls onto a fresh key and stale entries simply age out.
+	"""
+	key = 'api_emergencies/{}/{}'.format(
+		'&'.join('{}={}'.format(name, params[name]) for name in sorted(params) if params[name] is not None),
+		'/'.join(str(part) for part in watermark)
+	)
+	entry = cache.get(key)
+	if entry is None:
+		entry = build_api_emergencies(**params)
+		cache.set(key, entry, timeout=current_app.config['API_EMERGENCIES_CACHE_SECONDS'])
+	return entry
@@ -0,0 +1,151 @@
+import logging
+import threading
+from io import BytesIO
+
+import boto3
+from flask import current_app, flash
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from PIL import Image, ImageOps
+from SIMS_Portal import db, cache
+from SIMS_Portal.models import User, Portfolio
+
+logger = logging.getLogger(__name__)
+
+# widths made for each kind of upload; avatars are fitted into a square box, covers are scaled to the width
+IMAGE_RENDITIONS = {
+	'avatar': {'model': User, 'widths': [64, 160, 400], 'square': True},
+	'cover': {'model': Portfolio, 'widths': [320, 850], 'square': False},
+}
+
+# (extension, PIL format, content type, save options); the last one is the fallback stored in image_file
+IMAGE_FORMATS = [
+	('webp', 'WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+	('jpg', 'JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+]
+
+# rendition keys are never reused, so browsers can keep them for good
+RENDITION_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# the state of the last upload queued for a member's avatar or a product's cover, shared by every worker on the host; see get_image_upload_status()
+IMAGE_UPLOAD_STATUS_KEY = 'image_upload_status/{}/{}'
+IMAGE_UPLOAD_LABELS = {'avatar': 'profile picture', 'cover': 'cover image'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def make_renditions(image_bytes, kind):
+	"""
+	Decodes an uploaded image once and returns a list of (width, extension, content type, bytes) for every width of this kind in every format in IMAGE_FORMATS, smallest first. Images are never scaled up, so a small upload gives fewer widths. Works on bytes only, so it can run in a worker process.
+	"""
+	spec = IMAGE_RENDITIONS[kind]
+	image = ImageOps.exif_transpose(Image.open(BytesIO(image_bytes))).convert('RGB')
+
+	renditions = []
+	made_widths = set()
+	for width in sorted(spec['widths']):
+		resized = image.copy()
+		if spec['square']:
+			resized.thumbnail((width, width), Image.Resampling.LANCZOS)
+		elif image.width > width:
+			resized = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+		if resized.width in made_widths:
+			continue
+		made_widths.add(resized.width)
+
+		for extension, image_format, content_type, options in IMAGE_FORMATS:
+			with BytesIO() as image_stream:
+				resized.save(image_stream, format=image_format, **options)
+				renditions.append((resized.width, extension, content_type, image_stream.getvalue()))
+
+	return renditions
+
+def upload_renditions(s3, bucket, key_prefix, renditions):
+	"""
+	Uploads the output of make_renditions() as <key_prefix>-<width>.<extension>. Returns (image_file, image_renditions): the key of the largest fallback rendition, and a dict of extension to [width, key] pairs, smallest first, for the templates' srcset.
+	"""
+	image_renditions = {}
+	for width, extension, content_type, rendition_bytes in renditions:
+		key = '{}-{}.{}'.format(key_prefix, width, extension)
+		s3.put_object(Bucket=bucket, Key=key, Body=rendition_bytes, ContentType=content_type, CacheControl=RENDITION_CACHE_CONTROL)
+		image_renditions.setdefault(extension, []).append([width, key])
+
+	fallback_extension = IMAGE_FORMATS[-1][0]
+	return image_renditions[fallback_extension][-1][1], image_renditions
+
+def process_image_upload(kind, record_id, image_bytes, key_prefix):
+	"""
+	Makes and uploads the renditions for one upload, then points the member's or product's image_file and image_renditions at them.
+	"""
+	model = IMAGE_RENDITIONS[kind]['model']
+	s3 = boto3.client('s3', endpoint_url=current_app.config['S3_ENDPOINT_URL'])
+	image_file, image_renditions = upload_renditions(s3, current_app.config['UPLOAD_BUCKET'], key_prefix, make_renditions(image_bytes, kind))
+
+	db.session.query(model).filter(model.id == record_id).update({'image_file': image_file, 'image_renditions': image_renditions}, synchronize_session=False)
+	if kind == 'cover':
+		from SIMS_Portal.portfolios.utils import invalidate_emergency_products
+		invalidate_emergency_products(record_id)
+	db.session.commit()
+	return image_file
+
+def get_image_executor():
+	global _executor
+	with _executor_lock:
+		if _executor is None:
+			_executor = ThreadPoolExecutor(max_workers=current_app.config['IMAGE_EXECUTOR_WORKERS'], thread_name_prefix='image-upload')
+	return _executor
+
+def set_image_upload_status(kind, record_id, status, error=None):
+	cache.set(IMAGE_UPLOAD_STATUS_KEY.format(kind, record_id), {'status': status, 'error': error, 'updated_at': datetime.utcnow()}, timeout=current_app.config['IMAGE_UPLOAD_STATUS_SECONDS'])
+
+def get_image_upload_status(kind, record_id):
+	"""
+	Returns {'status', 'error', 'updated_at'} for the last upload queued for this record, or None once it has gone through. Status is Processing or Failed; an upload still Processing after IMAGE_UPLOAD_STALE_SECONDS was lost with the web worker that had it queued, and is reported as Failed.
+	"""
+	upload_status = cache.get(IMAGE_UPLOAD_STATUS_KEY.format(kind, record_id))
+	if upload_status and upload_status['status'] == 'Processing' and (datetime.utcnow() - upload_status['updated_at']).total_seconds() > current_app.config['IMAGE_UPLOAD_STALE_SECONDS']:
+		upload_status = dict(upload_status, status='Failed', error='the server restarted before it was processed')
+	return upload_status
+
+def flash_image_upload_status(kind, record_id):
+	"""
+	Tells whoever is looking at the record that its new image is still being processed, or that it failed. A failure is only reported once.
+	"""
+	upload_status = get_image_upload_status(kind, record_id)
+	if upload_status is None:
+		return
+	label = IMAGE_UPLOAD_LABELS[kind]
+	if upload_status['status'] == 'Failed':
+		cache.delete(IMAGE_UPLOAD_STATUS_KEY.format(kind, record_id))
+		flash('Your new {} could not be saved ({}). Please upload it again.'.format(label, upload_status['error']), 'danger')
+	else:
+		flash('Your new {} is still being processed and will show up in a few seconds.'.format(label), 'info')
+
+def queue_image_upload(kind, record_id, image_bytes, key_prefix):
+	"""
+	Hands an upload to this process's image executor so the form POST doesn't wait on resizing and S3. The record keeps its current image until the renditions are uploaded; until then, and if the upload fails, get_image_upload_status() says so. If the executor can't take the upload (the worker is shutting down), it's processed before the POST returns instead.
+	"""
+	set_image_upload_status(kind, record_id, 'Processing')
+	try:
+		get_image_executor().submit(run_image_upload, current_app._get_current_object(), kind, record_id, image_bytes, key_prefix)
+	except RuntimeError:
+		logger.warning('Image executor unavailable, processing upload {} for {} {} in the request'.format(key_prefix, kind, record_id))
+		record_image_upload(kind, record_id, image_bytes, key_prefix)
+
+def record_image_upload(kind, record_id, image_bytes, key_prefix):
+	try:
+		process_image_upload(kind, record_id, image_bytes, key_prefix)
+		cache.delete(IMAGE_UPLOAD_STATUS_KEY.format(kind, record_id))
+	except Exception as e:
+		db.session.rollback()
+		logger.error('Image upload {} for {} {} failed: {}'.format(key_prefix, kind, record_id, e))
+		# PIL's errors for files that aren't images are the common case, and say nothing useful to a member
+		error = 'the file could not be read as an image' if isinstance(e, (OSError, Image.DecompressionBombError)) else 'the upload to storage failed'
+		set_image_upload_status(kind, record_id, 'Failed', error)
+
+def run_image_upload(app, kind, record_id, image_bytes, key_prefix):
+	with app.app_context():
+		try:
+			record_image_upload(kind, record_id, image_bytes, key_prefix)
+		finally:
+			db.session.remove()
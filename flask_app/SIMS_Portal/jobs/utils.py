@@ -0,0 +1,408 @@
+import importlib
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import zlib
+from datetime import datetime, timedelta
+
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.triggers.cron import CronTrigger
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text, select, func
+from sqlalchemy.dialects import postgresql
+from SIMS_Portal import db
+from SIMS_Portal.models import JobRun
+from SIMS_Portal.main.utils import BADGE_RULES
+
+logger = logging.getLogger(__name__)
+
+# jobs run by the worker process (worker.py); target is 'module:function', heartbeat_url is pinged once a run has succeeded
+SCHEDULED_JOBS = [
+	{
+		'name': 'run_surge_alert_refresh',
+		'target': 'SIMS_Portal.alerts.utils:refresh_surge_alerts_latest',
+		'cron': {'hour': '1,4,7,10,13,16'},
+		'heartbeat_url': 'https://uptime.betterstack.com/api/v1/heartbeat/7DQYkNR4cM96cKsY69xQah4k',
+	},
+	{
+		'name': 'run_auto_badge_assigners',
+		'target': 'SIMS_Portal.main.utils:award_auto_badges',
+		'cron': {'hour': '17'},
+		'heartbeat_url': 'https://uptime.betterstack.com/api/v1/heartbeat/QWvz7BCEoLnpKeCFMFbK3d2a',
+	},
+	# automatically ping all associated members to active disasters to request availability
+	# {
+	# 	'name': 'request_availability',
+	# 	'target': 'SIMS_Portal.availability.utils:request_availability_updates',
+	# 	'cron': {'week': '*', 'day_of_week': 'mon', 'hour': 8},
+	# 	'heartbeat_url': 'https://uptime.betterstack.com/api/v1/heartbeat/5WUSoe7kqnkKxQVLr1iKTFuq',
+	# },
+]
+
+JOBS_BY_NAME = {job['name']: job for job in SCHEDULED_JOBS}
+
+# the only functions /manual_refresh/<name> will run; args are passed to the target as positional arguments
+MANUAL_TASKS = [
+	{'name': 'refresh_surge_alerts_latest', 'label': 'Refresh Surge Alerts', 'target': 'SIMS_Portal.alerts.utils:refresh_surge_alerts_latest'},
+	{'name': 'refresh_surge_alerts', 'label': 'Backfill Surge Alerts', 'target': 'SIMS_Portal.alerts.utils:refresh_surge_alerts'},
+	{'name': 'request_availability_updates', 'label': 'Request Availability Updates', 'target': 'SIMS_Portal.availability.utils:request_availability_updates'},
+	{'name': 'update_active_response_locations', 'label': 'Update Active Disasters Map', 'target': 'SIMS_Portal.emergencies.utils:update_active_response_locations'},
+	{'name': 'update_response_locations', 'label': 'Update Response History Map', 'target': 'SIMS_Portal.emergencies.utils:update_response_locations'},
+	{'name': 'update_member_locations', 'label': 'Update Member Locations Map', 'target': 'SIMS_Portal.users.utils:update_member_locations'},
+	{'name': 'bulk_slack_photo_update', 'label': 'Update Missing Avatars', 'target': 'SIMS_Portal.users.utils:bulk_slack_photo_update'},
+	{'name': 'rebuild_user_stats', 'label': 'Rebuild Member Stats', 'target': 'SIMS_Portal.users.utils:rebuild_user_stats'},
+	{'name': 'rebuild_search_index', 'label': 'Rebuild Search Index', 'target': 'SIMS_Portal.search.utils:rebuild_search_index'},
+] + [
+	{'name': rule['name'], 'label': rule['name'], 'target': 'SIMS_Portal.main.utils:award_auto_badges', 'args': [[rule['name']]], 'badge': True}
+	for rule in BADGE_RULES
+]
+
+MANUAL_TASKS_BY_NAME = {task['name']: task for task in MANUAL_TASKS}
+
+# statuses a run can still change from
+ACTIVE_JOB_STATUSES = ['Queued', 'Running']
+
+class JobCancelled(Exception):
+	"""
+	Raised by report_progress() once an admin has asked for the current run to stop. Tasks that catch Exception broadly need to let this one through.
+	"""
+	pass
+
+# the job_run id of the run executing on this thread, if any
+_current_job = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+# job_run ids this process has claimed and not finished yet, whose alive_at keep_job_runs_alive() keeps touching
+_owned_job_runs = set()
+_owned_lock = threading.Lock()
+_keepalive_thread = None
+
+# first half of the two-key Postgres advisory lock, so job locks can't collide with locks taken for anything else
+JOB_LOCK_NAMESPACE = 5170
+
+def job_lock_key(name):
+	# crc32 rather than hash(), which is salted differently in every process
+	return zlib.crc32(name.encode('utf-8')) & 0x7fffffff
+
+def resolve_target(target):
+	module_name, function_name = target.split(':')
+	return getattr(importlib.import_module(module_name), function_name)
+
+def worker_name():
+	return '{}:{}'.format(socket.gethostname(), os.getpid())[:120]
+
+def claim_job_run(name, trigger, scheduled_for=None, status='Running', requested_by=None):
+	"""
+	Inserts the job_run row for this run and returns its id. For scheduled runs the (name, scheduled_for) unique index means only the first worker to get there claims the occurrence; everyone else gets None.
+	"""
+	job_run_table = JobRun.__table__
+	insert_statement = postgresql.insert(job_run_table).values(
+		name = name,
+		trigger = trigger,
+		status = status,
+		scheduled_for = scheduled_for,
+		started_at = datetime.utcnow(),
+		worker = worker_name(),
+		requested_by = requested_by,
+		cancel_requested = False,
+		alive_at = datetime.utcnow()
+	).on_conflict_do_nothing(index_elements=[job_run_table.c.name, job_run_table.c.scheduled_for]).returning(job_run_table.c.id)
+	job_run_id = db.session.execute(insert_statement).scalar()
+	db.session.commit()
+	if job_run_id is not None:
+		own_job_run(job_run_id)
+	return job_run_id
+
+def own_job_run(job_run_id):
+	"""
+	Marks a run as belonging to this process until release_job_run(), and makes sure the keepalive thread is running. If the process dies first, its runs stop being touched and reap_stale_job_runs() fails them.
+	"""
+	global _keepalive_thread
+	with _owned_lock:
+		_owned_job_runs.add(job_run_id)
+		# started lazily, so each forked gunicorn worker gets its own
+		if _keepalive_thread is None or not _keepalive_thread.is_alive():
+			_keepalive_thread = threading.Thread(target=keep_job_runs_alive, args=[current_app._get_current_object()], name='job-keepalive', daemon=True)
+			_keepalive_thread.start()
+
+def release_job_run(job_run_id):
+	with _owned_lock:
+		_owned_job_runs.discard(job_run_id)
+
+def keep_job_runs_alive(app):
+	job_run_table = JobRun.__table__
+	while True:
+		time.sleep(app.config['JOB_ALIVE_SECONDS'])
+		with _owned_lock:
+			job_run_ids = list(_owned_job_runs)
+		if not job_run_ids:
+			continue
+		try:
+			with app.app_context(), db.engine.begin() as connection:
+				connection.execute(job_run_table.update().where(job_run_table.c.id.in_(job_run_ids), job_run_table.c.status.in_(ACTIVE_JOB_STATUSES)).values(alive_at = datetime.utcnow()))
+		except Exception as e:
+			logger.error('Could not mark job runs {} as alive: {}'.format(job_run_ids, e))
+
+def finish_job_run(job_run_id, status, started, result=None, error=None):
+	job_run = JobRun.query.get(job_run_id)
+	job_run.status = status
+	job_run.finished_at = datetime.utcnow()
+	job_run.duration_ms = int((time.perf_counter() - started) * 1000)
+	job_run.result = None if result is None else str(result)[:500]
+	job_run.error = error
+	db.session.commit()
+
+def execute_job_run(job_run_id, job):
+	"""
+	Runs job (an entry of SCHEDULED_JOBS or MANUAL_TASKS) for an already claimed job_run row and records the outcome. A Postgres advisory lock keyed on the target function is held for the whole run, so however many processes try, only one copy of a function runs at a time; a run that finds the lock taken is recorded as Skipped.
+	"""
+	started = time.perf_counter()
+	own_job_run(job_run_id)
+	try:
+		job_run = JobRun.query.get(job_run_id)
+		job_run.status = 'Running'
+		job_run.started_at = datetime.utcnow()
+		job_run.alive_at = datetime.utcnow()
+		job_run.worker = worker_name()
+		db.session.commit()
+		run_with_job_lock(job_run_id, job, started)
+	finally:
+		release_job_run(job_run_id)
+
+def run_with_job_lock(job_run_id, job, started):
+	job_run = JobRun.query.get(job_run_id)
+	# session-level lock on its own connection, so commits inside the job don't release it
+	with db.engine.connect() as lock_connection:
+		lock_params = {'namespace': JOB_LOCK_NAMESPACE, 'key': job_lock_key(job['target'])}
+		if not lock_connection.execute(text('SELECT pg_try_advisory_lock(:namespace, :key)'), lock_params).scalar():
+			finish_job_run(job_run_id, 'Skipped', started, result='Another run of {} was still in progress.'.format(job['target']))
+			return
+		
+		_current_job.job_run_id = job_run_id
+		try:
+			result = resolve_target(job['target'])(*job.get('args', []))
+			finish_job_run(job_run_id, 'Succeeded', started, result=result)
+		except JobCancelled:
+			db.session.rollback()
+			finish_job_run(job_run_id, 'Cancelled', started)
+		except Exception as e:
+			db.session.rollback()
+			current_app.logger.error('Job {} (run {}) failed: {}'.format(job_run.name, job_run_id, e))
+			finish_job_run(job_run_id, 'Failed', started, error=traceback.format_exc())
+		finally:
+			_current_job.job_run_id = None
+			lock_connection.execute(text('SELECT pg_advisory_unlock(:namespace, :key)'), lock_params)
+
+def run_job(name, trigger='manual', scheduled_for=None):
+	"""
+	Claims and runs one job from SCHEDULED_JOBS in the calling thread. Returns the job_run id, or None if another worker already claimed this scheduled occurrence.
+	"""
+	job_run_id = claim_job_run(name, trigger, scheduled_for)
+	if job_run_id is not None:
+		execute_job_run(job_run_id, JOBS_BY_NAME[name])
+	return job_run_id
+
+def report_progress(done, total=None, message=None):
+	"""
+	Records how far the current job run has got, for the manual refresh page. Call it from inside long loops; it raises JobCancelled once an admin has cancelled the run, so reporting progress is also what makes a task cancellable. Does nothing when the function isn't running as a job.
+	"""
+	job_run_id = getattr(_current_job, 'job_run_id', None)
+	if job_run_id is None:
+		return
+	
+	job_run_table = JobRun.__table__
+	# own connection, so progress is visible straight away and never commits the task's pending work
+	with db.engine.begin() as connection:
+		connection.execute(job_run_table.update().where(job_run_table.c.id == job_run_id).values(
+			progress_done = done,
+			progress_total = total,
+			progress_message = None if message is None else str(message)[:200],
+			alive_at = datetime.utcnow()
+		))
+		cancel_requested = connection.execute(select([job_run_table.c.cancel_requested]).where(job_run_table.c.id == job_run_id)).scalar()
+	
+	if cancel_requested:
+		raise JobCancelled()
+
+def get_job_executor():
+	global _executor
+	with _executor_lock:
+		if _executor is None:
+			_executor = ThreadPoolExecutor(max_workers=current_app.config['JOB_EXECUTOR_WORKERS'], thread_name_prefix='manual-job')
+	return _executor
+
+def submit_manual_task(name, user_id):
+	"""
+	Queues a task from MANUAL_TASKS on this process's background executor and returns its job_run id straight away. Raises KeyError for names that aren't in the registry.
+	"""
+	task = MANUAL_TASKS_BY_NAME[name]
+	job_run_id = claim_job_run(task['name'], 'manual', status='Queued', requested_by=user_id)
+	get_job_executor().submit(run_manual_task, current_app._get_current_object(), job_run_id)
+	return job_run_id
+
+def run_manual_task(app, job_run_id):
+	with app.app_context():
+		try:
+			job_run = JobRun.query.get(job_run_id)
+			if job_run.cancel_requested:
+				finish_job_run(job_run_id, 'Cancelled', time.perf_counter())
+			else:
+				execute_job_run(job_run_id, MANUAL_TASKS_BY_NAME[job_run.name])
+		except Exception as e:
+			db.session.rollback()
+			logger.error('Manual task run {} could not be run: {}'.format(job_run_id, e))
+		finally:
+			release_job_run(job_run_id)
+			db.session.remove()
+
+def cancel_job_run(job_run_id):
+	"""
+	Asks a queued or running job to stop. Queued runs, and running ones whose process has stopped touching alive_at, are cancelled on the spot; the rest stop the next time they call report_progress(). Returns False if the run had already finished.
+	"""
+	job_run = JobRun.query.get(job_run_id)
+	if job_run is None or job_run.status not in ACTIVE_JOB_STATUSES:
+		return False
+	job_run.cancel_requested = True
+	if job_run.status == 'Queued' or job_run_is_stale(job_run):
+		job_run.status = 'Cancelled'
+		job_run.finished_at = datetime.utcnow()
+	db.session.commit()
+	return True
+
+def stale_job_run_cutoff():
+	return datetime.utcnow() - timedelta(seconds=current_app.config['JOB_STALE_SECONDS'])
+
+def job_run_is_stale(job_run):
+	return (job_run.alive_at or job_run.started_at) < stale_job_run_cutoff()
+
+def reap_stale_job_runs():
+	"""
+	Fails queued and running runs whose process has not touched alive_at for JOB_STALE_SECONDS, i.e. runs left behind by a gunicorn worker that was recycled, timed out or redeployed, or by a crashed worker.py. Returns the number of runs failed.
+	"""
+	stale_runs = JobRun.query.filter(
+		JobRun.status.in_(ACTIVE_JOB_STATUSES),
+		func.coalesce(JobRun.alive_at, JobRun.started_at) < stale_job_run_cutoff()
+	).with_for_update(skip_locked=True).all()
+	
+	for job_run in stale_runs:
+		last_seen = job_run.alive_at or job_run.started_at
+		current_app.logger.warning('Job {} (run {}) was left {} by {}, last seen {}; marking it Failed.'.format(job_run.name, job_run.id, job_run.status, job_run.worker, last_seen))
+		job_run.status = 'Failed'
+		job_run.finished_at = datetime.utcnow()
+		job_run.error = 'No sign of life from {} since {:%Y-%m-%d %H:%M:%S} UTC; the process running it was stopped before the run finished.'.format(job_run.worker or 'its worker', last_seen)
+	db.session.commit()
+	return len(stale_runs)
+
+def job_run_dict(job_run):
+	"""
+	The JSON shape of a job run served to the manual refresh page's polling.
+	"""
+	if job_run.finished_at:
+		elapsed_seconds = (job_run.finished_at - job_run.started_at).total_seconds()
+	else:
+		elapsed_seconds = (datetime.utcnow() - job_run.started_at).total_seconds()
+	task = MANUAL_TASKS_BY_NAME.get(job_run.name) or JOBS_BY_NAME.get(job_run.name) or {}
+	return {
+		'id': job_run.id,
+		'name': job_run.name,
+		'label': task.get('label', job_run.name),
+		'trigger': job_run.trigger,
+		'status': job_run.status,
+		'started_at': job_run.started_at.isoformat() if job_run.started_at else None,
+		'finished_at': job_run.finished_at.isoformat() if job_run.finished_at else None,
+		'elapsed_seconds': round(elapsed_seconds, 1),
+		'progress_done': job_run.progress_done,
+		'progress_total': job_run.progress_total,
+		'progress_message': job_run.progress_message,
+		'result': job_run.result,
+		'error': job_run.error.strip().splitlines()[-1] if job_run.error else None,
+		'cancel_requested': bool(job_run.cancel_requested),
+		'active': job_run.status in ACTIVE_JOB_STATUSES,
+	}
+
+def send_job_heartbeats():
+	"""
+	Pings the uptime heartbeat of every job run that succeeded and hasn't been reported yet. Heartbeats follow the job_run records rather than the job itself, so a ping that fails is retried on the next pass and a run that failed never sends one.
+	"""
+	from SIMS_Portal.main.utils import heartbeats
+	
+	heartbeat_urls = {job['name']: job['heartbeat_url'] for job in SCHEDULED_JOBS if job.get('heartbeat_url')}
+	unreported = JobRun.query.filter(
+		JobRun.status == 'Succeeded',
+		JobRun.heartbeat_sent_at.is_(None),
+		JobRun.name.in_(list(heartbeat_urls)),
+		JobRun.finished_at >= datetime.utcnow() - timedelta(days=1)
+	).order_by(JobRun.id).all()
+	
+	for job_run in unreported:
+		try:
+			if heartbeats(job_run.name, heartbeat_urls[job_run.name]) == 'Request successful':
+				job_run.heartbeat_sent_at = datetime.utcnow()
+		except Exception as e:
+			current_app.logger.error('Heartbeat for job run {} failed: {}'.format(job_run.id, e))
+	db.session.commit()
+
+def run_scheduled_job(app, name):
+	with app.app_context():
+		try:
+			# cron fires on the minute, so every worker computes the same occurrence
+			scheduled_for = datetime.utcnow().replace(second=0, microsecond=0)
+			run_job(name, trigger='schedule', scheduled_for=scheduled_for)
+		except Exception as e:
+			db.session.rollback()
+			logger.error('Scheduled job {} could not be run: {}'.format(name, e))
+		finally:
+			db.session.remove()
+
+def run_heartbeat_pass(app):
+	with app.app_context():
+		try:
+			send_job_heartbeats()
+		except Exception as e:
+			db.session.rollback()
+			logger.error('Job heartbeat pass failed: {}'.format(e))
+		finally:
+			db.session.remove()
+
+def run_reaper_pass(app):
+	with app.app_context():
+		try:
+			reap_stale_job_runs()
+		except Exception as e:
+			db.session.rollback()
+			logger.error('Stale job run pass failed: {}'.format(e))
+		finally:
+			db.session.remove()
+
+def run_worker(app):
+	"""
+	Blocks forever running SCHEDULED_JOBS on their cron schedules, plus the heartbeat, stale run and Dropbox mirror passes. Started by worker.py, outside the gunicorn web workers.
+	"""
+	# the jobs' cache tag bumps have to reach the web workers, which a cache local to this process or host never would
+	if app.config['CACHE_TYPE'] not in app.config['SHARED_CACHE_TYPES']:
+		raise RuntimeError('worker.py needs a cache shared with the web workers, but CACHE_TYPE is {}; set CACHE_TYPE to one of {} and CACHE_REDIS_URL'.format(app.config['CACHE_TYPE'], ', '.join(app.config['SHARED_CACHE_TYPES'])))
+	
+	scheduler = BlockingScheduler(timezone=app.config['SCHEDULER_TIMEZONE'])
+	for job in SCHEDULED_JOBS:
+		scheduler.add_job(
+			run_scheduled_job, CronTrigger(timezone=app.config['SCHEDULER_TIMEZONE'], **job['cron']),
+			args=[app, job['name']], id=job['name'], coalesce=True, max_instances=1, misfire_grace_time=300
+		)
+	scheduler.add_job(run_heartbeat_pass, 'interval', seconds=app.config['JOB_HEARTBEAT_POLL_SECONDS'], args=[app], id='job_heartbeats', coalesce=True, max_instances=1)
+	scheduler.add_job(run_reaper_pass, 'interval', seconds=app.config['JOB_REAPER_POLL_SECONDS'], args=[app], id='job_reaper', coalesce=True, max_instances=1)
+	
+	# portfolio files are copied to Dropbox from here, see portfolios/utils.py
+	from SIMS_Portal.portfolios.utils import run_dropbox_mirror_pass
+	scheduler.add_job(run_dropbox_mirror_pass, 'interval', seconds=app.config['DROPBOX_MIRROR_POLL_SECONDS'], args=[app], id='dropbox_mirror', coalesce=True, max_instances=1)
+	
+	# outbound slack messages are queued by the web workers and sent from here, see notifications/utils.py
+	if app.config['SLACK_QUEUE_DISPATCHER']:
+		from SIMS_Portal.notifications.utils import start_slack_dispatcher
+		start_slack_dispatcher(app)
+	
+	app.logger.info('SIMS Portal job worker started with {} scheduled job(s)'.format(len(SCHEDULED_JOBS)))
+	scheduler.start()
@@ -0,0 +1,168 @@
+from flask import url_for
+from markupsafe import Markup, escape
+from sqlalchemy import func, or_
+from wtforms.fields import Field
+from wtforms.validators import ValidationError
+from wtforms.widgets import html_params
+from SIMS_Portal import db
+from SIMS_Portal.models import User, Emergency, NationalSociety, Assignment
+
+def escape_like(term):
+	return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def starts_with(column, term):
+	# matches the lower(...) text_pattern_ops indexes on these columns
+	return func.lower(column).like(term + '%', escape='\\')
+
+def word_starts_with(column, term):
+	return func.lower(column).like('% ' + term + '%', escape='\\')
+
+# the records RemoteSelectField can pick from. key is the attribute submitted as the option value (and looked up on validation), columns are all the typeahead loads per row, match is applied once per word typed, and filters limit which rows can be picked at all. scopes are the extra filters a form can ask for per request (RemoteSelectField.scope), each taking an integer id
+TYPEAHEAD_SOURCES = {
+	'users': {
+		'model': User,
+		'key': 'id',
+		'columns': ['id', 'firstname', 'lastname'],
+		'label': lambda row: '{} {}'.format(row.firstname, row.lastname),
+		'match': lambda term: or_(starts_with(User.firstname, term), starts_with(User.lastname, term)),
+		'filters': [User.status == 'Active'],
+		'scopes': {
+			'im_support_on': lambda emergency_id: User.id.in_(db.session.query(Assignment.user_id).filter(Assignment.emergency_id == emergency_id, Assignment.role == 'Remote IM Support', Assignment.assignment_status == 'Active')),
+		},
+		'order_by': [User.firstname, User.lastname, User.id],
+		'login_required': True,
+	},
+	'emergencies': {
+		'model': Emergency,
+		'key': 'id',
+		'columns': ['id', 'emergency_name', 'emergency_glide'],
+		'label': lambda row: row.emergency_name,
+		'match': lambda term: or_(starts_with(Emergency.emergency_name, term), word_starts_with(Emergency.emergency_name, term), starts_with(Emergency.emergency_glide, term)),
+		'filters': [],
+		'order_by': [Emergency.id.desc()],
+		'login_required': True,
+	},
+	# keyed on the GO id, which is what user.ns_id and emergency.emergency_location_id store
+	'national_societies': {
+		'model': NationalSociety,
+		'key': 'ns_go_id',
+		'columns': ['ns_go_id', 'country_name', 'ns_name'],
+		'label': lambda row: row.country_name,
+		'match': lambda term: or_(starts_with(NationalSociety.country_name, term), word_starts_with(NationalSociety.country_name, term), word_starts_with(NationalSociety.ns_name, term)),
+		'filters': [NationalSociety.ns_go_id.isnot(None)],
+		'order_by': [NationalSociety.country_name, NationalSociety.ns_go_id],
+		'login_required': False,
+	},
+}
+
+def scope_filters(source_name, scope):
+	"""
+	The filters for a {scope name: id} dict. Raises ValueError for a scope the source doesn't have or an id that isn't an integer.
+	"""
+	scopes = TYPEAHEAD_SOURCES[source_name].get('scopes', {})
+	filters = []
+	for name, value in (scope or {}).items():
+		if name not in scopes:
+			raise ValueError('{} has no scope {}'.format(source_name, name))
+		filters.append(scopes[name](int(value)))
+	return filters
+
+def typeahead_page(source_name, q, page, per_page, scope=None):
+	"""
+	One page of (key, label) options for a typeahead, where every word of q has to match. Returns (results, more), with more saying whether there's another page.
+	"""
+	source = TYPEAHEAD_SOURCES[source_name]
+	model = source['model']
+	query = db.session.query(*[getattr(model, column) for column in source['columns']]).filter(*source['filters'], *scope_filters(source_name, scope))
+	for term in (q or '').lower().split()[:5]:
+		query = query.filter(source['match'](escape_like(term)))
+	rows = query.order_by(*source['order_by']).offset((page - 1) * per_page).limit(per_page + 1).all()
+	results = [{'id': getattr(row, source['key']), 'text': source['label'](row)} for row in rows[:per_page]]
+	return results, len(rows) > per_page
+
+def lookup_typeahead_value(source_name, value, scope=None):
+	"""
+	The record a submitted option value stands for, or None if there isn't one that could have been offered.
+	"""
+	source = TYPEAHEAD_SOURCES[source_name]
+	model = source['model']
+	try:
+		value = int(value)
+	except (TypeError, ValueError):
+		return None
+	return model.query.filter(getattr(model, source['key']) == value, *source['filters'], *scope_filters(source_name, scope)).first()
+
+class RemoteSelectWidget:
+	"""
+	Renders a <select> with only the blank and selected options; static/js/scripts.js gives it a search box that fills in the rest from the typeahead API.
+	"""
+	def __call__(self, field, **kwargs):
+		kwargs.setdefault('id', field.id)
+		kwargs['data_remote_select'] = url_for('main.api_typeahead', source=field.source, **field.scope)
+		if field.blank_text:
+			kwargs['data_placeholder'] = field.blank_text
+		html = ['<select {}>'.format(html_params(name=field.name, **kwargs)), '<option value=""></option>']
+		selected = field.selected_option()
+		if selected is not None:
+			html.append('<option value="{}" selected>{}</option>'.format(escape(selected[0]), escape(selected[1])))
+		html.append('</select>')
+		return Markup(''.join(html))
+
+class RemoteSelectField(Field):
+	"""
+	Drop-in replacement for a QuerySelectField over a large table: form.field.data is still the selected record, but the options are searched through /api/typeahead/<source> instead of every row being rendered, and a submitted value is checked with one lookup on the source's key.
+
+	Like QuerySelectField's query, scope can be set by the route after the form is built (e.g. form.user_name.scope = {'im_support_on': dis_id}): a submitted value is only looked up when data is first read, so the scope limits both the picker's options and what the POST accepts.
+	"""
+	widget = RemoteSelectWidget()
+
+	def __init__(self, label=None, validators=None, source=None, allow_blank=False, blank_text='', **kwargs):
+		self._data = None
+		self._formdata = None
+		self._submitted = False
+		super().__init__(label, validators, **kwargs)
+		self.source = source
+		self.allow_blank = allow_blank
+		self.blank_text = blank_text
+		self.scope = {}
+
+	def _get_data(self):
+		if self._formdata is not None:
+			self._data = lookup_typeahead_value(self.source, self._formdata, self.scope)
+			self._submitted = True
+			self._formdata = None
+		return self._data
+
+	def _set_data(self, data):
+		self._data = data
+		self._formdata = None
+		self._submitted = False
+
+	data = property(_get_data, _set_data)
+
+	def process_formdata(self, valuelist):
+		if not valuelist or valuelist[0] in ('', '__None'):
+			self.data = None
+			return
+		self.data = None
+		self._formdata = valuelist[0]
+
+	def selected_option(self):
+		"""
+		(key, label) of the current value. Routes sometimes set data to the key itself (e.g. form.ns_id.data = current_user.ns_id) rather than the record, so that's looked up too.
+		"""
+		source = TYPEAHEAD_SOURCES[self.source]
+		record = self.data
+		if record is not None and not isinstance(record, source['model']):
+			record = lookup_typeahead_value(self.source, record, self.scope)
+		if record is None:
+			return None
+		return getattr(record, source['key']), source['label'](record)
+
+	def _value(self):
+		selected = self.selected_option()
+		return '' if selected is None else str(selected[0])
+
+	def pre_validate(self, form):
+		if self.data is None and (self._submitted or not self.allow_blank):
+			raise ValidationError(self.gettext('Not a valid choice.'))
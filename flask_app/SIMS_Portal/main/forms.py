@@ -3,6 +3,7 @@ from flask_sqlalchemy import SQLAlchemy
 from wtforms import StringField, SubmitField, BooleanField, IntegerField, DateField, DateTimeField, SelectField, SelectMultipleField, HiddenField, FileField
 from wtforms.widgets import TextArea
 from wtforms_sqlalchemy.fields import QuerySelectField
+from SIMS_Portal.main.fields import RemoteSelectField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
 from flask_wtf.file import FileField, FileAllowed
 from SIMS_Portal import db
@@ -18,7 +19,7 @@ class EmergencySearchForm(FlaskForm):
 	name = StringField('Emergency Name')
 	status = SelectField('SIMS Status', choices=['', 'Active', 'Closed', 'Removed'])
 	type = QuerySelectField('Emergency Type', query_factory=lambda:EmergencyType.query.all(), get_label='emergency_type_name', allow_blank=True)
-	location = QuerySelectField('Primary Country', query_factory=lambda:NationalSociety.query.all(), get_label='country_name', allow_blank=True)
+	location = RemoteSelectField('Primary Country', source='national_societies', allow_blank=True)
 	glide = StringField('GLIDE Number')
 	submit = SubmitField('Search Emergencies')
 
@@ -29,13 +30,13 @@ class ProductSearchForm(FlaskForm):
 	submit = SubmitField('Search Products')
 	
 class BadgeAssignmentForm(FlaskForm):
-	user_name = QuerySelectField('Member', query_factory=lambda:User.query.order_by(User.firstname).filter(User.status == 'Active').all(), get_label='fullname', allow_blank=True)
+	user_name = RemoteSelectField('Member', source='users', allow_blank=True)
 	badge_name = QuerySelectField('Badge', query_factory=lambda:Badge.query.order_by(Badge.name).all(), get_label='name', allow_blank=True)
 	assigner_justify = StringField('Justification for Assigning this Badge', widget=TextArea(), validators=[DataRequired()], render_kw={'style':'height: 100px'})
 	submit_badge = SubmitField('Assign')
 
 class BadgeAssignmentViaSIMSCoForm(FlaskForm):
-	user_name = QuerySelectField('Member', query_factory=lambda:User.query.order_by(User.firstname).filter(User.status == 'Active').all(), get_label='fullname', allow_blank=True)
+	user_name = RemoteSelectField('Member', source='users', allow_blank=True)
 	badge_name = QuerySelectField('Badge', query_factory=lambda:Badge.query.order_by(Badge.name).filter(Badge.limited_edition == 'false').all(), get_label='name', allow_blank=True)
 	assigner_justify = StringField('Justification for Assigning this Badge', widget=TextArea(), validators=[DataRequired()], render_kw={'style':'height: 100px'})
 	submit_badge = SubmitField('Assign')
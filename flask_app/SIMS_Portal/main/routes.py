@@ -1,5 +1,4 @@
 import csv
-import io
 import json
 import logging
 import os
@@ -9,55 +8,53 @@ from datetime import datetime
 import pandas as pd
 from flask import (
 	abort, request, render_template, url_for, flash, redirect,
-	jsonify, Blueprint, current_app, session, send_file, send_from_directory
+	jsonify, Blueprint, current_app, send_from_directory
 )
 from flask_login import (
 	login_user, current_user, logout_user, login_required
 )
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import func, distinct, desc, asc, select, case
-import boto3
-import botocore
+from sqlalchemy.exc import SQLAlchemyError
 
 from SIMS_Portal import db, cache
 from SIMS_Portal.config import Config
 from SIMS_Portal.models import (
 	Assignment, User, Emergency, Alert, user_skill, user_language,
 	user_badge, Skill, Language, NationalSociety, Badge, Story,
-	EmergencyType, Review, user_profile, Profile, Log, Acronym, RegionalFocalPoint, Region
+	EmergencyType, Review, user_profile, Profile, Log, Acronym, RegionalFocalPoint, Region,
+	UserStats, JobRun
 )
 from SIMS_Portal.main.forms import (
 	MemberSearchForm, EmergencySearchForm, ProductSearchForm,
 	BadgeAssignmentForm, SkillCreatorForm, BadgeAssignmentViaSIMSCoForm,
 	NewBadgeUploadForm
 )
+from SIMS_Portal.main.fields import TYPEAHEAD_SOURCES, typeahead_page
 from SIMS_Portal.main.utils import (
 	fetch_slack_channels, check_sims_co, save_new_badge,
-	auto_badge_assigner_big_wig, auto_badge_assigner_maiden_voyage,
-	auto_badge_assigner_self_promoter, auto_badge_assigner_polyglot,
-	auto_badge_assigner_autobiographer, auto_badge_assigner_jack_of_all_trades,
-	auto_badge_assigner_edward_tufte, auto_badge_assigner_world_traveler,
-	auto_badge_assigner_old_salt, user_info_by_ns
+	user_info_by_ns, get_dashboard_snapshot, assign_badge, eligible_badge_recipients,
+	s3_object_response
+)
+from SIMS_Portal.jobs.utils import (
+	MANUAL_TASKS, MANUAL_TASKS_BY_NAME, submit_manual_task, cancel_job_run,
+	job_run_dict
 )
 from SIMS_Portal.users.forms import AssignProfileTypesForm, RegionalFocalPointForm
 from SIMS_Portal.users.utils import (
-	send_slack_dm, new_surge_alert, send_reset_slack, update_member_locations, 
-	bulk_slack_photo_update
-)
-from SIMS_Portal.alerts.utils import (
-	refresh_surge_alerts, refresh_surge_alerts_latest
-)
-from SIMS_Portal.emergencies.utils import (
-	update_response_locations, update_active_response_locations,
-	get_trello_tasks
-)
-from SIMS_Portal.availability.utils import (
-	send_slack_availability_request, request_availability_updates
+	send_slack_dm, new_surge_alert, send_reset_slack
 )
+from SIMS_Portal.alerts.utils import refresh_surge_alerts_latest
+from SIMS_Portal.emergencies.utils import get_trello_tasks
+from SIMS_Portal.availability.utils import send_slack_availability_request
+from SIMS_Portal.profiling.utils import get_endpoint_stats, reset_endpoint_stats
 
 
 main = Blueprint('main', __name__)
 
+# role profile page slugs, each backed by a tier_<slug> column on user_stats
+ROLE_PROFILE_TYPES = ['geo', 'webviz', 'infodes', 'datatrans', 'mobdata', 'simsco']
+
 @main.route('/') 
 def index(): 
 	latest_stories = db.session.query(Story, Emergency).join(Emergency, Emergency.id == Story.emergency_id).order_by(Story.id.desc()).limit(3).all()
@@ -174,27 +171,16 @@ def admin_assign_badge():
 		if badge_form.validate_on_submit():
 			user_id = badge_form.user_name.data.id
 			badge_id = badge_form.badge_name.data.id
-			session['assigner_justify'] = badge_form.assigner_justify.data
 		else:
 			flash('Please fill out all badge assignment fields.', 'danger')
 			return redirect(url_for('main.admin_assign_badge'))
 		
-		# get list of assigned badges, create column that concats user_id and badge_id to create unique identifier
-		badge_ids = db.engine.execute("SELECT CAST(user_id AS text) || CAST(badge_id AS text) as unique_code FROM user_badge WHERE user_id = {}".format(user_id))
-		
-		list_to_check = []
-		for id in badge_ids:
-			list_to_check.append(id[0])
-		
-		attempted_user_badge_code = str(user_id) + str(badge_id)
-		
-		# check list against the values we're trying to save, and proceed if user doesn't already have that badge
-		if attempted_user_badge_code not in list_to_check:
-			return redirect(url_for('main.badge_assignment', user_id=user_id, badge_id=badge_id))
+		if assign_badge(badge_id, [user_id], current_user.id, badge_form.assigner_justify.data):
+			flash('Badge successfully assigned.', 'success')
 		else:
 			flash('Cannot add badge - user already has it.', 'danger')
 			current_app.logger.warning('The system raised an error when trying to assign a badge. Badge-{} was assigned to User-{}, but was given an error that they already have it.'.format(badge_id, user_id))
-			return redirect(url_for('main.admin_assign_badge'))
+		return redirect(url_for('main.admin_assign_badge'))
 
 @main.route('/admin/upload_badges', methods=['GET', 'POST'])
 @login_required
@@ -286,6 +272,25 @@ def view_logs():
 	else:
 		abort(403)
 	
+@main.route('/admin/query_profile')
+@login_required
+def view_query_profile():
+	if current_user.is_admin == 1:
+		endpoint_stats = get_endpoint_stats()
+		return render_template('admin_query_profile.html', endpoint_stats=endpoint_stats, profiler_enabled=current_app.config['QUERY_PROFILER'], slow_ms=current_app.config['QUERY_PROFILER_SLOW_MS'], max_statements=current_app.config['QUERY_PROFILER_MAX_STATEMENTS'])
+	else:
+		abort(403)
+
+@main.route('/admin/query_profile/reset')
+@login_required
+def reset_query_profile():
+	if current_user.is_admin == 1:
+		reset_endpoint_stats()
+		flash('Query profile counters have been reset for this worker.', 'success')
+		return redirect(url_for('main.view_query_profile'))
+	else:
+		abort(403)
+
 @main.route('/admin/assign_regional_focal_point', methods=['GET', 'POST'])
 @login_required
 def assign_regional_focal_point():
@@ -325,63 +330,66 @@ def assign_regional_focal_point():
 
 	return render_template('admin_assign_regional_focal_point.html', form=form)
 
-@main.route('/badge_assignment/<int:user_id>/<int:badge_id>')
+@main.route('/badge_assignment/bulk', methods=['POST'])
 @login_required
-def badge_assignment(user_id, badge_id):
+def badge_assignment_bulk():
+	"""
+	Awards one badge to many members in a single statement. Takes badge_id, user_ids, assigner_justify and, for SIMS Remote Coordinators, dis_id, either as a JSON object or as form fields (user_ids repeated); malformed input is a 400 and an unknown badge or member a 404. Admins can award any badge to anyone; a SIMS Remote Coordinator can only award it to the active Remote IM Supporters on their emergency. Returns the ids that received the badge and the ids that already had it.
+	"""
+	if request.is_json:
+		data = request.get_json(silent=True)
+		if not isinstance(data, dict):
+			return jsonify({'error': 'Request body must be a JSON object'}), 400
+		user_ids = data.get('user_ids')
+	else:
+		data = request.form
+		user_ids = request.form.getlist('user_ids')
+	if not isinstance(user_ids, list) or not user_ids:
+		return jsonify({'error': 'user_ids must be a non-empty list of member ids'}), 400
+	try:
+		badge_id = int(data.get('badge_id'))
+		user_ids = sorted(set(int(user_id) for user_id in user_ids))
+		dis_id = int(data['dis_id']) if data.get('dis_id') else None
+	except (TypeError, ValueError):
+		return jsonify({'error': 'badge_id, user_ids and dis_id must be integers'}), 400
+	assigner_justify = data.get('assigner_justify')
+	if not isinstance(assigner_justify, str) or not assigner_justify.strip():
+		return jsonify({'error': 'assigner_justify is required'}), 400
+	
+	if db.session.query(Badge.id).filter(Badge.id == badge_id).scalar() is None:
+		return jsonify({'error': 'Badge not found', 'badge_id': badge_id}), 404
+	unknown_ids = sorted(set(user_ids) - {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(user_ids))})
+	if unknown_ids:
+		return jsonify({'error': 'Members not found', 'user_ids': unknown_ids}), 404
+	
 	if current_user.is_admin == 1:
-		new_badge = user_badge.insert().values(user_id=user_id, badge_id=badge_id, assigner_id=current_user.id, assigner_justify=session.get('assigner_justify', None))
-		db.session.execute(new_badge)
-		db.session.commit()
-		
-		# try sending slack message alerting user to the new badge
-		try:
-			user_info = db.session.query(User).filter(User.id == user_id).first()
-			assigner_info = db.session.query(User).filter(User.id == current_user.id).first()
-			badge_info = db.session.query(Badge).filter(Badge.id == badge_id).first()
-			assigner_justify = session.get('assigner_justify', None)
-			message = 'Hi {}, you have been assigned a new badge on the SIMS Portal! {} has given you the {} badge with the following message: {}'.format(user_info.firstname, assigner_info.fullname, badge_info.name, assigner_justify)
-			user = user_info.slack_id
-			send_slack_dm(message, user)
-		except:
-			pass
-		flash('Badge successfully assigned.', 'success')
-		return redirect(url_for('main.admin_assign_badge'))
+		eligible_ids = user_ids
+	elif dis_id is not None and check_sims_co(dis_id):
+		eligible_ids = eligible_badge_recipients(dis_id, user_ids)
 	else:
-		list_of_admins = db.session.query(User).filter(User.is_admin==True).all()
-		return render_template('errors/403.html', list_of_admins=list_of_admins), 403
-
-# route for sims remote coordinator users assigning badges
-@main.route('/badge_assignment/<int:user_id>/<int:badge_id>/<int:assigner_id>/<int:dis_id>')
-@login_required
-def badge_assignment_via_SIMSCO(user_id, badge_id, assigner_id, dis_id):
-	user_is_sims_co = check_sims_co(dis_id)
-	badge_form = BadgeAssignmentViaSIMSCoForm()
-	if user_is_sims_co:
-		assigner_justify = badge_form.assigner_justify.data
-		# uses session to get assigner_justify from form
-		new_badge = user_badge.insert().values(user_id=user_id, badge_id=badge_id, assigner_id=assigner_id, assigner_justify=session.get('assigner_justify', None))
-		db.session.execute(new_badge)
+		return jsonify({'error': 'Not authorized to assign badges'}), 403
+	
+	ineligible_ids = sorted(set(user_ids) - set(eligible_ids))
+	if ineligible_ids:
+		return jsonify({'error': 'Not authorized to assign badges to these members', 'user_ids': ineligible_ids}), 403
+	
+	try:
+		awarded_ids = assign_badge(badge_id, user_ids, current_user.id, assigner_justify.strip())
+		log_message = f"[INFO] User {current_user.id} awarded Badge-{badge_id} to {len(awarded_ids)} member(s): {', '.join(str(user_id) for user_id in awarded_ids)}."
+		db.session.add(Log(message=log_message[:500], user_id=current_user.id))
 		db.session.commit()
-		try:
-			assigner = db.session.query(User).filter(User.id == assigner_id).first()
-			receiver = db.session.query(User).filter(User.id == user_id).first()
-			badge = db.session.query(Badge).filter(Badge.id == badge_id).first()
-			message = 'Hi {}, you have been assigned a new badge on the SIMS Portal! {} has given you the {} badge with the following message: {}'.format(receiver.firstname, assigner.fullname, badge.name, session.get('assigner_justify', None))
-			user = db.session.query(User).filter(User.id == user_id).first()
-			send_slack_dm(message, user.slack_id)
-		except Exception as e:
-			current_app.logger.error('Badge Assignment via SIMS Remote Coordinator Failed: {}'.format(e))
-		current_app.logger.info('A new badge has been assigned to User-{}'.format(receiver.id))
-		flash('Badge successfully assigned.', 'success')
-		return redirect(url_for('main.badge_assignment_sims_co', dis_id=dis_id))
-	elif user_is_sims_co == False:
-		list_of_admins = db.session.query(User).filter(User.is_admin==True).all()
-		return render_template('errors/403.html', list_of_admins=list_of_admins), 403
+	except SQLAlchemyError as e:
+		db.session.rollback()
+		current_app.logger.error('Could not award Badge-{} to {} member(s): {}'.format(badge_id, len(user_ids), e))
+		return jsonify({'error': 'Could not assign the badge'}), 500
+	
+	return jsonify({'awarded': awarded_ids, 'already_held': sorted(set(user_ids) - set(awarded_ids))})
 
 @main.route('/badge_assignment_simsco/<int:dis_id>', methods=['GET', 'POST'])
 @login_required
 def badge_assignment_sims_co(dis_id):
 	badge_form = BadgeAssignmentViaSIMSCoForm()
+	badge_form.user_name.scope = {'im_support_on': dis_id}
 	
 	event_name = db.session.query(Emergency).filter(Emergency.id == dis_id).first()
 	
@@ -395,32 +403,21 @@ def badge_assignment_sims_co(dis_id):
 	user_is_sims_co = check_sims_co(dis_id)
 	
 	if request.method == 'GET' and user_is_sims_co == True:
-		query = User.query.join(Assignment, Assignment.user_id == User.id).join(Emergency, Emergency.id == Assignment.emergency_id).filter(Emergency.id == dis_id, Assignment.role == 'Remote IM Support', Assignment.assignment_status == 'Active')
-		badge_form.user_name.query = query
 		return render_template('emergency_badge_assignment.html', title='Assign Badges', user_is_sims_co=user_is_sims_co, assigned_members=assigned_members, event_name=event_name, badge_form=badge_form, assigned_badges=assigned_badges)
 	elif request.method == 'POST' and user_is_sims_co == True:
-		user_id = badge_form.user_name.data.id
-		badge_id = badge_form.badge_name.data.id
-		# use flask session to pass 'assigner_justify' field data without passing through URL
-		session['assigner_justify'] = badge_form.assigner_justify.data
-		
-		# get all badges assigned to the user which sims co is trying to assign
-		users_badges = db.engine.execute('SELECT u.id, user_badge.user_id, user_badge.badge_id FROM public.user u JOIN user_badge ON user_badge.user_id = u.id WHERE u.id = {}'.format(user_id))
-		users_badges_ids = []
-		for badge in users_badges:
-			users_badges_ids.append(badge.badge_id)
-		
 		if badge_form.validate_on_submit():
-			# check that user does not already have the badge
-			if badge_id not in users_badges_ids:
-				# pass to assignment route for database interaction
-				return redirect(url_for('main.badge_assignment_via_SIMSCO', user_id=user_id, badge_id=badge_id, assigner_id=current_user.id, dis_id=dis_id))
+			user_id = badge_form.user_name.data.id
+			badge_id = badge_form.badge_name.data.id
+			if not eligible_badge_recipients(dis_id, [user_id]):
+				flash('Badges can only be assigned to active Remote IM Supporters on this emergency.', 'danger')
+			elif assign_badge(badge_id, [user_id], current_user.id, badge_form.assigner_justify.data):
+				current_app.logger.info('A new badge has been assigned to User-{}'.format(user_id))
+				flash('Badge successfully assigned.', 'success')
 			else:
 				flash('Cannot add badge - user already has it.', 'danger')
-				return redirect(url_for('main.badge_assignment_sims_co', dis_id=dis_id))
 		else:
 			flash('Please fill out all sections of the form.', 'warning')
-			return redirect(url_for('main.badge_assignment_sims_co', dis_id=dis_id))
+		return redirect(url_for('main.badge_assignment_sims_co', dis_id=dis_id))
 	else:
 		list_of_admins = db.session.query(User).filter(User.is_admin==True).all()
 		print('User {} tried to assign a badge but was denied and given a 403 error.'.format(current_user.fullname))
@@ -443,40 +440,19 @@ def resources_slack_channels():
 @main.route('/dashboard')
 @login_required
 def dashboard():
-	active_emergencies = db.session.query(Emergency, NationalSociety, EmergencyType).join(NationalSociety, NationalSociety.ns_go_id == Emergency.emergency_location_id).join(EmergencyType, EmergencyType.emergency_type_go_id == Emergency.emergency_type_id).filter(Emergency.emergency_status == 'Active').all()
-	
-	count_active_emergencies = db.session.query(Emergency, NationalSociety, EmergencyType).join(NationalSociety, NationalSociety.ns_go_id == Emergency.emergency_location_id).join(EmergencyType, EmergencyType.emergency_type_go_id == Emergency.emergency_type_id).filter(Emergency.emergency_status == 'Active').count()
-	
-	regional_im_leads = db.session.query(RegionalFocalPoint, Region, User).join(Region, Region.id == RegionalFocalPoint.regional_id).join(User, User.id == RegionalFocalPoint.focal_point_id).all()
-	
-	todays_date = datetime.today()
+	snapshot = get_dashboard_snapshot()
 	
-	assignments_by_emergency = db.engine.execute("SELECT emergency_name, COUNT(*) as count_assignments FROM emergency JOIN assignment ON assignment.emergency_id = emergency.id WHERE assignment.assignment_status <> 'Removed' GROUP BY emergency_name")
-	data_dict_assignments = [x._asdict() for x in assignments_by_emergency]
-	labels_for_assignment = [row['emergency_name'] for row in data_dict_assignments]
-	values_for_assignment = [row['count_assignments'] for row in data_dict_assignments]
+	# user approvals aren't part of the snapshot, and only admins see the banner
+	count_pending_users = db.session.query(User.id).filter(User.status == 'Pending').count() if current_user.is_admin == 1 else 0
 	
-	pending_user_check = db.session.query(User).filter(User.status == 'Pending').all()
-	
-	products_by_emergency = db.engine.execute("SELECT emergency_name , COUNT(*) as count_products FROM emergency JOIN portfolio ON portfolio.emergency_id = emergency.id WHERE portfolio.product_status <> 'Removed' GROUP BY emergency_name")
-	data_dict_products = [y._asdict() for y in products_by_emergency]
-	labels_for_product = [row['emergency_name'] for row in data_dict_products]
-	values_for_product = [row['count_products'] for row in data_dict_products]
-	
-	count_active_assignments = db.session.query(Assignment, User, Emergency).join(User, User.id==Assignment.user_id).join(Emergency, Emergency.id==Assignment.emergency_id).filter(Assignment.assignment_status=='Active', Assignment.end_date>todays_date).count()
-	active_assignments = db.session.query(Assignment, User, Emergency, NationalSociety).join(User, User.id==Assignment.user_id).join(Emergency, Emergency.id==Assignment.emergency_id).join(NationalSociety, NationalSociety.ns_go_id == User.ns_id).filter(Assignment.assignment_status=='Active', Assignment.role != 'Remote IM Support', Assignment.end_date>todays_date).order_by(Emergency.emergency_name, Assignment.end_date).all()
-
-	most_recent_emergencies = db.session.query(Emergency).order_by(Emergency.created_at.desc()).limit(7).all()
-	most_recent_members = db.session.query(User, NationalSociety).join(NationalSociety, NationalSociety.ns_go_id == User.ns_id).filter(User.status == 'Active').order_by(User.created_at.desc()).limit(7).all()
-	
-	surge_alerts = db.session.query(Alert).filter(Alert.im_filter==True).all()
-	
-	return render_template('dashboard.html', active_assignments=active_assignments, count_active_assignments=count_active_assignments, most_recent_emergencies=most_recent_emergencies, labels_for_assignment=labels_for_assignment, values_for_assignment=values_for_assignment, labels_for_product=labels_for_product, values_for_product=values_for_product, most_recent_members=most_recent_members, pending_user_check=pending_user_check, active_emergencies=active_emergencies, count_active_emergencies=count_active_emergencies,surge_alerts=surge_alerts, regional_im_leads=regional_im_leads)
+	return render_template('dashboard.html', active_assignments=snapshot['active_assignments'], count_active_assignments=snapshot['count_active_assignments'], labels_for_assignment=snapshot['labels_for_assignment'], values_for_assignment=snapshot['values_for_assignment'], labels_for_product=snapshot['labels_for_product'], values_for_product=snapshot['values_for_product'], count_pending_users=count_pending_users, active_emergencies=snapshot['active_emergencies'], count_active_emergencies=snapshot['count_active_emergencies'], surge_alerts=snapshot['surge_alerts'], regional_im_leads=snapshot['regional_im_leads'])
 
 @main.route('/role_profile/<type>')
 def view_role_profile(type):
-	capitalized_type = type.capitalize()
-	users_with_profile = db.engine.execute('SELECT "user".id, firstname, lastname, max(tier) as tier, image_file FROM "user" JOIN user_profile ON "user".id = user_profile.user_id JOIN profile ON profile.id = user_profile.profile_id WHERE image = \'{}\' GROUP BY "user".id'.format(capitalized_type))
+	if type not in ROLE_PROFILE_TYPES:
+		abort(404)
+	tier_column = getattr(UserStats, 'tier_' + type)
+	users_with_profile = db.session.query(User.id, User.firstname, User.lastname, User.image_file, tier_column.label('tier')).join(UserStats, UserStats.user_id == User.id).filter(tier_column.isnot(None)).all()
 	
 	users_with_profile_tier_1 = []
 	users_with_profile_tier_2 = []
@@ -492,31 +468,55 @@ def view_role_profile(type):
 		elif user.tier == 4:
 			users_with_profile_tier_4.append(user)
 	
-	count_users_with_profile = db.engine.execute('SELECT count(distinct("user".id)) as count FROM "user" JOIN user_profile ON "user".id = user_profile.user_id JOIN profile ON profile.id = user_profile.profile_id WHERE image = \'{}\''.format(capitalized_type))
-	unpacked_count = [x.count for x in count_users_with_profile][0]
+	unpacked_count = len(users_with_profile)
 	
 	return render_template('role_profile_{}.html'.format(type), users_with_profile_tier_1=users_with_profile_tier_1, users_with_profile_tier_2=users_with_profile_tier_2, users_with_profile_tier_3=users_with_profile_tier_3, users_with_profile_tier_4=users_with_profile_tier_4, unpacked_count=unpacked_count)
 
 @main.route('/manual_refresh')
 @login_required
 def manual_refresh_landing():
-	badge_refresh_list = ['big_wig', 'maiden_voyage', 'self_promoter', 'polyglot', 'autobiographer', 'jack_of_all_trades','edward_tufte', 'world_traveler','old_salt']
-	sorted_badge_refresh_list = sorted(badge_refresh_list)
 	if current_user.is_admin == 1:
-		return render_template('admin_manual_refresh.html', sorted_badge_refresh_list=sorted_badge_refresh_list)
+		maintenance_tasks = [task for task in MANUAL_TASKS if not task.get('badge')]
+		sorted_badge_refresh_list = sorted(task['name'] for task in MANUAL_TASKS if task.get('badge'))
+		recent_job_runs = [job_run_dict(job_run) for job_run in JobRun.query.order_by(JobRun.id.desc()).limit(25)]
+		return render_template('admin_manual_refresh.html', sorted_badge_refresh_list=sorted_badge_refresh_list, maintenance_tasks=maintenance_tasks, recent_job_runs=recent_job_runs)
+	else:
+		list_of_admins = db.session.query(User).filter(User.is_admin == 1).all()
+		return render_template('errors/403.html', list_of_admins=list_of_admins), 403
 
 @main.route('/manual_refresh/<func>')
 @login_required
 def manual_refresh(func):
 	if current_user.is_admin == 1:
-		badge_refresh_list = ['big_wig', 'maiden_voyage', 'self_promoter', 'polyglot', 'autobiographer', 'jack_of_all_trades','edward_tufte', 'world_traveler','old_salt']
-		if func in badge_refresh_list:
-			function_constructor = 'auto_badge_assigner_' + func + '()'
+		if func not in MANUAL_TASKS_BY_NAME:
+			abort(404)
+		job_run_id = submit_manual_task(func, current_user.id)
+		current_app.logger.info('User-{} queued the {} function manually as job {}.'.format(current_user.id, func, job_run_id))
+		if request.accept_mimetypes.best == 'application/json':
+			return jsonify({'job_run_id': job_run_id, 'status_url': url_for('main.manual_refresh_status', job_run_id=job_run_id)}), 202
+		flash('{} has been queued as job {}. Its progress is shown below.'.format(func, job_run_id), 'success')
+		return redirect(url_for('main.manual_refresh_landing'))
+	else:
+		list_of_admins = db.session.query(User).filter(User.is_admin == 1).all()
+		return render_template('errors/403.html', list_of_admins=list_of_admins), 403
+
+@main.route('/manual_refresh/jobs/<int:job_run_id>')
+@login_required
+def manual_refresh_status(job_run_id):
+	if current_user.is_admin == 1:
+		return jsonify(job_run_dict(JobRun.query.get_or_404(job_run_id)))
+	else:
+		return jsonify({'error': 'Only administrators can view job progress'}), 403
+
+@main.route('/manual_refresh/jobs/<int:job_run_id>/cancel', methods=['POST'])
+@login_required
+def manual_refresh_cancel(job_run_id):
+	if current_user.is_admin == 1:
+		if cancel_job_run(job_run_id):
+			current_app.logger.info('User-{} cancelled job {}.'.format(current_user.id, job_run_id))
+			flash('Job {} has been asked to stop.'.format(job_run_id), 'success')
 		else:
-			function_constructor = func + '()'
-		eval(function_constructor)
-		current_app.logger.info('User-{} ran the {} function manually.'.format(current_user.id, func))
-		flash('{} function ran successfully.'.format(func), 'success')
+			flash('Job {} has already finished.'.format(job_run_id), 'warning')
 		return redirect(url_for('main.manual_refresh_landing'))
 	else:
 		list_of_admins = db.session.query(User).filter(User.is_admin == 1).all()
@@ -525,7 +525,11 @@ def manual_refresh(func):
 @main.route('/staging')
 def staging():
 	if current_user.is_admin == 1:
-		refresh_surge_alerts_latest()
+		try:
+			refresh_surge_alerts_latest()
+		except Exception:
+			# already logged and sent to Slack by refresh_surge_alerts_latest()
+			flash('Could not refresh the surge alerts, see the logs.', 'danger')
 		return render_template('visualization.html')
 	else:
 		current_app.logger.warning('User-{}, a non-administrator, tried to access the staging area'.format(current_user.id))
@@ -556,6 +560,41 @@ def get_ns_member_location_data():
 	
 	return jsonify(location_data)
 	
+@main.route('/api/typeahead/<source>', methods=['GET'])
+def api_typeahead(source):
+	"""
+	Options for the member, emergency and country pickers (RemoteSelectField in main/fields.py)
+
+	URL: /api/typeahead/<source>?q=<query>&page=<n>&<scope>=<id>
+
+	Method: GET
+
+	Parameters:
+		source (str): One of users, emergencies or national_societies. Only national_societies can be read without logging in, as the registration form uses it.
+		q (str): Optional, every word has to start the name (or a word of it). Lists everything when empty.
+		page (int): Optional page number, starting at 1. Pages hold TYPEAHEAD_PER_PAGE options.
+		<scope> (int): Optional, one of the source's scopes in TYPEAHEAD_SOURCES, e.g. users?im_support_on=<emergency id> for the active Remote IM Supporters on that emergency.
+
+	Returns:
+		{'results': [{'id': <option value>, 'text': <label>}, ...], 'page': <n>, 'more': <bool>}
+	"""
+	if source not in TYPEAHEAD_SOURCES:
+		return jsonify({'error': 'source must be one of {}'.format(', '.join(TYPEAHEAD_SOURCES))}), 404
+	if TYPEAHEAD_SOURCES[source]['login_required'] and not current_user.is_authenticated:
+		return jsonify({'error': 'Login required'}), 401
+
+	page = request.args.get('page', '1')
+	if not page.isdigit() or int(page) < 1:
+		return jsonify({'error': 'page must be a positive integer'}), 400
+	page = int(page)
+
+	scope = {name: request.args[name] for name in TYPEAHEAD_SOURCES[source].get('scopes', {}) if name in request.args}
+	if not all(value.isdigit() for value in scope.values()):
+		return jsonify({'error': '{} must be integers'.format(', '.join(scope))}), 400
+
+	results, more = typeahead_page(source, request.args.get('q', '').strip(), page, current_app.config['TYPEAHEAD_PER_PAGE'], scope)
+	return jsonify({'results': results, 'page': page, 'more': more})
+
 @main.route('/national_societies/<int:ns_id>')
 @login_required
 def view_national_society(ns_id):
@@ -573,17 +612,10 @@ def view_national_society(ns_id):
 
 @main.route('/uploads/<path:name>')
 def download_file(name):
-    s3 = boto3.resource('s3')
-    file_stream = io.BytesIO()
-    s3_object = s3.Object(current_app.config['UPLOAD_BUCKET'], name)
-    try:
-        s3_object.download_fileobj(file_stream)
-    except botocore.exceptions.ClientError as e:
-        current_app.logger.error(e)
-        abort(404)
-    file_stream.seek(0)
-	
-    return send_file(file_stream, mimetype=s3_object.content_type)
+	response = s3_object_response(name)
+	if response is None:
+		abort(404)
+	return response
 
 @main.route('/static/<path:filename>')
 def static_files(filename):
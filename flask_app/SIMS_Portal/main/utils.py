@@ -1,25 +1,145 @@
-from flask import url_for, current_app, jsonify
+from flask import url_for, current_app, jsonify, request, Response, stream_with_context, redirect
+import hashlib
+import json
 import logging
 import os
+import threading
+import time
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
-from SIMS_Portal.models import Emergency, NationalSociety, User, Assignment, user_badge, user_skill, user_language, user_profile, Skill, Language, Profile, Portfolio
+from SIMS_Portal.models import Emergency, NationalSociety, User, Assignment, user_badge, user_skill, user_language, user_profile, Skill, Language, Profile, Portfolio, Log, EmergencyType, Alert, RegionalFocalPoint, Region, Badge
 from SIMS_Portal import db
+from SIMS_Portal.caching.utils import get_or_build, get_tag_versions, add_pending_tags
+from SIMS_Portal.notifications.utils import enqueue_slack_message
 from flask_login import current_user
 import boto3
-from sqlalchemy import func, String, distinct, desc, asc, select, text
+import botocore
+from sqlalchemy import func, String, distinct, desc, asc, select, text, event, inspect
+from datetime import datetime
 from sqlalchemy.orm import aliased
 import requests
 
 def send_error_message(message):
-	client = WebClient(token = current_app.config['SIMS_PORTAL_SLACK_BOT'])
+	enqueue_slack_message('C046A8T9ZJB', message)
+
+def make_etag(*parts):
+	"""
+	Builds an ETag from whatever identifies the current state of a response (row counts, max ids, updated_at watermarks, query parameters).
+	"""
+	return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+def not_modified(etag, last_modified=None):
+	"""
+	Returns an empty 304 response if the client already holds this ETag, otherwise None. last_modified is only echoed on the 304. If-Modified-Since alone never gets a 304: a max(updated_at) watermark doesn't move when a row is deleted, so only the ETag (which also covers row counts) can tell that nothing changed.
+	"""
+	if request.if_none_match and etag in request.if_none_match:
+		response = Response(status=304)
+		response.set_etag(etag)
+		if last_modified:
+			response.last_modified = last_modified
+		return response
+	return None
+
+def get_keyset_args(max_limit):
+	"""
+	Reads the limit and after parameters used by keyset-paginated API endpoints. Both are optional; limit is capped at max_limit. Raises ValueError if either isn't a positive integer.
+	"""
+	limit = request.args.get('limit', type=int)
+	after = request.args.get('after', type=int)
+	if 'limit' in request.args and (limit is None or limit < 1):
+		raise ValueError('limit must be a positive integer')
+	if 'after' in request.args and (after is None or after < 0):
+		raise ValueError('after must be a non-negative integer')
+	if limit is not None:
+		limit = min(limit, max_limit)
+	return limit, after
+
+def ndjson_response(rows):
+	"""
+	Streams an iterable of dicts as newline-delimited JSON, one object per line, so large exports never sit in memory all at once.
+	"""
+	def generate():
+		for row in rows:
+			yield json.dumps(row, default=str) + '\n'
+	return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client():
+	"""
+	Returns this process's boto3 S3 client, created on first use. Clients are thread-safe, and building one costs more than serving a small upload.
+	"""
+	global _s3_client
+	with _s3_client_lock:
+		if _s3_client is None:
+			_s3_client = boto3.client('s3', endpoint_url=current_app.config['S3_ENDPOINT_URL'])
+	return _s3_client
+
+def s3_object_response(key):
+	"""
+	Serves an object from UPLOAD_BUCKET without holding it in memory. The S3 body is passed on in UPLOAD_STREAM_CHUNK_BYTES chunks as the client reads it.
+
+	A single Range plus If-None-Match or If-Modified-Since are forwarded to S3. So 206, 304 and 416 responses come from S3's own checks, and the ETag and Last-Modified served are S3's. Objects of UPLOAD_PRESIGNED_REDIRECT_BYTES or more aren't proxied; the client is redirected to a presigned URL valid for UPLOAD_PRESIGNED_URL_SECONDS instead. Returns None if the object can't be found.
+	"""
+	config = current_app.config
+	s3 = get_s3_client()
+	params = {'Bucket': config['UPLOAD_BUCKET'], 'Key': key}
+	# honouring If-Range would need the current ETag first; sending the whole object instead is allowed by the spec
+	if request.range and len(request.range.ranges) == 1 and 'If-Range' not in request.headers:
+		params['Range'] = request.range.to_header()
+	if request.if_none_match:
+		params['IfNoneMatch'] = request.headers['If-None-Match']
+	elif request.if_modified_since:
+		params['IfModifiedSince'] = request.if_modified_since
+	
 	try:
-		result = client.chat_postMessage(
-			channel = 'C046A8T9ZJB',
-			text = message
-		)
-	except Exception as e:
-		current_app.logger.error('new_acronym_alert Slack message failed: {}'.format(e))
+		s3_object = s3.get_object(**params)
+	except botocore.exceptions.ClientError as e:
+		status = e.response['ResponseMetadata']['HTTPStatusCode']
+		if status == 304:
+			response = Response(status=304)
+			s3_headers = e.response['ResponseMetadata'].get('HTTPHeaders', {})
+			if s3_headers.get('etag'):
+				response.headers['ETag'] = s3_headers['etag']
+			if s3_headers.get('last-modified'):
+				response.headers['Last-Modified'] = s3_headers['last-modified']
+			return response
+		if status == 416:
+			response = Response(status=416)
+			if e.response['Error'].get('ActualObjectSize'):
+				response.headers['Content-Range'] = 'bytes */{}'.format(e.response['Error']['ActualObjectSize'])
+			return response
+		if status not in (403, 404):
+			current_app.logger.error('s3_object_response failed for {}: {}'.format(key, e))
+		return None
+	
+	if 'ContentRange' in s3_object:
+		total_size = int(s3_object['ContentRange'].rsplit('/', 1)[1])
+	else:
+		total_size = s3_object['ContentLength']
+	if config['UPLOAD_PRESIGNED_REDIRECT_BYTES'] and total_size >= config['UPLOAD_PRESIGNED_REDIRECT_BYTES']:
+		s3_object['Body'].close()
+		presigned_url = s3.generate_presigned_url('get_object', Params={'Bucket': config['UPLOAD_BUCKET'], 'Key': key}, ExpiresIn=config['UPLOAD_PRESIGNED_URL_SECONDS'])
+		return redirect(presigned_url, code=302)
+	
+	body = s3_object['Body']
+	response = Response(
+		body.iter_chunks(config['UPLOAD_STREAM_CHUNK_BYTES']),
+		status=206 if 'ContentRange' in s3_object else 200,
+		content_type=s3_object.get('ContentType') or 'application/octet-stream',
+		direct_passthrough=True
+	)
+	response.content_length = s3_object['ContentLength']
+	response.headers['Accept-Ranges'] = 'bytes'
+	if 'ContentRange' in s3_object:
+		response.headers['Content-Range'] = s3_object['ContentRange']
+	response.headers['ETag'] = s3_object['ETag']
+	response.last_modified = s3_object['LastModified']
+	if s3_object.get('CacheControl'):
+		response.headers['Cache-Control'] = s3_object['CacheControl']
+	response.call_on_close(body.close)
+	return response
 
 def user_info_by_ns(ns_id):
 	query_text = text(
@@ -55,6 +175,45 @@ def get_ns_list():
 	
 	return ns_list
 
+# the navbar's national society list only changes when a member joins, moves NS or changes status, or an NS is edited
+NS_LIST_TAGS = ['ns_list', 'user:*', 'nationalsociety']
+
+# this worker's copy of get_ns_list() and the tag versions it was built against
+_ns_list_snapshot = {'versions': None, 'rows': []}
+
+def get_ns_list_snapshot():
+	"""
+	Returns get_ns_list() from an in-process copy, re-running the query only when one of NS_LIST_TAGS has been invalidated by any worker since the copy was made.
+	"""
+	versions = get_tag_versions(NS_LIST_TAGS)
+	if versions != _ns_list_snapshot['versions']:
+		_ns_list_snapshot['rows'] = [tuple(row) for row in get_ns_list()]
+		_ns_list_snapshot['versions'] = versions
+	return _ns_list_snapshot['rows']
+
+class LazyNSList:
+	"""
+	Handed to every template by the context processor; the snapshot is only looked up if the template actually iterates over it.
+	"""
+	def __iter__(self):
+		return iter(get_ns_list_snapshot())
+	
+	def __len__(self):
+		return len(get_ns_list_snapshot())
+
+def _note_ns_list_changes(session, flush_context, instances):
+	for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+		if not isinstance(instance, User):
+			continue
+		state = inspect(instance)
+		if instance in session.new or instance in session.deleted or state.attrs.ns_id.history.has_changes() or state.attrs.status.history.has_changes():
+			add_pending_tags(session, 'ns_list')
+			return
+
+def register_ns_list_invalidation():
+	# before_flush, while attribute history still shows what the flush is about to write
+	event.listen(db.session, 'before_flush', _note_ns_list_changes)
+
 def heartbeats(name, url):
 	"""
 	fires off GET requests to betterstack/logtail to serve as heartbeats for cron job monitoring
@@ -146,274 +305,163 @@ def save_new_badge(file, name):
 
 	return file_path
 
-def auto_badge_assigner_maiden_voyage():
+# each automatic badge is a predicate over user_stats; add a row here to add a new auto-assigned badge
+BADGE_RULES = [
+	{'name': 'maiden_voyage', 'badge_id': 3, 'predicate': 'count_assignments >= 1'},
+	{'name': 'big_wig', 'badge_id': 20, 'predicate': 'count_assignments >= 5'},
+	{'name': 'self_promoter', 'badge_id': 4, 'predicate': 'count_skills >= 1'},
+	{'name': 'polyglot', 'badge_id': 1, 'predicate': 'count_languages > 1'},
+	{'name': 'autobiographer', 'badge_id': 21, 'predicate': 'bio_length > 500'},
+	{'name': 'jack_of_all_trades', 'badge_id': 22, 'predicate': 'count_profiles > 5'},
+	{'name': 'edward_tufte', 'badge_id': 31, 'predicate': 'count_infographics >= 5'},
+	{'name': 'world_traveler', 'badge_id': 5, 'predicate': 'count_countries > 4'},
+	{'name': 'old_salt', 'badge_id': 25, 'predicate': 'count_remote_coordinator > 2'},
+]
+
+def add_badge_cache_tags(user_ids):
+	# the user_badge inserts below are raw SQL, which the cache's flush listeners never see
+	if user_ids:
+		add_pending_tags(db.session, 'user_badge', 'user_badge:*', *['user:{}'.format(user_id) for user_id in user_ids])
+
+def award_auto_badges(rule_names=None):
 	"""
-	Checks for users that have at least one remote support assignment and assigns the Maiden Voyage badge if they don't already have it.
+	Awards every automatic badge that a user qualifies for but doesn't hold yet. Each selected rule in BADGE_RULES (all of them by default) is one set-based INSERT ... SELECT ... ON CONFLICT DO NOTHING over the user_stats table, timed on its own, and every rule's statement runs in the same transaction, so a run costs one pass over user_stats per badge rather than a query per member. Returns a dict of badge name to number of badges awarded, and logs the counts and time per badge. A failed statement rolls back every rule and is re-raised, so the job run is marked Failed.
 	"""
-	current_app.logger.info('Maiden Voyage Auto-Assign Ran')
+	rules = [rule for rule in BADGE_RULES if rule_names is None or rule['name'] in rule_names]
+	awarded = {rule['name']: 0 for rule in rules}
+	elapsed_ms = {rule['name']: 0.0 for rule in rules}
+	if not rules:
+		return awarded
+	
+	assigner_justify = 'Badge automatically assigned by SIMS Portal bot.'
 	try:
-		remote_assignment_counts = db.session.query(
-			User.id.label('user_id'),
-			User.firstname,
-			User.lastname,
-			func.count(Assignment.id).label('count_assignments')
-		).join(
-			Assignment, Assignment.user_id == User.id
-		).filter(
-			Assignment.assignment_status != 'Removed'
-		).group_by(
-			User.id
-		).all()
-		
-		existing_maiden_voyage_badges = db.engine.execute("SELECT user_id, badge_id FROM public.user_badge WHERE badge_id = 3")
-		
-		list_user_ids_with_maiden_voyage = []
-		for user in existing_maiden_voyage_badges:
-			list_user_ids_with_maiden_voyage.append(user.user_id)	
-		
-		for user in remote_assignment_counts:
-			if user.count_assignments >= 1 and user.user_id not in list_user_ids_with_maiden_voyage:
-				new_badge = "INSERT INTO user_badge (user_id, badge_id, assigner_id, assigner_justify) VALUES ({}, 3, 0, 'Badge automatically assigned by SIMS Portal bot.')".format(user.user_id)
-				db.session.execute(new_badge)
+		for rule in rules:
+			award_query = text(
+				"""
+				INSERT INTO user_badge (user_id, badge_id, assigner_id, assigner_justify)
+				SELECT user_id, :badge_id, 0, :assigner_justify
+				FROM user_stats
+				WHERE {}
+				ON CONFLICT (user_id, badge_id) DO NOTHING
+				RETURNING user_id
+				""".format(rule['predicate'])
+			)
+			started = time.perf_counter()
+			awarded_ids = [row.user_id for row in db.session.execute(award_query, {'badge_id': rule['badge_id'], 'assigner_justify': assigner_justify})]
+			elapsed_ms[rule['name']] = (time.perf_counter() - started) * 1000
+			awarded[rule['name']] = len(awarded_ids)
+			add_badge_cache_tags(awarded_ids)
 		db.session.commit()
 	except Exception as e:
-		current_app.logger.error('Maiden Voyage Auto-Assign Failed: {}'.format(e))
+		db.session.rollback()
+		current_app.logger.error('Auto badge assignment failed for {}: {}'.format(', '.join(awarded), e))
+		raise
 	
-def auto_badge_assigner_big_wig():
-	"""
-	Checks for users that have 5 or more remote support assignments and assigns the Big Wig badge if they don't already have it.
-	"""
-	current_app.logger.info('Big Wig Auto-Assign Ran')
-	try:
-		remote_assignment_counts = db.session.query(
-			User.id.label('user_id'),
-			User.firstname,
-			User.lastname,
-			func.count(Assignment.id).label('count_assignments')
-		).join(
-			Assignment, Assignment.user_id == User.id
-		).filter(
-			Assignment.assignment_status != 'Removed'
-		).group_by(
-			User.id
-		).all()
-		
-		existing_big_wig_badges = db.engine.execute("SELECT user_id, badge_id FROM public.user_badge WHERE badge_id = 20")
+	summary = ', '.join('{} {} in {:.0f} ms'.format(name, awarded[name], elapsed_ms[name]) for name in awarded)
+	log_message = f"[INFO] Auto badge assignment awarded {sum(awarded.values())} badge(s) in {sum(elapsed_ms.values()):.0f} ms ({summary})."
+	current_app.logger.info(log_message)
+	db.session.add(Log(message=log_message, user_id=0))
+	db.session.commit()
 	
-		list_user_ids_with_big_wig = []
-		for user in existing_big_wig_badges:
-			list_user_ids_with_big_wig.append(user.user_id)	
-		
-		for user in remote_assignment_counts:
-			if user.count_assignments >= 5 and user.user_id not in list_user_ids_with_big_wig:
-				new_badge = "INSERT INTO user_badge (user_id, badge_id, assigner_id, assigner_justify) VALUES ({}, 20, 0, 'Badge automatically assigned by SIMS Portal bot.')".format(user.user_id)
-				db.session.execute(new_badge)
-		db.session.commit()
-	except Exception as e:
-		current_app.logger.error('Big Wig Auto-Assign Failed: {}'.format(e))
+	return awarded
 
-def auto_badge_assigner_self_promoter():
+def eligible_badge_recipients(dis_id, user_ids):
 	"""
-	Checks for users that have at least 1 skill shared on their profile and assigns the Self Promoter badge if they don't already have it.
+	Returns the ids among user_ids that a SIMS Remote Coordinator on this emergency may award badges to: its active Remote IM Supporters.
 	"""
-	current_app.logger.info('Self Promoter Auto-Assign Ran')
-	try:
-		users_with_skills = db.session.query(
-			User.id.label('user_id'),
-			User.firstname,
-			User.lastname,
-			func.string_agg(Skill.name, ', ').label('skill_names'),
-			func.string_agg(func.cast(Skill.id, String), ', ').label('skill_ids')
-		).join(
-			user_skill,
-			User.id == user_skill.c.user_id
-		).join(
-			Skill,
-			Skill.id == user_skill.c.skill_id
-		).group_by(
-			User.id
-		).all()
-		
-		# users_with_skills = db.engine.execute("SELECT user.id AS user_id, firstname, lastname, GROUP_CONCAT(skill.name, ', ') as skill_names, GROUP_CONCAT(skill.id, ', ') as skill_ids FROM user JOIN user_skill ON user.id = user_skill.user_id JOIN skill ON skill.id = user_skill.skill_id GROUP BY user.id")
-		existing_self_promoter_badges = db.engine.execute("SELECT user_id, badge_id FROM public.user_badge WHERE badge_id = 4")
-		
-		list_user_ids_with_self_promoter = []
-		for user in existing_self_promoter_badges:
-			list_user_ids_with_self_promoter.append(user.user_id)
-			
-		for user in users_with_skills:
-			if user.user_id not in list_user_ids_with_self_promoter:
-				new_badge = "INSERT INTO user_badge (user_id, badge_id, assigner_id, assigner_justify) VALUES ({}, 4, 0, 'Badge automatically assigned by SIMS Portal bot.')".format(user.user_id)
-				db.session.execute(new_badge)
-		db.session.commit()
-	except Exception as e:
-		current_app.logger.error('Self Promoter Auto-Assign Failed: {}'.format(e))
+	return [user_id for (user_id,) in db.session.query(Assignment.user_id).filter(Assignment.emergency_id == dis_id, Assignment.role == 'Remote IM Support', Assignment.assignment_status == 'Active', Assignment.user_id.in_(user_ids))]
 
-def auto_badge_assigner_polyglot():
+def assign_badge(badge_id, user_ids, assigner_id, assigner_justify=None):
 	"""
-	Checks for users that have at least 2 languages listed on their profile and assigns the Polyglot badge if they don't already have it.
+	Awards one badge to any number of members in a single INSERT ... ON CONFLICT DO NOTHING, so members who already hold it are skipped by the unique index on user_badge rather than checked beforehand. Commits, sends each new holder a Slack DM, and returns the ids of the members who actually received the badge.
 	"""
-	current_app.logger.info('Polyglot Auto-Assign Ran')
-	try:
-		users_with_languages = db.session.query(User.id.label('user_id'), User.firstname, User.lastname, func.string_agg(Language.id.cast(String), ', ').label('languages')).join(user_language, User.id == user_language.c.user_id).join(Language, Language.id == user_language.c.language_id).group_by(User.id).all()
-		
-		# users_with_languages = db.engine.execute("SELECT user.id AS user_id, firstname, lastname, GROUP_CONCAT(language.id, ', ') as languages FROM user JOIN user_language ON user_language.user_id = user.id JOIN language ON language.id = user_language.language_id GROUP BY user_id")
-		existing_polyglot_badges = db.engine.execute("SELECT user_id, badge_id FROM public.user_badge WHERE badge_id = 1")
-		
-		list_users_with_languages = []
-		for user in users_with_languages:
-			temp_dict = {}
-			temp_dict['user_id'] = user.user_id
-			list_langs = []
-			for lang in user['languages'].split(","):
-				list_langs.append(int(lang))
-			temp_dict['langs'] = list_langs
-			for x in temp_dict['langs']:
-				temp_dict['lang_count'] = len(temp_dict['langs'])
-			list_users_with_languages.append(temp_dict)
-		
-		list_user_ids_with_polyglot = []
-		for user in existing_polyglot_badges:
-			list_user_ids_with_polyglot.append(user.user_id)
-		
-		for user in list_users_with_languages:
-			if user['user_id'] not in list_user_ids_with_polyglot and user['lang_count'] > 1:
-				new_badge = "INSERT INTO user_badge (user_id, badge_id, assigner_id, assigner_justify) VALUES ({}, 1, 0, 'Badge automatically assigned by SIMS Portal bot.')".format(user['user_id'])
-				db.session.execute(new_badge)
-		db.session.commit()
-	except Exception as e:
-		current_app.logger.error('Polyglot Auto-Assign Failed: {}'.format(e))
+	user_ids = sorted(set(int(user_id) for user_id in user_ids))
+	if not user_ids:
+		return []
 	
-def auto_badge_assigner_autobiographer():
-	"""
-	Checks for users that have at 500+ characters in their bio and assigns the Autobiographer badge if they don't already have it.
-	"""
-	current_app.logger.info('Biographer Auto-Assign Ran')
-	try:
-		all_users = db.session.query(User).filter(User.bio != '').all()
-		existing_autobiographer_badges = db.engine.execute("SELECT user_id, badge_id FROM public.user_badge WHERE badge_id = 21")
-		
-		list_user_ids_with_autobiographer = []
-		for user in existing_autobiographer_badges:
-			list_user_ids_with_autobiographer.append(user.user_id)
-		
-		for user in all_users:
-			if user.id not in list_user_ids_with_autobiographer and len(user.bio) > 500:
-				new_badge = "INSERT INTO user_badge (user_id, badge_id, assigner_id, assigner_justify) VALUES ({}, 21, 0, 'Badge automatically assigned by SIMS Portal bot.')".format(user.id)
-				db.session.execute(new_badge)
-		db.session.commit()
-	except Exception as e:
-		current_app.logger.error('Autobiographer Auto-Assign Failed: {}'.format(e))
+	assign_query = text(
+		"""
+		INSERT INTO user_badge (user_id, badge_id, assigner_id, assigner_justify)
+		SELECT member_id, :badge_id, :assigner_id, :assigner_justify
+		FROM unnest(CAST(:user_ids AS INTEGER[])) AS member_id
+		ON CONFLICT (user_id, badge_id) DO NOTHING
+		RETURNING user_id
+		"""
+	)
+	awarded_ids = [row.user_id for row in db.session.execute(assign_query, {'badge_id': badge_id, 'assigner_id': assigner_id, 'assigner_justify': assigner_justify, 'user_ids': user_ids})]
+	add_badge_cache_tags(awarded_ids)
+	db.session.commit()
+	
+	if awarded_ids:
+		notify_badge_recipients(badge_id, awarded_ids, assigner_id, assigner_justify)
+	return awarded_ids
 
-def auto_badge_assigner_jack_of_all_trades():
-	"""
-	Checks for users that have at 500+ characters in their bio and assigns the Autobiographer badge if they don't already have it.
-	"""
-	current_app.logger.info('Jack of All Trades Auto-Assign Ran')
+def notify_badge_recipients(badge_id, user_ids, assigner_id, assigner_justify):
 	try:
-		users_with_profiles = db.session.query(
-			func.concat(User.firstname, ' ', User.lastname).label('name'),
-			User.id.label('user_id'),
-			func.string_agg(Profile.name, ', ').label('profiles')
-		).join(user_profile, User.id == user_profile.c.user_id).join(
-			Profile, Profile.id == user_profile.c.profile_id
-		).group_by(User.id, func.concat(User.firstname, ' ', User.lastname)).all()
-		
-		existing_jack_of_all_trades_badges = db.engine.execute("SELECT user_id, badge_id FROM public.user_badge WHERE badge_id = 22")
-		
-		list_users_with_profiles = []
-		for user in users_with_profiles:
-			temp_dict = {}
-			temp_dict['user_id'] = user.user_id
-			list_profs = []
-			for prof in user['profiles'].split(","):
-				list_profs.append(int(prof))
-			temp_dict['profs'] = list_profs
-			for x in temp_dict['profs']:
-				temp_dict['prof_count'] = len(temp_dict['profs'])
-			list_users_with_profiles.append(temp_dict)
-		
-		list_user_ids_with_jack_of_all_trades = []
-		for user in existing_jack_of_all_trades_badges:
-			list_user_ids_with_jack_of_all_trades.append(user.user_id)
-		
-		for user in list_users_with_profiles:
-			if user['user_id'] not in list_user_ids_with_jack_of_all_trades and user['prof_count'] > 5:
-				new_badge = "INSERT INTO user_badge (user_id, badge_id, assigner_id, assigner_justify) VALUES ({}, 22, 0, 'Badge automatically assigned by SIMS Portal bot.')".format(user['user_id'])
-				db.session.execute(new_badge)
-		db.session.commit()
+		badge_name = db.session.query(Badge.name).filter(Badge.id == badge_id).scalar()
+		assigner_name = db.session.query(User.fullname).filter(User.id == assigner_id).scalar()
+		recipients = db.session.query(User.firstname, User.slack_id).filter(User.id.in_(user_ids), User.slack_id.isnot(None)).all()
+		for recipient in recipients:
+			message = 'Hi {}, you have been assigned a new badge on the SIMS Portal! {} has given you the {} badge with the following message: {}'.format(recipient.firstname, assigner_name, badge_name, assigner_justify)
+			enqueue_slack_message(recipient.slack_id, message, as_user=True)
 	except Exception as e:
-		current_app.logger.error('Jack of All Trades Auto-Assign Failed: {}'.format(e))
+		current_app.logger.error('Could not send badge notifications for Badge-{}: {}'.format(badge_id, e))
 
-def auto_badge_assigner_edward_tufte():
-	"""
-	Checks for users that have at 5+ public infographics posted to the Portal and assigns the Edward Tufte badge if they don't already have it.
-	"""
-	try:
-		current_app.logger.info('Edward Tufte Auto-Assign Ran')
-		existing_edward_tufte_badges = db.engine.execute("SELECT user_id, badge_id FROM public.user_badge WHERE badge_id = 31")
-		
-		list_user_ids_with_edward_tufte = []
-		for user in existing_edward_tufte_badges:
-			list_user_ids_with_edward_tufte.append(user.user_id)
-			
-		users_eligible_for_edward_tufte = db.session.query(User.id, User.firstname, User.lastname, Portfolio.type, func.count().label('total')).join(Portfolio, Portfolio.creator_id == User.id).filter(Portfolio.product_status == 'Approved').filter(Portfolio.type == 'Infographic').group_by(User.id, Portfolio.type).having(func.count() >= 5).all()
-		
-		# users_eligible_for_edward_tufte = db.engine.execute("SELECT user.id, firstname, lastname, type, count(*) as count FROM user JOIN portfolio ON portfolio.creator_id = user.id WHERE product_status = 'Approved' AND type = 'Infographic' GROUP BY user.id HAVING count >= 5")
-		
-		list_users_eligible_for_edward_tufte = []
-		for user in users_eligible_for_edward_tufte:
-			if user.id not in list_user_ids_with_edward_tufte:
-				new_badge = "INSERT INTO user_badge (user_id, badge_id, assigner_id, assigner_justify) VALUES ({}, 31, 0, 'Badge automatically assigned by SIMS Portal bot.')".format(user.id)
-				db.session.execute(new_badge)
-		db.session.commit()
-	except Exception as e:
-		current_app.logger.error('Edward Tufte Auto-Assign Failed: {}'.format(e))
+# writes to any of these tables make the cached dashboard snapshot stale; it's cached with get_or_build(), so each one is a table tag bumped by the cache listeners in caching/utils.py
+DASHBOARD_SOURCE_TABLES = ['assignment', 'portfolio', 'emergency', 'alert', 'user', 'nationalsociety', 'emergencytype', 'region', 'regional_focal_point']
+DASHBOARD_SNAPSHOT_KEY = 'dashboard_snapshot'
 
-def auto_badge_assigner_world_traveler():
+def build_dashboard_snapshot():
 	"""
-	Checks for users that have assignments tagged to emergencies in five distinct countries and assigns the World Traveler badge if they don't already have it.
+	Runs the aggregate queries behind /dashboard and returns the results as plain dicts and lists, so the snapshot can be pickled into the shared cache and read back by any gunicorn worker. Nested dicts keep the same shape the template already uses (e.g. emergency.Emergency.id).
 	"""
-	try:
-		current_app.logger.info('World Traveler Auto-Assign Ran')
-		existing_world_traveler_badges = db.engine.execute("SELECT user_id, badge_id FROM public.user_badge WHERE badge_id = 5")
-		
-		list_user_ids_with_world_traveler = []
-		for user in existing_world_traveler_badges:
-			list_user_ids_with_world_traveler.append(user.user_id)
+	todays_date = datetime.today()
 	
-		users_eligible_for_world_traveler = db.session.query(User.id, User.firstname, User.lastname, func.count(func.distinct(NationalSociety.country_name)).label('count_countries')).join(Assignment, Assignment.user_id == User.id).join(Emergency, Emergency.id == Assignment.emergency_id).join(NationalSociety, NationalSociety.id == Emergency.id).group_by(User.id, User.firstname, User.lastname).having(func.count(func.distinct(NationalSociety.country_name)) > 4).all()
-		
-		# users_eligible_for_world_traveler = db.engine.execute("SELECT user.id, firstname, lastname, count(distinct country_name) as count_countries FROM User JOIN Assignment ON Assignment.user_id = User.id JOIN Emergency ON Emergency.id = Assignment.emergency_id JOIN nationalsociety ON nationalsociety.ns_go_id = emergency.emergency_location_id GROUP BY user.id HAVING count_countries > 4")
+	active_emergencies = [
+		{'Emergency': {'id': row.id, 'emergency_name': row.emergency_name}, 'EmergencyType': {'emergency_type_name': row.emergency_type_name}}
+		for row in db.session.query(Emergency.id, Emergency.emergency_name, EmergencyType.emergency_type_name).join(NationalSociety, NationalSociety.ns_go_id == Emergency.emergency_location_id).join(EmergencyType, EmergencyType.emergency_type_go_id == Emergency.emergency_type_id).filter(Emergency.emergency_status == 'Active').all()
+	]
 	
-		for user in users_eligible_for_world_traveler:
-			if user.id not in list_user_ids_with_world_traveler:
-				new_badge = "INSERT INTO user_badge (user_id, badge_id, assigner_id, assigner_justify) VALUES ({}, 5, 0, 'Badge automatically assigned by SIMS Portal bot.')".format(user.id)
-				db.session.execute(new_badge)
-		db.session.commit()
-	except Exception as e:
-		current_app.logger.error('World Traveler Auto-Assign Failed: {}'.format(e))
-		
-def auto_badge_assigner_old_salt():
+	regional_im_leads = [
+		{'Region': {'name': row.region_name}, 'User': {'id': row.id, 'firstname': row.firstname, 'lastname': row.lastname, 'image_file': row.image_file, 'image_renditions': row.image_renditions, 'place_label': row.place_label}}
+		for row in db.session.query(Region.name.label('region_name'), User.id, User.firstname, User.lastname, User.image_file, User.image_renditions, User.place_label).select_from(RegionalFocalPoint).join(Region, Region.id == RegionalFocalPoint.regional_id).join(User, User.id == RegionalFocalPoint.focal_point_id).all()
+	]
+	
+	assignments_by_emergency = db.session.query(Emergency.emergency_name, func.count(Assignment.id)).join(Assignment, Assignment.emergency_id == Emergency.id).filter(Assignment.assignment_status != 'Removed').group_by(Emergency.emergency_name).all()
+	products_by_emergency = db.session.query(Emergency.emergency_name, func.count(Portfolio.id)).join(Portfolio, Portfolio.emergency_id == Emergency.id).filter(Portfolio.product_status != 'Removed').group_by(Emergency.emergency_name).all()
+	
+	active_assignments = [
+		{
+			'Assignment': {'id': row.id, 'user_id': row.user_id, 'emergency_id': row.emergency_id, 'role': row.role, 'end_date': row.end_date},
+			'User': {'firstname': row.firstname, 'lastname': row.lastname},
+			'Emergency': {'emergency_name': row.emergency_name},
+			'NationalSociety': {'ns_name': row.ns_name},
+		}
+		for row in db.session.query(Assignment.id, Assignment.user_id, Assignment.emergency_id, Assignment.role, Assignment.end_date, User.firstname, User.lastname, Emergency.emergency_name, NationalSociety.ns_name).join(User, User.id == Assignment.user_id).join(Emergency, Emergency.id == Assignment.emergency_id).join(NationalSociety, NationalSociety.ns_go_id == User.ns_id).filter(Assignment.assignment_status == 'Active', Assignment.role != 'Remote IM Support', Assignment.end_date > todays_date).order_by(Emergency.emergency_name, Assignment.end_date).all()
+	]
+	count_active_assignments = db.session.query(Assignment.id).join(User, User.id == Assignment.user_id).join(Emergency, Emergency.id == Assignment.emergency_id).filter(Assignment.assignment_status == 'Active', Assignment.end_date > todays_date).count()
+	
+	surge_alerts = [
+		dict(row._mapping)
+		for row in db.session.query(Alert.role_profile, Alert.event, Alert.country_name, Alert.ifrc_severity_level_display, Alert.scope, Alert.start, Alert.im_filter, Alert.iso3, Alert.molnix_id).filter(Alert.im_filter == True).all()
+	]
+	
+	return {
+		'active_emergencies': active_emergencies,
+		'count_active_emergencies': len(active_emergencies),
+		'regional_im_leads': regional_im_leads,
+		'labels_for_assignment': [row[0] for row in assignments_by_emergency],
+		'values_for_assignment': [row[1] for row in assignments_by_emergency],
+		'labels_for_product': [row[0] for row in products_by_emergency],
+		'values_for_product': [row[1] for row in products_by_emergency],
+		'active_assignments': active_assignments,
+		'count_active_assignments': count_active_assignments,
+		'surge_alerts': surge_alerts,
+		'built_at': datetime.utcnow(),
+	}
+
+def get_dashboard_snapshot():
 	"""
-	Checks for users that have 3 assignments with SIMS Remote Coordinator as the role and assigns the Old Salt badge if they don't already have it.
+	Returns the dashboard snapshot from the shared cache, rebuilding it if it has expired or a write to one of DASHBOARD_SOURCE_TABLES has invalidated it.
 	"""
-	try:
-		current_app.logger.info('Old Salt Auto-Assign Ran')
-		existing_old_salt_badges = db.engine.execute("SELECT user_id, badge_id FROM public.user_badge WHERE badge_id = 25")
-		
-		list_user_ids_with_old_salt = []
-		for user in existing_old_salt_badges:
-			list_user_ids_with_old_salt.append(user.user_id)
-		
-		users_eligible_for_old_salt = db.session.query(Assignment.id, User.id, User.firstname, User.lastname, func.count().label('count')).join(User, User.id == Assignment.user_id).filter(Assignment.role == 'SIMS Remote Coordinator').group_by(Assignment.id, User.id, User.firstname, User.lastname).having(func.count() > 2).all()
-		
-		# users_eligible_for_old_salt = db.engine.execute("SELECT assignment.id, user.id, firstname, lastname, count(*) as count FROM assignment JOIN user ON user.id = assignment.user_id WHERE role = 'SIMS Remote Coordinator' GROUP BY user.id HAVING count > 2")
-		
-		for user in users_eligible_for_old_salt:
-			if user.id not in list_user_ids_with_old_salt:
-				new_badge = "INSERT INTO user_badge (user_id, badge_id, assigner_id, assigner_justify) VALUES ({}, 25, 0, 'Badge automatically assigned by SIMS Portal bot.')".format(user.id)
-				db.session.execute(new_badge)
-		db.session.commit()
-	except Exception as e:
-		current_app.logger.error('Old Salt Auto-Assign Failed: {}'.format(e))
\ No newline at end of file
+	return get_or_build(DASHBOARD_SNAPSHOT_KEY, build_dashboard_snapshot, tags=DASHBOARD_SOURCE_TABLES, timeout=current_app.config['DASHBOARD_SNAPSHOT_SECONDS'])
@@ -8,25 +8,35 @@ from sqlalchemy.orm import declarative_base, relationship, column_property
 from sqlalchemy.sql import func
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy import Column, ForeignKey, Integer, Table
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
 import requests
 
+def search_vector_column():
+	# weighted full-text document kept current by search/utils.py and deferred so it's never loaded with the row; SQLite searches its own FTS5 tables instead
+	return db.deferred(db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite')))
+
+def prefix_index(name, column):
+	# lower(column) with text_pattern_ops, so the LIKE 'term%' matches of the pickers in main/fields.py use an index whatever the database collation
+	label = name[3:]
+	return db.Index(name, func.lower(column).label(label), postgresql_ops={label: 'text_pattern_ops'})
+
 @login_manager.user_loader
 def load_user(user_id):
 	return User.query.get(int(user_id))
 
 user_profile = db.Table('user_profile',
-	db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
+	db.Column('user_id', db.Integer, db.ForeignKey('user.id'), index=True),
 	db.Column('profile_id', db.Integer, db.ForeignKey('profile.id')),
 	db.Column('tier', db.Integer)
 )
 
 user_skill = db.Table('user_skill', 
-	db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
+	db.Column('user_id', db.Integer, db.ForeignKey('user.id'), index=True),
 	db.Column('skill_id', db.Integer, db.ForeignKey('skill.id'))
 )
 
 user_language = db.Table('user_language', 
-	db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
+	db.Column('user_id', db.Integer, db.ForeignKey('user.id'), index=True),
 	db.Column('language_id', db.Integer, db.ForeignKey('language.id'))
 )
 
@@ -36,7 +46,9 @@ user_badge = db.Table('user_badge',
 	db.Column('assigner_id', db.Integer),
 	db.Column('assigner_justify', db.Text),
 	db.Column('created_date', db.DateTime, server_default=func.now()),
-	db.Column('updated_date', db.DateTime, onupdate=func.now())
+	db.Column('updated_date', db.DateTime, onupdate=func.now()),
+	# a member holds each badge at most once
+	db.Index('ix_user_badge_user_id_badge_id', 'user_id', 'badge_id', unique=True)
 )
 
 user_workinggroup = db.Table('user_workinggroup',
@@ -44,6 +56,13 @@ user_workinggroup = db.Table('user_workinggroup',
 	db.Column('workinggroup_id', db.Integer, db.ForeignKey('workinggroup.id'))
 )
 
+# members who tagged themselves on a product they didn't post; the primary key answers "who worked on this product" and the user_id index "which products did this member work on"
+portfolio_collaborator = db.Table('portfolio_collaborator',
+	db.Column('portfolio_id', db.Integer, db.ForeignKey('portfolio.id', ondelete='CASCADE'), primary_key=True),
+	db.Column('user_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True, index=True),
+	db.Column('created_at', db.DateTime, server_default=func.now())
+)
+
 class Log(db.Model):
 	__tablename__ = 'log'
 	
@@ -55,8 +74,59 @@ class Log(db.Model):
 	def __repr__(self):
 		return f"Log({self.timestamp}: {self.message}"
 
+class SlackMessage(db.Model):
+	__tablename__ = 'slack_message'
+	
+	id = db.Column(db.Integer, primary_key=True)
+	channel = db.Column(db.String(120), nullable=False)
+	text = db.Column(db.Text, nullable=False)
+	as_user = db.Column(db.Boolean, default=False)
+	status = db.Column(db.String(20), default='Pending', index=True)
+	attempts = db.Column(db.Integer, default=0)
+	last_error = db.Column(db.String(500))
+	next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+	sent_at = db.Column(db.DateTime)
+	
+	created_at = db.Column(db.DateTime, server_default=func.now())
+	updated_at = db.Column(db.DateTime, onupdate=func.now())
+	
+	def __repr__(self):
+		return f"SlackMessage({self.id}, {self.channel}, {self.status})"
+
+class JobRun(db.Model):
+	__tablename__ = 'job_run'
+	# one row per scheduled occurrence; the unique index lets exactly one worker process claim it
+	__table_args__ = (db.Index('ix_job_run_name_scheduled_for', 'name', 'scheduled_for', unique=True),)
+	
+	id = db.Column(db.Integer, primary_key=True)
+	name = db.Column(db.String(100), nullable=False)
+	trigger = db.Column(db.String(20), default='schedule')
+	status = db.Column(db.String(20), default='Running', index=True)
+	scheduled_for = db.Column(db.DateTime)
+	started_at = db.Column(db.DateTime, default=datetime.utcnow)
+	finished_at = db.Column(db.DateTime)
+	duration_ms = db.Column(db.Integer)
+	result = db.Column(db.String(500))
+	error = db.Column(db.Text)
+	heartbeat_sent_at = db.Column(db.DateTime)
+	worker = db.Column(db.String(120))
+	requested_by = db.Column(db.Integer)
+	progress_done = db.Column(db.Integer)
+	progress_total = db.Column(db.Integer)
+	progress_message = db.Column(db.String(200))
+	cancel_requested = db.Column(db.Boolean, default=False)
+	# touched every JOB_ALIVE_SECONDS by the process that owns a queued or running run; see reap_stale_job_runs()
+	alive_at = db.Column(db.DateTime)
+	
+	created_at = db.Column(db.DateTime, server_default=func.now())
+	updated_at = db.Column(db.DateTime, onupdate=func.now())
+	
+	def __repr__(self):
+		return f"JobRun({self.id}, {self.name}, {self.status})"
+
 class Acronym(db.Model):
 	__tablename__ = 'acronym'
+	__table_args__ = (db.Index('ix_acronym_search_vector', 'search_vector', postgresql_using='gin'),)
 	
 	id = db.Column(db.Integer, primary_key=True)
 	acronym_eng = db.Column(db.String(255), nullable=True)
@@ -78,6 +148,8 @@ class Acronym(db.Model):
 	date_added = db.Column(db.DateTime, server_default=func.now())
 	date_modified = db.Column(db.DateTime, onupdate=func.now())
 	
+	search_vector = search_vector_column()
+	
 	def __repr__(self):
 		return f"{self.acronym_eng} - {self.def_eng}"
 
@@ -157,13 +229,16 @@ class NationalSociety(db.Model):
 	def __repr__(self):
 		return f"NationalSociety('{self.ns_name}','{self.country_name}','{self.ns_go_id}'"
 
+prefix_index('ix_nationalsociety_lower_country_name', NationalSociety.country_name)
+
 class User(db.Model, UserMixin):
 	__tablename__ = 'user'
+	__table_args__ = (db.Index('ix_user_search_vector', 'search_vector', postgresql_using='gin'),)
 	
 	id = db.Column(db.Integer, primary_key=True)
 	firstname = db.Column(db.String(40), nullable=False)
 	lastname = db.Column(db.String(40), nullable=False)
-	status = db.Column(db.String(20), default='Pending')
+	status = db.Column(db.String(20), default='Pending', index=True)
 	birthday = db.Column(db.Date)
 	email = db.Column(db.String(120), unique=True, nullable=False)
 	password = db.Column(db.String(60), nullable=False)
@@ -175,6 +250,8 @@ class User(db.Model, UserMixin):
 	roles = db.Column(db.String(1000))
 	languages = db.Column(db.String(1000))
 	image_file = db.Column(db.String(200), nullable=False, default='default.png')
+	image_renditions = db.Column(db.JSON) # {extension: [[width, key], ...]}, see images/utils.py
+	slack_avatar_hash = db.Column(db.String(64))
 	twitter = db.Column(db.String(120))
 	slack_id = db.Column(db.String(120))
 	github = db.Column(db.String(120))
@@ -201,6 +278,8 @@ class User(db.Model, UserMixin):
 	
 	fullname = column_property(firstname + " " + lastname)
 	
+	search_vector = search_vector_column()
+	
 	def get_reset_token(self, expires_sec=1800):
 		s = Serializer(current_app.config['SECRET_KEY'], expires_sec)
 		return s.dumps({'user_id': self.id}).decode('utf-8')
@@ -221,6 +300,40 @@ class User(db.Model, UserMixin):
 	def __repr__(self):
 		return f"User({self.id}, {self.firstname} {self.lastname}, {self.email})"
 
+prefix_index('ix_user_lower_firstname', User.firstname)
+prefix_index('ix_user_lower_lastname', User.lastname)
+
+class UserStats(db.Model):
+	__tablename__ = 'user_stats'
+	
+	# read model kept current by the refresh_user_stats() triggers in Postgres, see the user_stats migration
+	user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+	count_assignments = db.Column(db.Integer, default=0)
+	count_remote_coordinator = db.Column(db.Integer, default=0)
+	count_countries = db.Column(db.Integer, default=0)
+	count_badges = db.Column(db.Integer, default=0)
+	count_skills = db.Column(db.Integer, default=0)
+	count_languages = db.Column(db.Integer, default=0)
+	count_profiles = db.Column(db.Integer, default=0)
+	count_infographics = db.Column(db.Integer, default=0)
+	bio_length = db.Column(db.Integer, default=0)
+	skills = db.Column(ARRAY(db.String))
+	languages = db.Column(ARRAY(db.String))
+	profiles = db.Column(ARRAY(db.String))
+	tier_geo = db.Column(db.Integer)
+	tier_webviz = db.Column(db.Integer)
+	tier_infodes = db.Column(db.Integer)
+	tier_datatrans = db.Column(db.Integer)
+	tier_mobdata = db.Column(db.Integer)
+	tier_simsco = db.Column(db.Integer)
+	
+	user = db.relationship('User', backref=db.backref('stats', uselist=False))
+	
+	updated_at = db.Column(db.DateTime, server_default=func.now())
+	
+	def __repr__(self):
+		return f"UserStats({self.user_id}, {self.count_assignments} assignments, {self.count_badges} badges)"
+
 class Assignment(db.Model):
 	__tablename__ = 'assignment'
 	
@@ -237,8 +350,8 @@ class Assignment(db.Model):
 	products = db.relationship('Portfolio', backref='assignment', lazy=True)
 	learning = db.relationship('Learning', backref='assignment', uselist=False)
 	
-	user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-	emergency_id = db.Column(db.Integer, db.ForeignKey('emergency.id'), default=0)
+	user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+	emergency_id = db.Column(db.Integer, db.ForeignKey('emergency.id'), default=0, index=True)
 	
 	created_at = db.Column(db.DateTime, server_default=func.now())
 	updated_at = db.Column(db.DateTime, onupdate=func.now())
@@ -309,12 +422,13 @@ class Story(db.Model):
 
 class Emergency(db.Model):
 	__tablename__ = 'emergency'
+	__table_args__ = (db.Index('ix_emergency_search_vector', 'search_vector', postgresql_using='gin'),)
 	
 	id = db.Column(db.Integer, primary_key=True)
 	emergency_name = db.Column(db.String(100), nullable=False)
 	emergency_status = db.Column(db.String(100), nullable=False, default='Active')
 	emergency_glide = db.Column(db.String(20))
-	emergency_go_id = db.Column(db.Integer)
+	emergency_go_id = db.Column(db.Integer, index=True)
 	emergency_location_id = db.Column(db.Integer)
 	emergency_review_id = db.Column(db.Integer)
 	activation_details = db.Column(db.String(1000))
@@ -332,6 +446,8 @@ class Emergency(db.Model):
 	created_at = db.Column(db.DateTime, server_default=func.now())
 	updated_at = db.Column(db.DateTime, onupdate=func.now())
 	
+	search_vector = search_vector_column()
+	
 	@staticmethod
 	def get_latest_go_emergencies():
 		api_call = 'https://goadmin.ifrc.org/api/v2/event/'
@@ -352,6 +468,8 @@ class Emergency(db.Model):
 	def __repr__(self):
 		return f"Emergency('{self.emergency_name}','{self.emergency_glide}','{self.emergency_go_id}','{self.emergency_location_id}','{self.emergency_type_id}','{self.emergency_review_id}','{self.activation_details}','{self.emergency_type_id}')"
 
+prefix_index('ix_emergency_lower_emergency_name', Emergency.emergency_name)
+
 class EmergencyType(db.Model):
 	__tablename__ = 'emergencytype'
 	
@@ -366,6 +484,11 @@ class EmergencyType(db.Model):
 
 class Portfolio(db.Model):
 	__tablename__ = 'portfolio'
+	# approved products per emergency, used by /api/portfolio and the emergency page
+	__table_args__ = (
+		db.Index('ix_portfolio_emergency_id_product_status', 'emergency_id', 'product_status'),
+		db.Index('ix_portfolio_search_vector', 'search_vector', postgresql_using='gin'),
+	)
 	
 	id = db.Column(db.Integer, primary_key=True)
 	title = db.Column(db.String(200), nullable=False)
@@ -374,24 +497,34 @@ class Portfolio(db.Model):
 	description = db.Column(db.Text)
 	product_status = db.Column(db.String(100), default='Personal')
 	local_file = db.Column(db.String(100), nullable=False)
+	file_size = db.Column(db.BigInteger) # bytes, as S3 reports them
 	image_file = db.Column(db.String(200))
+	image_renditions = db.Column(db.JSON) # {extension: [[width, key], ...]}, see images/utils.py
 	dropbox_file = db.Column(db.String(300))
+	# the copy to Dropbox is queued on the row and made by worker.py, see portfolios/utils.py
+	dropbox_status = db.Column(db.String(20), index=True)
+	dropbox_attempts = db.Column(db.Integer, default=0)
+	dropbox_next_attempt_at = db.Column(db.DateTime)
+	dropbox_error = db.Column(db.String(500))
 	external = db.Column(db.Boolean, default=False)
-	collaborator_ids = db.Column(db.String(200))
 	approver_id = db.Column(db.Integer)
 	approver_message = db.Column(db.Text)
 	km_article_id = db.Column(db.Integer) # this has been retired as we moved away from int for documentation ID
 	learning_site_url = db.Column(db.String(1000)) # this has replaced the km_article_id
 	
 	assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'))
-	creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+	creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
 	emergency_id = db.Column(db.Integer, db.ForeignKey('emergency.id'))
 	
+	collaborators = db.relationship('User', secondary='portfolio_collaborator', backref='collaborations', lazy=True)
+	
 	created_at = db.Column(db.DateTime, server_default=func.now())
 	updated_at = db.Column(db.DateTime, onupdate=func.now())
+	
+	search_vector = search_vector_column()
 
 	def __repr__(self):
-		return f"Portfolio('{self.id}','{self.title}','{self.type}','{self.description}','{self.image_file}','{self.creator_id}','{self.collaborator_ids}')"
+		return f"Portfolio('{self.id}','{self.title}','{self.type}','{self.description}','{self.image_file}','{self.creator_id}')"
 
 class Alert(db.Model):
 	__tablename__ = 'alert'
@@ -419,7 +552,7 @@ class Alert(db.Model):
 	disaster_type_name = db.Column(db.String)
 	disaster_go_id = db.Column(db.Integer)
 	ifrc_severity_level_display = db.Column(db.String)
-	alert_id = db.Column(db.Integer)
+	alert_id = db.Column(db.Integer, unique=True, index=True)
 	region_id = db.Column(db.Integer)
 	
 	created_at = db.Column(db.DateTime, server_default=func.now())
@@ -428,8 +561,26 @@ class Alert(db.Model):
 	def __repr__(self):
 		return f"Alert('{self.event}', '{self.event}')"
 		
+class AlertCrawlCursor(db.Model):
+	__tablename__ = 'alert_crawl_cursor'
+	
+	id = db.Column(db.Integer, primary_key=True)
+	name = db.Column(db.String(50), unique=True, nullable=False)
+	next_page = db.Column(db.Integer, default=1)
+	page_size = db.Column(db.Integer)
+	pages_to_fetch = db.Column(db.Integer)
+	completed_at = db.Column(db.DateTime)
+	
+	created_at = db.Column(db.DateTime, server_default=func.now())
+	updated_at = db.Column(db.DateTime, onupdate=func.now())
+	
+	def __repr__(self):
+		return f"AlertCrawlCursor('{self.name}', {self.next_page}/{self.pages_to_fetch})"
+
 class Availability(db.Model):
 	__tablename__ = 'availability'
+	# the emergency page looks up a member's latest availability for a timeframe
+	__table_args__ = (db.Index('ix_availability_user_id_emergency_id_timeframe', 'user_id', 'emergency_id', 'timeframe'),)
 	
 	id = db.Column(db.Integer, primary_key=True)
 	timeframe = db.Column(db.String)
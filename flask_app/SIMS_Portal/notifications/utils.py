@@ -0,0 +1,199 @@
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+from SIMS_Portal import db, cache
+from SIMS_Portal.models import SlackMessage
+
+logger = logging.getLogger(__name__)
+
+# slack errors that will never succeed on retry, so the message is failed straight away
+PERMANENT_SLACK_ERRORS = ['channel_not_found', 'not_in_channel', 'is_archived', 'invalid_auth', 'account_inactive', 'user_not_found', 'no_text', 'msg_too_long']
+
+# a 429 from Slack pauses every dispatcher until this time, so it's kept in the shared cache rather than in one process
+SLACK_PAUSE_CACHE_KEY = 'slack_queue:paused_until'
+
+# what the dispatcher needs of a claimed row once the claim is committed and the ORM objects have expired
+ClaimedSlackMessage = namedtuple('ClaimedSlackMessage', ['id', 'channel', 'text', 'as_user', 'attempts'])
+
+# set by enqueue_slack_message() so a dispatcher in the same process (i.e. messages queued by jobs in worker.py) doesn't wait out its poll interval
+_wake_dispatcher = threading.Event()
+_dispatcher_thread = None
+_http_session = None
+
+def enqueue_slack_message(channel, text, as_user=False):
+	"""
+	Queues a Slack message for the background dispatcher and returns immediately. The row is written on its own connection so that it never commits (or gets rolled back with) whatever the calling route has pending in db.session.
+	"""
+	if not channel:
+		current_app.logger.warning('enqueue_slack_message skipped a message with no channel: {}'.format(text[:100]))
+		return None
+
+	try:
+		with db.engine.begin() as connection:
+			result = connection.execute(SlackMessage.__table__.insert().values(
+				channel = channel,
+				text = text,
+				as_user = as_user,
+				status = 'Pending',
+				attempts = 0,
+				next_attempt_at = datetime.utcnow()
+			))
+		_wake_dispatcher.set()
+		return result.inserted_primary_key[0]
+	except Exception as e:
+		current_app.logger.error('enqueue_slack_message failed for channel {}: {}'.format(channel, e))
+		return None
+
+def get_slack_http_session():
+	"""
+	One keep-alive HTTP session per process, shared by every dispatch, instead of a new WebClient per message.
+	"""
+	global _http_session
+	if _http_session is None:
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+		_http_session = requests.Session()
+		_http_session.mount('http://', adapter)
+		_http_session.mount('https://', adapter)
+	return _http_session
+
+def post_slack_message(message):
+	"""
+	Sends one queued message to chat.postMessage. Returns a tuple of (outcome, detail, retry_after) where outcome is 'sent', 'retry', 'rate_limited' or 'failed'.
+	"""
+	url = current_app.config['SLACK_API_URL'] + 'chat.postMessage'
+	headers = {'Authorization': 'Bearer {}'.format(current_app.config['SIMS_PORTAL_SLACK_BOT'])}
+	payload = {'channel': message.channel, 'text': message.text}
+	if message.as_user:
+		payload['as_user'] = True
+
+	try:
+		response = get_slack_http_session().post(url, json=payload, headers=headers, timeout=current_app.config['SLACK_QUEUE_TIMEOUT'])
+	except requests.RequestException as e:
+		return 'retry', str(e), None
+
+	if response.status_code == 429:
+		retry_after = int(response.headers.get('Retry-After', 30))
+		return 'rate_limited', 'rate limited by Slack', retry_after
+	if response.status_code >= 500:
+		return 'retry', 'Slack returned HTTP {}'.format(response.status_code), None
+
+	try:
+		data = response.json()
+	except ValueError:
+		return 'retry', 'Slack returned a non-JSON response (HTTP {})'.format(response.status_code), None
+
+	if data.get('ok'):
+		return 'sent', None, None
+
+	error = data.get('error', 'unknown_error')
+	if error == 'ratelimited':
+		return 'rate_limited', error, int(response.headers.get('Retry-After', 30))
+	if error in PERMANENT_SLACK_ERRORS:
+		return 'failed', error, None
+	return 'retry', error, None
+
+def get_slack_pause():
+	"""
+	When Slack last rate limited us and asked for a pause that hasn't run out yet, the time it ends; otherwise None.
+	"""
+	paused_until = cache.get(SLACK_PAUSE_CACHE_KEY)
+	if paused_until and paused_until > datetime.utcnow():
+		return paused_until
+	return None
+
+def pause_slack_dispatch(seconds):
+	paused_until = datetime.utcnow() + timedelta(seconds=seconds)
+	cache.set(SLACK_PAUSE_CACHE_KEY, paused_until, timeout=seconds + 1)
+	return paused_until
+
+def claim_slack_messages(now):
+	"""
+	Marks up to SLACK_QUEUE_BATCH_SIZE due messages as Sending and commits before anything is posted, so no row lock is held while talking to Slack. next_attempt_at doubles as the claim's lease: a Sending row whose lease has run out belonged to a dispatcher that died mid-batch and is picked up again.
+	"""
+	lease_until = now + timedelta(seconds=current_app.config['SLACK_QUEUE_LEASE_SECONDS'])
+	batch = db.session.query(SlackMessage).filter(
+		SlackMessage.status.in_(['Pending', 'Sending']),
+		SlackMessage.next_attempt_at <= now
+	).order_by(SlackMessage.id).limit(current_app.config['SLACK_QUEUE_BATCH_SIZE']).with_for_update(skip_locked=True).all()
+	
+	claimed = []
+	for message in batch:
+		message.status = 'Sending'
+		message.next_attempt_at = lease_until
+		claimed.append(ClaimedSlackMessage(message.id, message.channel, message.text, message.as_user, message.attempts or 0))
+	db.session.commit()
+	
+	return claimed
+
+def update_slack_message(message_id, **values):
+	# committed straight away, so a crash later in the batch can't resend what was already posted
+	db.session.query(SlackMessage).filter(SlackMessage.id == message_id).update(values, synchronize_session=False)
+	db.session.commit()
+
+def dispatch_pending_slack_messages():
+	"""
+	Claims a batch of due messages (see claim_slack_messages()) and sends them one by one, recording each outcome as soon as it's known. Failed sends are retried with exponential backoff until SLACK_QUEUE_MAX_ATTEMPTS is reached, and a 429 pauses dispatching everywhere for the Retry-After period Slack asks for. Returns the number of messages sent.
+	"""
+	if get_slack_pause():
+		return 0
+	
+	count_sent = 0
+	for message in claim_slack_messages(datetime.utcnow()):
+		# once rate limited, hand the rest of the batch back without spending an attempt
+		paused_until = get_slack_pause()
+		if paused_until:
+			update_slack_message(message.id, status='Pending', next_attempt_at=paused_until)
+			continue
+		
+		outcome, detail, retry_after = post_slack_message(message)
+		
+		if outcome == 'rate_limited':
+			update_slack_message(message.id, status='Pending', next_attempt_at=pause_slack_dispatch(retry_after), last_error=detail)
+			continue
+		
+		attempts = message.attempts + 1
+		if outcome == 'sent':
+			update_slack_message(message.id, status='Sent', sent_at=datetime.utcnow(), attempts=attempts, last_error=None)
+			count_sent += 1
+		elif outcome == 'failed' or attempts >= current_app.config['SLACK_QUEUE_MAX_ATTEMPTS']:
+			update_slack_message(message.id, status='Failed', attempts=attempts, last_error=detail)
+			current_app.logger.error('Slack message {} to {} failed after {} attempt(s): {}'.format(message.id, message.channel, attempts, detail))
+		else:
+			backoff = current_app.config['SLACK_QUEUE_BACKOFF_SECONDS'] * (2 ** (attempts - 1))
+			update_slack_message(message.id, status='Pending', next_attempt_at=datetime.utcnow() + timedelta(seconds=backoff), attempts=attempts, last_error=detail)
+	
+	return count_sent
+
+def run_slack_dispatcher(app):
+	with app.app_context():
+		poll_seconds = app.config['SLACK_QUEUE_POLL_SECONDS']
+		while True:
+			_wake_dispatcher.wait(poll_seconds)
+			_wake_dispatcher.clear()
+			try:
+				# keep draining while full batches come back
+				while dispatch_pending_slack_messages() >= app.config['SLACK_QUEUE_BATCH_SIZE']:
+					pass
+			except Exception as e:
+				db.session.rollback()
+				logger.error('Slack dispatcher loop failed: {}'.format(e))
+			finally:
+				db.session.remove()
+
+def start_slack_dispatcher(app):
+	"""
+	Starts the background dispatcher thread for this process, once. Only worker.py calls this, so there is a single dispatcher however many web workers are running.
+	"""
+	global _dispatcher_thread
+	if _dispatcher_thread is not None and _dispatcher_thread.is_alive():
+		return _dispatcher_thread
+
+	_dispatcher_thread = threading.Thread(target=run_slack_dispatcher, args=(app,), name='slack-dispatcher', daemon=True)
+	_dispatcher_thread.start()
+
+	return _dispatcher_thread
@@ -18,11 +18,15 @@ from SIMS_Portal.models import (
 )
 from SIMS_Portal.portfolios.forms import PortfolioUploadForm, NewDocumentationForm
 from SIMS_Portal.users.utils import send_slack_dm
-from SIMS_Portal.main.utils import send_error_message
+from SIMS_Portal.main.utils import send_error_message, get_keyset_args
+from SIMS_Portal.images.utils import flash_image_upload_status
 from SIMS_Portal.portfolios.utils import (
-	get_full_portfolio, save_portfolio_to_dropbox, save_cover_image
+	get_full_portfolio, save_cover_image, get_emergency_products, invalidate_emergency_products,
+	start_portfolio_upload, finalize_portfolio_upload, abort_portfolio_upload, load_portfolio_upload_token,
+	save_portfolio_to_s3, portfolio_download_url, queue_dropbox_mirror, add_collaborator, remove_collaborator
 )
 from func_timeout import func_timeout, FunctionTimedOut
+import botocore
 
 portfolios = Blueprint('portfolios', __name__)
 
@@ -85,16 +89,19 @@ def new_portfolio_from_assignment(assignment_id, user_id, emergency_id):
 	
 	form = PortfolioUploadForm()
 	if form.validate_on_submit():
-		if form.file.data:
-			file = save_portfolio_to_dropbox(form.file.data, user_info.id, form.type.data)
+		# the upload form's script sends the file straight to S3 and submits a token for it; without the script the file comes with the form
+		if form.file_token.data:
+			file_key, file_size = load_portfolio_upload_token(form.file_token.data, current_user.id)
+		elif form.file.data:
+			file_key, file_size = save_portfolio_to_s3(form.file.data, current_user.id, form.type.data)
 		else:
+			file_key, file_size = None, None
+		if file_key is None:
 			redirect_url = '/portfolio/new_from_assignment/{}/{}/{}'.format(assignment_id, user_id, emergency_id)
 			flash('There was an error posting your product. Please make sure you have filled out all required fields and selected a compatible file.', 'danger')
 			return redirect(redirect_url)
-		if form.image_file.data:
-			cover_image = save_cover_image(form.image_file.data, user_info.id, form.type.data)
-		else:
-			cover_image = form.format.data + '.png'
+		# uploaded covers replace the placeholder once their renditions are ready, see save_cover_image()
+		cover_image = form.format.data + '.png'
 		if form.external.data == True:
 			form.external.data = 1
 			status = 'Pending Approval'
@@ -102,12 +109,17 @@ def new_portfolio_from_assignment(assignment_id, user_id, emergency_id):
 			form.external.data = 0
 			status = 'Personal'
 		product = Portfolio(
-			local_file = file['file_filename'], title = form.title.data, creator_id = user_id, description = form.description.data, type = form.type.data, emergency_id = emergency_id, external = form.external.data, assignment_id = assignment_id, dropbox_file = file['share_link'], product_status = status, image_file = cover_image, format = form.format.data,
+			local_file = file_key, file_size = file_size, title = form.title.data, creator_id = user_id, description = form.description.data, type = form.type.data, emergency_id = emergency_id, external = form.external.data, assignment_id = assignment_id, product_status = status, image_file = cover_image, format = form.format.data,
 		)
 		
 		db.session.add(product)
 		db.session.commit()
 		
+		if form.image_file.data:
+			save_cover_image(form.image_file.data, user_info.id, form.type.data, product.id)
+		# worker.py adds the Dropbox link to the product once the copy has finished
+		queue_dropbox_mirror(product.id)
+		
 		log_message = f"[INFO] User {current_user.id} uploaded product {product.id} ({product.title})."
 		new_log = Log(message=log_message, user_id=current_user.id)
 		db.session.add(new_log)
@@ -136,25 +148,59 @@ def new_portfolio_from_assignment(assignment_id, user_id, emergency_id):
 def view_portfolio(id):
 	product = db.session.query(Portfolio, User, Emergency).join(User, User.id == Portfolio.creator_id).join(Emergency, Emergency.id == Portfolio.emergency_id).filter(Portfolio.id==id).first()
 	if product is not None:
-		# check if product already has collaborators assigned
-		if product.Portfolio.collaborator_ids is not None:
-			# strip out collaborator ids
-			split_collaborators = product.Portfolio.collaborator_ids.split(',')
-			# convert str to int
-			list_collaborators = [eval(i) for i in split_collaborators]
-			list_collaborators_user_info = []
-			for user_id in list_collaborators:
-				list_collaborators_user_info.append(db.session.query(User).filter(User.id == user_id).first())
-			return render_template('portfolio_view.html', product=product, list_collaborators_user_info=list_collaborators_user_info)
-		else:
-			list_collaborators_user_info = None
-			return render_template('portfolio_view.html', product=product, list_collaborators_user_info=list_collaborators_user_info)
+		if current_user.is_authenticated and (current_user.id == product.Portfolio.creator_id or current_user.is_admin == 1):
+			flash_image_upload_status('cover', id)
+		list_collaborators_user_info = product.Portfolio.collaborators
+		return render_template('portfolio_view.html', product=product, list_collaborators_user_info=list_collaborators_user_info)
 	else:
 		return redirect('error404')
 
+@portfolios.route('/portfolio/upload/start', methods=['POST'])
+@login_required
+def start_portfolio_file_upload():
+	"""
+	Starts a browser-direct upload of a portfolio file. Takes JSON with filename, size, content_type and type, and returns the S3 key, upload id, part size and presigned part URLs.
+	"""
+	upload = request.get_json(silent=True) or {}
+	try:
+		return jsonify(start_portfolio_upload(current_user.id, upload.get('type'), str(upload.get('filename', '')), upload.get('size'), upload.get('content_type')))
+	except ValueError as e:
+		return jsonify({'error': str(e)}), 400
+
+@portfolios.route('/portfolio/upload/finalize', methods=['POST'])
+@login_required
+def finalize_portfolio_file_upload():
+	"""
+	Completes a browser-direct upload. Takes JSON with key, upload_id and parts (PartNumber and ETag of each), and returns the file_token to submit with the upload form.
+	"""
+	upload = request.get_json(silent=True) or {}
+	try:
+		file_token = finalize_portfolio_upload(current_user.id, str(upload.get('key', '')), str(upload.get('upload_id', '')), upload.get('parts') or [])
+	except ValueError as e:
+		return jsonify({'error': str(e)}), 400
+	except botocore.exceptions.ClientError as e:
+		current_app.logger.error('Finalizing portfolio upload {} failed: {}'.format(upload.get('key'), e))
+		return jsonify({'error': 'The upload could not be completed, please try again'}), 400
+	return jsonify({'file_token': file_token})
+
+@portfolios.route('/portfolio/upload/abort', methods=['POST'])
+@login_required
+def abort_portfolio_file_upload():
+	upload = request.get_json(silent=True) or {}
+	try:
+		abort_portfolio_upload(current_user.id, str(upload.get('key', '')), str(upload.get('upload_id', '')))
+	except ValueError as e:
+		return jsonify({'error': str(e)}), 400
+	except botocore.exceptions.ClientError as e:
+		current_app.logger.warning('Aborting portfolio upload {} failed: {}'.format(upload.get('key'), e))
+	return jsonify({'aborted': True})
+
 @portfolios.route('/portfolio/download/<int:id>')
 def download_portfolio(id):
 	product = db.session.query(Portfolio).filter(Portfolio.id==id).first()
+	if product.local_file.startswith('portfolio/'):
+		return redirect(portfolio_download_url(product.local_file))
+	# products uploaded before files moved to S3 are on the web server's disk
 	path = os.path.join(current_app.root_path, 'static/assets/portfolio', product.local_file)
 	return send_file(path, as_attachment=True)
 
@@ -164,6 +210,7 @@ def delete_portfolio(id):
 	if current_user.is_admin == 1 or current_user.id == id:
 		try:
 			db.session.query(Portfolio).filter(Portfolio.id==id).update({'product_status':'Removed'})
+			invalidate_emergency_products(id)
 			db.session.commit()
 			
 			product_info = db.session.query(Portfolio).filter(Portfolio.id==id).first()
@@ -229,6 +276,7 @@ def approve_portfolio(prod_id, dis_id):
 	if (current_user.id in disaster_coordinator_list or current_user.is_admin == 1) and check_record:
 		try:
 			db.session.query(Portfolio).filter(Portfolio.id == prod_id).update({'product_status':'Approved'})
+			invalidate_emergency_products(prod_id)
 			db.session.commit()
 			
 			
@@ -279,6 +327,7 @@ def reject_portfolio(prod_id, dis_id):
 	if (current_user.id in disaster_coordinator_list or current_user.is_admin == 1) and check_record:
 		try:
 			db.session.query(Portfolio).filter(Portfolio.id == prod_id).update({'product_status':'Personal'})
+			invalidate_emergency_products(prod_id)
 			db.session.commit()
 			flash('Product has been rejected for public viewing.', 'success')
 		except:
@@ -312,78 +361,31 @@ def all_user_products(id):
 @portfolios.route('/portfolio/add_supporter/<int:product_id>')
 @login_required
 def add_supporter_to_product(product_id):
-	product = db.session.query(Portfolio).filter(Portfolio.id == product_id).first()
-	product_owner = product.creator_id
-	user_id = current_user.id
-	collaborators = db.session.query(Portfolio).filter(Portfolio.id == product_id).first()
+	product = Portfolio.query.get_or_404(product_id)
 	# prevent product owner from also being collaborator
-	if user_id == product_owner:
+	if current_user.id == product.creator_id:
 		flash('You are already listed as the owner of this product and cannot be added as a collaborator.','danger')
 		return redirect(url_for('portfolios.view_portfolio', id=product_id))
-	# check if collaborator column has data
-	if collaborators.collaborator_ids is not None:
-		# split the string by comma and convert to list
-		split_collaborators = collaborators.collaborator_ids.split(',')
-		# convert str to int
-		list_collaborators = [eval(i) for i in split_collaborators]
-		# check if user is already associated
-		if user_id in list_collaborators:
-			flash('You are already associated with this product.', 'danger')
-			return redirect(url_for('portfolios.view_portfolio', id=product_id))
-		else:
-			# add user to list as collaborator
-			list_collaborators.append(user_id)
-			# convert list of ints back to single string
-			string_of_collaborators = ','.join(str(x) for x in list_collaborators)
-			# add new string back into db
-			db.session.query(Portfolio).filter(Portfolio.id == product_id).update({'collaborator_ids':string_of_collaborators})
-			db.session.commit()
-			flash('You are now listed as a collaborator!', 'success')
-			return redirect(url_for('portfolios.view_portfolio', id=product_id))
-	# collaborator column is empty, so update with user id
-	else:
-		str(user_id)
-		db.session.query(Portfolio).filter(Portfolio.id == product_id).update({'collaborator_ids':user_id})
+	if add_collaborator(product_id, current_user.id):
 		db.session.commit()
 		flash('You are now listed as a collaborator!', 'success')
-		return redirect(url_for('portfolios.view_portfolio', id=product_id))
+	else:
+		flash('You are already associated with this product.', 'danger')
+	return redirect(url_for('portfolios.view_portfolio', id=product_id))
 
 @portfolios.route('/portfolio/remove_supporter/<int:product_id>')
 @login_required
 def remove_supporter_from_product(product_id):
-	product = db.session.query(Portfolio).filter(Portfolio.id == product_id).first()
-	product_owner = product.creator_id
-	user_id = current_user.id
-	collaborators = db.session.query(Portfolio).filter(Portfolio.id == product_id).first()
-	if user_id == product_owner:
+	product = Portfolio.query.get_or_404(product_id)
+	if current_user.id == product.creator_id:
 		flash('You are listed as the owner of this product and cannot untag yourself. You can delete the product if you wish to remove it from your profile.','danger')
 		return redirect(url_for('portfolios.view_portfolio', id=product_id))
-	if collaborators.collaborator_ids is not None:
-		# split the string by comma and convert to list
-		split_collaborators = collaborators.collaborator_ids.split(',')
-		# convert str to int
-		list_collaborators = [eval(i) for i in split_collaborators]
-		
-		if user_id in list_collaborators:
-			list_collaborators.remove(user_id)
-			string_of_collaborators = ','.join(str(x) for x in list_collaborators)
-			db.session.query(Portfolio).filter(Portfolio.id == product_id).update({'collaborator_ids':string_of_collaborators})
-			db.session.commit()
-			
-			# if removing supporter leaves blank column on collaborator_ids, replace text with "NULL"
-			new_collaborators = db.session.query(Portfolio).filter(Portfolio.id == product_id).with_entities(Portfolio.collaborator_ids).first()
-			if len(new_collaborators.collaborator_ids) < 1:
-				db.session.query(Portfolio).filter(Portfolio.id == product_id).update({'collaborator_ids': 0 })
-				db.session.commit()
-			
-			flash('You have removed yourself as a collaborator on this product.', 'success')
-			return redirect(url_for('portfolios.view_portfolio', id=product_id))
-		else: 
-			flash('You are not listed as a collaborator on this product. If you think this error message is not correct, please contact a site administrator.', 'danger')
-			return redirect(url_for('portfolios.view_portfolio', id=product_id))
+	if remove_collaborator(product_id, current_user.id):
+		db.session.commit()
+		flash('You have removed yourself as a collaborator on this product.', 'success')
 	else:
-		flash('This product has no collaborators listed that can be removed.', 'danger')
-		return redirect(url_for('portfolios.view_portfolio', id=product_id))
+		flash('You are not listed as a collaborator on this product. If you think this error message is not correct, please contact a site administrator.', 'danger')
+	return redirect(url_for('portfolios.view_portfolio', id=product_id))
 
 @portfolios.route('/documentation')
 def view_documentation():
@@ -456,6 +458,9 @@ def connect_documentation(product_id):
 			flash('Please correct the errors in the documentation form.', 'danger')
 		return render_template('connect_documentation.html', form=form)	
 		
+# largest page a single /api/portfolio request can ask for
+API_PORTFOLIO_MAX_LIMIT = 500
+
 @portfolios.route('/api/portfolio', methods=['GET'])
 def api_get_products():
 	"""
@@ -464,39 +469,47 @@ def api_get_products():
 	This endpoint retrieves a list of approved products related to a specific
 	disaster identified by the 'emergency_id' parameter.
 	
-	URL: /api/portfolio?emergency_id=<go_emergency_id>
+	URL: /api/portfolio?emergency_id=<go_emergency_id>&limit=<n>&after=<product_id>
 	
 	Method: GET
 	
 	Parameters:
 		emergency_id (str): The ID of the emergency or disaster to retrieve products for.
+		limit (int): Optional page size, capped at API_PORTFOLIO_MAX_LIMIT.
+		after (int): Optional product ID to start after, i.e. the next_after of the previous page.
 	
 	Returns:
-		list: A list of dictionaries containing product information.
+		list: A list of dictionaries containing product information, oldest first.
 		Each dictionary contains the following fields:
+			- id (int): The portal ID of the product.
 			- title (str): The title of the product.
 			- type (str): The category of the product.
 			- description (str): The description provided by the person that posted it.
 			- image_file (str): The s3 URL of the image.
+		When limit is passed, the list is returned as {'products': [...], 'next_after': <id or null>}.
 	
 	Raises:
 		KeyError: If the 'emergency_id' parameter is missing in the request.
 	"""
 	emergency_param = request.args.get('emergency_id')
 	
-	if emergency_param:
-		products = db.session.query(Portfolio, Emergency).join(Emergency, Emergency.id == Portfolio.emergency_id).filter(Portfolio.product_status == "Approved", Emergency.emergency_go_id == emergency_param).order_by(Portfolio.created_at).all()
-	else:
+	if not emergency_param:
 		error_message = {'error': 'No emergency_id provided'}
 		return jsonify(error_message), 400
 	
-	result = [
-		{
-			'title': product.Portfolio.title, 
-			'type': product.Portfolio.type,
-			'description': product.Portfolio.description,
-			'image_file': product.Portfolio.image_file
-		}
-		for product in products
-	]
-	return jsonify(result)
\ No newline at end of file
+	try:
+		limit, after = get_keyset_args(API_PORTFOLIO_MAX_LIMIT)
+	except ValueError as e:
+		return jsonify({'error': str(e)}), 400
+	
+	# the cached list is ordered by id, so paging it is a slice
+	result = get_emergency_products(emergency_param)
+	if after is not None:
+		result = [product for product in result if product['id'] > after]
+	
+	if limit is None:
+		return jsonify(result)
+	
+	page = result[:limit]
+	next_after = page[-1]['id'] if len(result) > limit else None
+	return jsonify({'products': page, 'next_after': next_after})
\ No newline at end of file
@@ -1,98 +1,348 @@
 import os
-import tempfile
 import secrets
+from collections import namedtuple
+from datetime import datetime, timedelta
 
-import boto3
 import dropbox
 from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from werkzeug.utils import secure_filename
 from SIMS_Portal import db
-from SIMS_Portal.models import Portfolio, User
-from PIL import Image
+from sqlalchemy import select, union, event, inspect
+from SIMS_Portal.models import Portfolio, User, Emergency, Log, portfolio_collaborator
+from SIMS_Portal.caching.utils import get_or_build, add_pending_tags
+from SIMS_Portal.images.utils import queue_image_upload
+from SIMS_Portal.main.utils import get_s3_client
 import logging
 
+logger = logging.getLogger(__name__)
 
-def save_portfolio_to_dropbox(form_file, user_id, type):
-	# generate unique string to avoid filename conflicts
-	random_hex = secrets.token_hex(8)
-	# use an access token with ONLY individual scopes (don't select any team scopes)
-	dropbox_access_token = current_app.config['DROPBOX_BOT']
-	filename, file_ext = os.path.splitext(form_file.filename)
-	file_filename = type + '-user'+ str(user_id) + '-' + random_hex + file_ext
-	local_file_path = os.path.join(current_app.root_path, 'static/assets/portfolio', file_filename)
-	dropbox_path = '/SIMS Portal/Portfolio/{}'.format(file_filename)
-	form_file.save(local_file_path)
+# what the mirror pass needs of a claimed product once the claim is committed
+ClaimedDropboxMirror = namedtuple('ClaimedDropboxMirror', ['id', 'attempts'])
+
+def portfolio_file_key(user_id, type, filename):
+	"""
+	Builds a new S3 key for a portfolio file, keeping the '<type>-user<id>-<random>' naming the files had on disk.
+	"""
+	filename, file_ext = os.path.splitext(secure_filename(filename))
+	return 'portfolio/{}-user{}-{}{}'.format(type, user_id, secrets.token_hex(8), file_ext.lower())
+
+def check_portfolio_file_key(user_id, key):
+	# uploads can only be finished or aborted by the member who started them
+	if not key.startswith('portfolio/') or '-user{}-'.format(user_id) not in key:
+		raise ValueError('This upload belongs to someone else')
+
+def portfolio_size_error():
+	return ValueError('Files can be at most {} MB'.format(current_app.config['PORTFOLIO_UPLOAD_MAX_BYTES'] // 1000 // 1000))
+
+def start_portfolio_upload(user_id, type, filename, size, content_type=None):
+	"""
+	Starts a multipart upload of a portfolio file straight from the browser to UPLOAD_BUCKET. Returns the key, the upload id, the part size and one presigned PUT URL per part. Raises ValueError if the file is empty or larger than PORTFOLIO_UPLOAD_MAX_BYTES. The declared size is stored on the upload itself, for finalize_portfolio_upload() to hold the finished file to.
+	"""
+	config = current_app.config
+	if type not in config['PORTFOLIO_TYPES']:
+		raise ValueError('Choose a file type before uploading')
+	if not isinstance(size, int) or size < 1:
+		raise ValueError('The file is empty')
+	if size > config['PORTFOLIO_UPLOAD_MAX_BYTES']:
+		raise portfolio_size_error()
+	
+	s3 = get_s3_client()
+	key = portfolio_file_key(user_id, type, filename)
+	upload = s3.create_multipart_upload(Bucket=config['UPLOAD_BUCKET'], Key=key, ContentType=content_type or 'application/octet-stream', Metadata={'declared-size': str(size)})
+	part_size = config['PORTFOLIO_UPLOAD_PART_BYTES']
+	count_parts = -(-size // part_size)
+	part_urls = [
+		s3.generate_presigned_url('upload_part', Params={'Bucket': config['UPLOAD_BUCKET'], 'Key': key, 'UploadId': upload['UploadId'], 'PartNumber': part_number}, ExpiresIn=config['PORTFOLIO_UPLOAD_URL_SECONDS'])
+		for part_number in range(1, count_parts + 1)
+	]
 	
-	client = dropbox.Dropbox(
-		dropbox_access_token,
+	return {'key': key, 'upload_id': upload['UploadId'], 'part_size': part_size, 'part_urls': part_urls}
+
+def finalize_portfolio_upload(user_id, key, upload_id, parts):
+	"""
+	Completes a multipart upload from start_portfolio_upload() once the browser has sent every part. parts is a list of {'PartNumber', 'ETag'} as S3 returned them to the browser. The presigned part URLs don't limit how much the browser sends, so the finished object's size is checked against PORTFOLIO_UPLOAD_MAX_BYTES and the size declared when the upload started; if either is off the object is deleted and ValueError raised. Returns a signed token for the finished file, carrying the size S3 reports, that the upload form submits in file_token.
+	"""
+	check_portfolio_file_key(user_id, key)
+	try:
+		parts = sorted(({'PartNumber': int(part['PartNumber']), 'ETag': str(part['ETag'])} for part in parts), key=lambda part: part['PartNumber'])
+	except (KeyError, TypeError, ValueError):
+		raise ValueError('Every part needs a PartNumber and an ETag')
+	if not parts:
+		raise ValueError('No parts were uploaded')
+	
+	bucket = current_app.config['UPLOAD_BUCKET']
+	s3 = get_s3_client()
+	s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+	
+	s3_object = s3.head_object(Bucket=bucket, Key=key)
+	size = s3_object['ContentLength']
+	if size > current_app.config['PORTFOLIO_UPLOAD_MAX_BYTES'] or str(size) != s3_object.get('Metadata', {}).get('declared-size'):
+		s3.delete_object(Bucket=bucket, Key=key)
+		logger.warning('Deleted portfolio upload {} from user {}: {} bytes, {} declared'.format(key, user_id, size, s3_object.get('Metadata', {}).get('declared-size')))
+		if size > current_app.config['PORTFOLIO_UPLOAD_MAX_BYTES']:
+			raise portfolio_size_error()
+		raise ValueError('The uploaded file does not match the file that was selected, please try again')
+	return get_portfolio_upload_serializer().dumps({'key': key, 'user_id': user_id, 'size': size})
+
+def abort_portfolio_upload(user_id, key, upload_id):
+	check_portfolio_file_key(user_id, key)
+	get_s3_client().abort_multipart_upload(Bucket=current_app.config['UPLOAD_BUCKET'], Key=key, UploadId=upload_id)
+
+def get_portfolio_upload_serializer():
+	return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='portfolio-upload')
+
+def load_portfolio_upload_token(token, user_id):
+	"""
+	Returns the S3 key and size from a finalize_portfolio_upload() token, or (None, None) if the token is invalid, expired or was issued to someone else.
+	"""
+	try:
+		upload = get_portfolio_upload_serializer().loads(token, max_age=current_app.config['PORTFOLIO_UPLOAD_TOKEN_SECONDS'])
+	except BadSignature:
+		return None, None
+	if upload.get('user_id') != user_id:
+		return None, None
+	return upload['key'], upload.get('size')
+
+def save_portfolio_to_s3(form_file, user_id, type):
+	"""
+	Fallback for browsers that post the file with the form instead of uploading it themselves. The file is streamed from the request to S3 in parts and is never copied to the portal's disk; MAX_CONTENT_LENGTH caps its size. Returns the S3 key and the size S3 reports.
+	"""
+	key = portfolio_file_key(user_id, type, form_file.filename)
+	s3 = get_s3_client()
+	s3.upload_fileobj(form_file.stream, current_app.config['UPLOAD_BUCKET'], key, ExtraArgs={'ContentType': form_file.mimetype or 'application/octet-stream'})
+	return key, s3.head_object(Bucket=current_app.config['UPLOAD_BUCKET'], Key=key)['ContentLength']
+
+def portfolio_download_url(key):
+	"""
+	A short-lived presigned URL that downloads a portfolio file from S3 as an attachment.
+	"""
+	return get_s3_client().generate_presigned_url('get_object', Params={
+		'Bucket': current_app.config['UPLOAD_BUCKET'],
+		'Key': key,
+		'ResponseContentDisposition': 'attachment; filename="{}"'.format(os.path.basename(key))
+	}, ExpiresIn=current_app.config['UPLOAD_PRESIGNED_URL_SECONDS'])
+
+def get_dropbox_client():
+	# use an access token with ONLY individual scopes (don't select any team scopes)
+	return dropbox.Dropbox(
+		current_app.config['DROPBOX_BOT'],
 		app_key = current_app.config['DROPBOX_APP_KEY'],
 		app_secret = current_app.config['DROPBOX_APP_SECRET'],
 		oauth2_refresh_token = current_app.config['DROPBOX_REFRESH_TOKEN']
 	)
+
+def read_s3_chunk(body, chunk_size, key):
+	chunk = body.read(chunk_size)
+	# a dropped connection reads as an early end of file; without this the loop below would keep appending nothing
+	if not chunk:
+		raise IOError('S3 object {} ended before its ContentLength'.format(key))
+	return chunk
+
+def mirror_portfolio_to_dropbox(product_id):
+	"""
+	Copies a product's file from S3 to the portal's Dropbox and records the share link in dropbox_file. The file is streamed from S3 into a Dropbox upload session DROPBOX_CHUNK_BYTES at a time, so only one chunk is ever in memory. A retry overwrites whatever an earlier attempt left at the path. Raises IOError if S3 sends fewer bytes than the object's size.
+	"""
+	key = db.session.query(Portfolio.local_file).filter(Portfolio.id == product_id).scalar()
+	dropbox_path = '/SIMS Portal/Portfolio/{}'.format(os.path.basename(key))
+	chunk_size = current_app.config['DROPBOX_CHUNK_BYTES']
 	
-	uploaded = client.files_upload(open(local_file_path, "rb").read(), dropbox_path)
-	shared_link = client.sharing_create_shared_link(dropbox_path)
+	s3_object = get_s3_client().get_object(Bucket=current_app.config['UPLOAD_BUCKET'], Key=key)
+	body = s3_object['Body']
+	size = s3_object['ContentLength']
+	client = get_dropbox_client()
+	try:
+		chunk = read_s3_chunk(body, chunk_size, key)
+		if len(chunk) >= size:
+			client.files_upload(chunk, dropbox_path, mode=dropbox.files.WriteMode.overwrite)
+		else:
+			session = client.files_upload_session_start(chunk)
+			cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=len(chunk))
+			while True:
+				chunk = read_s3_chunk(body, chunk_size, key)
+				if cursor.offset + len(chunk) >= size:
+					client.files_upload_session_finish(chunk, cursor, dropbox.files.CommitInfo(path=dropbox_path, mode=dropbox.files.WriteMode.overwrite))
+					break
+				client.files_upload_session_append_v2(chunk, cursor)
+				cursor.offset += len(chunk)
+	finally:
+		body.close()
 	
-	share_link = shared_link.url
+	share_link = client.sharing_create_shared_link(dropbox_path).url
+	db.session.query(Portfolio).filter(Portfolio.id == product_id).update({'dropbox_file': share_link}, synchronize_session=False)
+	db.session.commit()
+	return share_link
+
+def queue_dropbox_mirror(product_id):
+	"""
+	Queues a new product's file to be copied to Dropbox by worker.py (see mirror_pending_portfolios()); the product page shows the Dropbox link once it's there. Commits.
+	"""
+	db.session.query(Portfolio).filter(Portfolio.id == product_id).update({
+		'dropbox_status': 'Pending',
+		'dropbox_attempts': 0,
+		'dropbox_next_attempt_at': datetime.utcnow(),
+		'dropbox_error': None
+	}, synchronize_session=False)
+	db.session.commit()
+
+def claim_dropbox_mirrors(now):
+	"""
+	Marks up to DROPBOX_MIRROR_BATCH_SIZE due products as Copying and commits before anything is copied. dropbox_next_attempt_at doubles as the claim's lease: a Copying row whose lease has run out belonged to a worker that died mid-copy and is picked up again.
+	"""
+	lease_until = now + timedelta(seconds=current_app.config['DROPBOX_MIRROR_LEASE_SECONDS'])
+	batch = db.session.query(Portfolio).filter(
+		Portfolio.dropbox_status.in_(['Pending', 'Copying']),
+		Portfolio.dropbox_next_attempt_at <= now
+	).order_by(Portfolio.id).limit(current_app.config['DROPBOX_MIRROR_BATCH_SIZE']).with_for_update(skip_locked=True).all()
 	
-	output = {
-		'file_filename': file_filename, 
-		'share_link': share_link
-	}
+	claimed = []
+	for product in batch:
+		product.dropbox_status = 'Copying'
+		product.dropbox_next_attempt_at = lease_until
+		claimed.append(ClaimedDropboxMirror(product.id, product.dropbox_attempts or 0))
+	db.session.commit()
 	
-	return output
+	return claimed
+
+def update_dropbox_mirror(product_id, **values):
+	db.session.query(Portfolio).filter(Portfolio.id == product_id).update(values, synchronize_session=False)
+	db.session.commit()
 
-def save_cover_image(form_file, user_id, type):
-	random_hex = secrets.token_hex(8)
-	filename, file_ext = os.path.splitext(form_file.filename)
-	file_filename = type + '-user'+ str(user_id) + '-' + random_hex + file_ext
-	file_path = f"portfolio_cover_images/{file_filename}"
+def mirror_pending_portfolios():
+	"""
+	Claims a batch of products waiting for their Dropbox copy (see claim_dropbox_mirrors()) and copies them one by one. Failed copies are retried with exponential backoff until DROPBOX_MIRROR_MAX_ATTEMPTS is reached, then the product is marked Failed with the last error and logged. Returns the number of products copied.
+	"""
+	count_copied = 0
+	for product in claim_dropbox_mirrors(datetime.utcnow()):
+		attempts = product.attempts + 1
+		try:
+			mirror_portfolio_to_dropbox(product.id)
+		except Exception as e:
+			db.session.rollback()
+			error = str(e)[:500]
+			if attempts >= current_app.config['DROPBOX_MIRROR_MAX_ATTEMPTS']:
+				update_dropbox_mirror(product.id, dropbox_status='Failed', dropbox_attempts=attempts, dropbox_error=error)
+				current_app.logger.error('Dropbox mirror of product {} failed after {} attempt(s): {}'.format(product.id, attempts, e))
+				db.session.add(Log(message='[ERROR] Product {} could not be copied to Dropbox: {}'.format(product.id, error)[:500], user_id=0))
+				db.session.commit()
+			else:
+				backoff = current_app.config['DROPBOX_MIRROR_BACKOFF_SECONDS'] * (2 ** (attempts - 1))
+				update_dropbox_mirror(product.id, dropbox_status='Pending', dropbox_attempts=attempts, dropbox_next_attempt_at=datetime.utcnow() + timedelta(seconds=backoff), dropbox_error=error)
+			continue
+		update_dropbox_mirror(product.id, dropbox_status='Copied', dropbox_attempts=attempts, dropbox_error=None)
+		count_copied += 1
 	
-	# downscale image to max width of 850px
-	try:
-		with tempfile.NamedTemporaryFile(suffix=file_ext) as resized_image_file:
-			basewidth = 850
-			img = Image.open(form_file)
-			wpercent = (basewidth/float(img.size[0]))
-			hsize = int((float(img.size[1])*float(wpercent)))
-			img = img.resize((basewidth,hsize), Image.Resampling.LANCZOS)
-			img.save(resized_image_file.name)
-			s3 = boto3.client("s3")
-			s3.upload_file(resized_image_file.name, current_app.config["UPLOAD_BUCKET"], file_path)
-	except Exception as e: 
-		current_app.logger.error('Resize image on save_cover_image function failed: {}'.format(e))
-
-	return file_path
+	return count_copied
+
+def run_dropbox_mirror_pass(app):
+	with app.app_context():
+		try:
+			mirror_pending_portfolios()
+		except Exception as e:
+			db.session.rollback()
+			logger.error('Dropbox mirror pass failed: {}'.format(e))
+		finally:
+			db.session.remove()
+
+def save_cover_image(form_file, user_id, type, product_id):
+	"""
+	Queues an uploaded cover image to be resized into the cover renditions (see images/utils.py). The product shows its format's placeholder until the renditions are uploaded. Keys keep the '<type>-user<id>' naming the templates use to tell uploads from placeholders.
+	"""
+	key_prefix = 'portfolio_cover_images/{}-user{}-{}'.format(type, user_id, secrets.token_hex(8))
+	queue_image_upload('cover', product_id, form_file.read(), key_prefix)
+	return key_prefix
 
 def get_full_portfolio(id):
 	"""Takes in a user's ID and gets all of their products, including those that they are listed as the creator (original poster to the portal) and those that they tagged themselves as a collaborator"""
 	
-	user_info = db.session.query(User).filter(User.id == id).first()
-	all_collaborators_plus_creators = db.session.query(Portfolio.id, Portfolio.collaborator_ids, Portfolio.creator_id, Portfolio.product_status).filter(Portfolio.product_status != 'Removed').all()
-	
-	temp_list = []
-	for item in all_collaborators_plus_creators:
-		temp_dict = {}
-		if item[1] is not None:
-			temp_dict['product_id'] = item[0]
-			temp_dict['user_ids'] = [int(item) for item in item[1].split(',') if item.isdigit()]
-			temp_dict['user_ids'].append(item[2])
-			temp_list.append(temp_dict)
-		else:
-			temp_dict['product_id'] = item[0]
-			temp_dict['user_ids'] = [item[2]]
-			temp_list.append(temp_dict)
-	
-	list_of_product_ids = []
-	for item in temp_list:
-		if id in item['user_ids']:
-			list_of_product_ids.append(item['product_id'])
+	# both halves of the union are index lookups (portfolio.creator_id and portfolio_collaborator.user_id), so this doesn't grow with the size of the portfolio table
+	product_ids = union(
+		select(Portfolio.id).where(Portfolio.creator_id == id),
+		select(portfolio_collaborator.c.portfolio_id).where(portfolio_collaborator.c.user_id == id)
+	)
+	user_portfolio = db.session.query(Portfolio).filter(Portfolio.id.in_(product_ids), Portfolio.product_status != 'Removed').order_by(Portfolio.id).all()
+
+	return user_portfolio
+
+def is_collaborator(product_id, user_id):
+	return db.session.query(portfolio_collaborator.c.user_id).filter(portfolio_collaborator.c.portfolio_id == product_id, portfolio_collaborator.c.user_id == user_id).first() is not None
+
+def add_collaborator(product_id, user_id):
+	"""
+	Tags a member as a collaborator on a product. Returns False, changing nothing, if they already are one. The caller commits.
+	"""
+	if is_collaborator(product_id, user_id):
+		return False
+	db.session.execute(portfolio_collaborator.insert().values(portfolio_id=product_id, user_id=user_id))
+	return True
+
+def remove_collaborator(product_id, user_id):
+	"""
+	Untags a member from a product. Returns False if they weren't a collaborator on it. The caller commits.
+	"""
+	result = db.session.execute(portfolio_collaborator.delete().where(portfolio_collaborator.c.portfolio_id == product_id, portfolio_collaborator.c.user_id == user_id))
+	return result.rowcount > 0
+
+def emergency_products_tag(emergency_id):
+	return 'emergency_products:{}'.format(emergency_id)
+
+def build_emergency_products(emergency_go_id):
+	"""
+	Returns the approved products for every emergency with this GO ID, oldest first, in the shape /api/portfolio serves them.
+	"""
+	products = db.session.query(Portfolio.id, Portfolio.title, Portfolio.type, Portfolio.description, Portfolio.image_file) \
+		.join(Emergency, Emergency.id == Portfolio.emergency_id) \
+		.filter(Portfolio.product_status == 'Approved', Emergency.emergency_go_id == emergency_go_id) \
+		.order_by(Portfolio.id).all()
 	
-	temp_user_portfolio = []
-	for this_product_id in list_of_product_ids:
-		temp_user_portfolio.append(db.session.query(Portfolio).filter(Portfolio.id == this_product_id).all())
+	return [
+		{
+			'id': product.id,
+			'title': product.title,
+			'type': product.type,
+			'description': product.description,
+			'image_file': product.image_file
+		}
+		for product in products
+	]
 
-	user_portfolio = []
-	for product in temp_user_portfolio:
-		user_portfolio.append(product[0])
+def get_emergency_products(emergency_go_id):
+	"""
+	Cached build_emergency_products(). Entries carry a per-emergency tag that _note_emergency_product_changes() queues when a product's listed fields or status change, and invalidate_emergency_products() for writes that don't go through a Portfolio flush.
+	"""
+	emergency_ids = [emergency_id for (emergency_id,) in db.session.query(Emergency.id).filter(Emergency.emergency_go_id == emergency_go_id)]
+	if not emergency_ids:
+		return []
+	tags = [emergency_products_tag(emergency_id) for emergency_id in emergency_ids] + ['emergency:{}'.format(emergency_id) for emergency_id in emergency_ids]
+	return get_or_build('emergency_products/{}'.format(emergency_go_id), lambda: build_emergency_products(emergency_go_id), tags=tags)
 
-	return user_portfolio
+def invalidate_emergency_products(product_id):
+	"""
+	Queues the product list of this product's emergency to be dropped when the current transaction commits.
+	"""
+	emergency_id = db.session.query(Portfolio.emergency_id).filter(Portfolio.id == product_id).scalar()
+	if emergency_id is not None:
+		add_pending_tags(db.session, emergency_products_tag(emergency_id))
+
+# the fields build_emergency_products() reads or filters on
+EMERGENCY_PRODUCT_FIELDS = ('title', 'type', 'description', 'image_file', 'product_status', 'emergency_id')
+
+def _note_emergency_product_changes(session, flush_context, instances):
+	for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+		if not isinstance(instance, Portfolio):
+			continue
+		state = inspect(instance)
+		if instance in session.new or instance in session.deleted:
+			emergency_ids = {instance.emergency_id}
+		else:
+			histories = [state.attrs[field].history for field in EMERGENCY_PRODUCT_FIELDS]
+			if not any(history.has_changes() for history in histories):
+				continue
+			# a product moved to another emergency leaves the old list as well as joining the new one
+			emergency_history = state.attrs.emergency_id.history
+			emergency_ids = {instance.emergency_id} | set(emergency_history.deleted or ())
+		add_pending_tags(session, *[emergency_products_tag(emergency_id) for emergency_id in emergency_ids if emergency_id is not None])
+
+def register_emergency_products_invalidation():
+	# before_flush, while attribute history still shows what the flush is about to write
+	event.listen(db.session, 'before_flush', _note_emergency_product_changes)
@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+
+from flask import g, request, has_request_context, current_app
+from flask_login import current_user
+from sqlalchemy import event
+from SIMS_Portal import db
+from SIMS_Portal.models import Log
+
+logger = logging.getLogger(__name__)
+
+# per-endpoint totals for this worker process, shown on /admin/query_profile
+_endpoint_stats = {}
+_endpoint_stats_lock = threading.Lock()
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	if has_request_context() and g.get('query_profile') is not None:
+		conn.info.setdefault('query_profile_started', []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	if not has_request_context() or g.get('query_profile') is None:
+		return
+	started_stack = conn.info.get('query_profile_started')
+	if not started_stack:
+		return
+	elapsed_ms = (time.perf_counter() - started_stack.pop()) * 1000
+
+	profile = g.query_profile
+	profile['count'] += 1
+	profile['total_ms'] += elapsed_ms
+	profile['statements'].append((elapsed_ms, statement))
+
+	# identical statement and parameters run more than once in the same request
+	key = (statement, repr(parameters))
+	profile['seen'][key] = profile['seen'].get(key, 0) + 1
+
+def start_request_profile():
+	g.query_profile = {'count': 0, 'total_ms': 0.0, 'statements': [], 'seen': {}, 'started': time.perf_counter()}
+
+def finish_request_profile(response):
+	"""
+	Closes out the profile for this request, folds it into the per-endpoint totals, and writes a [PERF] log entry when the request went over QUERY_PROFILER_SLOW_MS or QUERY_PROFILER_MAX_STATEMENTS.
+	"""
+	profile = g.pop('query_profile', None)
+	if profile is None or request.endpoint in (None, 'static'):
+		return response
+
+	request_ms = (time.perf_counter() - profile['started']) * 1000
+	top_n = current_app.config['QUERY_PROFILER_TOP_N']
+	slowest = sorted(profile['statements'], key=lambda s: s[0], reverse=True)[:top_n]
+	duplicates = [(statement, count) for (statement, _), count in profile['seen'].items() if count > 1]
+	count_duplicates = sum(count - 1 for _, count in duplicates)
+
+	with _endpoint_stats_lock:
+		stats = _endpoint_stats.setdefault(request.endpoint, {
+			'endpoint': request.endpoint,
+			'requests': 0,
+			'statements': 0,
+			'db_ms': 0.0,
+			'request_ms': 0.0,
+			'max_statements': 0,
+			'max_db_ms': 0.0,
+			'duplicates': 0,
+			'slow_requests': 0,
+			'slowest': [],
+		})
+		stats['requests'] += 1
+		stats['statements'] += profile['count']
+		stats['db_ms'] += profile['total_ms']
+		stats['request_ms'] += request_ms
+		stats['max_statements'] = max(stats['max_statements'], profile['count'])
+		stats['max_db_ms'] = max(stats['max_db_ms'], profile['total_ms'])
+		stats['duplicates'] += count_duplicates
+		stats['slowest'] = sorted(stats['slowest'] + slowest, key=lambda s: s[0], reverse=True)[:top_n]
+
+		is_slow = profile['total_ms'] >= current_app.config['QUERY_PROFILER_SLOW_MS'] or profile['count'] >= current_app.config['QUERY_PROFILER_MAX_STATEMENTS']
+		if is_slow:
+			stats['slow_requests'] += 1
+
+	if is_slow:
+		log_slow_request(profile, request_ms, slowest, count_duplicates)
+
+	return response
+
+def log_slow_request(profile, request_ms, slowest, count_duplicates):
+	slowest_summary = '; '.join('{:.0f} ms: {}'.format(elapsed_ms, ' '.join(statement.split())[:80]) for elapsed_ms, statement in slowest[:3])
+	log_message = f"[PERF] {request.method} {request.path} ({request.endpoint}) ran {profile['count']} statements, {count_duplicates} duplicate(s), {profile['total_ms']:.0f} ms in the database of {request_ms:.0f} ms total. Slowest: {slowest_summary}"
+	user_id = current_user.id if current_user.is_authenticated else 0
+
+	try:
+		# separate connection so the log row never rides along with the request's own transaction
+		with db.engine.begin() as connection:
+			connection.execute(Log.__table__.insert().values(message=log_message[:500], user_id=user_id))
+	except Exception as e:
+		logger.error('Could not write query profile log entry: {}'.format(e))
+
+def get_endpoint_stats():
+	"""
+	Returns the per-endpoint totals collected by this worker, busiest database time first.
+	"""
+	with _endpoint_stats_lock:
+		rows = [dict(stats, slowest=list(stats['slowest'])) for stats in _endpoint_stats.values()]
+
+	for row in rows:
+		row['avg_statements'] = row['statements'] / row['requests']
+		row['avg_db_ms'] = row['db_ms'] / row['requests']
+		row['avg_request_ms'] = row['request_ms'] / row['requests']
+
+	return sorted(rows, key=lambda row: row['db_ms'], reverse=True)
+
+def reset_endpoint_stats():
+	with _endpoint_stats_lock:
+		_endpoint_stats.clear()
+
+def init_query_profiler(app):
+	"""
+	Hooks the profiler into the engine and request cycle. Only called when QUERY_PROFILER is switched on, so it costs nothing otherwise.
+	"""
+	with app.app_context():
+		engine = db.get_engine(app)
+	event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+	event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+	app.before_request(start_request_profile)
+	app.after_request(finish_request_profile)
@@ -0,0 +1,91 @@
+from flask import (
+	request, render_template, jsonify, Blueprint, current_app
+)
+from flask_login import current_user
+
+from SIMS_Portal.search.utils import SEARCH_TYPES, search_records, search_counts, autocomplete, visible_types
+
+search = Blueprint('search', __name__)
+
+def get_page_args():
+	"""
+	Reads page and per_page from the query string, capping per_page at SEARCH_MAX_PER_PAGE. Raises ValueError for anything that isn't a positive integer.
+	"""
+	page = request.args.get('page', '1')
+	per_page = request.args.get('per_page', str(current_app.config['SEARCH_RESULTS_PER_PAGE']))
+	if not page.isdigit() or not per_page.isdigit() or int(page) < 1 or int(per_page) < 1:
+		raise ValueError('page and per_page must be positive integers')
+	return int(page), min(int(per_page), current_app.config['SEARCH_MAX_PER_PAGE'])
+
+def get_search_type():
+	search_type = request.args.get('type', 'all')
+	if search_type != 'all' and search_type not in SEARCH_TYPES:
+		raise ValueError('type must be one of all, {}'.format(', '.join(SEARCH_TYPES)))
+	return search_type
+
+@search.route('/search', methods=['GET'])
+def search_page():
+	q = request.args.get('q', '').strip()
+	try:
+		search_type = get_search_type()
+		page, per_page = get_page_args()
+	except ValueError:
+		search_type, page, per_page = 'all', 1, current_app.config['SEARCH_RESULTS_PER_PAGE']
+
+	logged_in = current_user.is_authenticated
+	types = None if search_type == 'all' else [search_type]
+	results, total = search_records(q, types=types, page=page, per_page=per_page, logged_in=logged_in)
+	counts = search_counts(q, logged_in=logged_in) if q else {}
+	count_pages = (total + per_page - 1) // per_page
+
+	tabs = [('all', 'All')] + [(name, SEARCH_TYPES[name]['label']) for name in visible_types(None, logged_in)]
+	return render_template('search.html', title='Search', q=q, search_type=search_type, results=results, total=total, counts=counts, tabs=tabs, page=page, count_pages=count_pages, search_types=SEARCH_TYPES)
+
+@search.route('/api/search', methods=['GET'])
+def api_search():
+	"""
+	Full-text search over members, products, emergencies and acronyms
+
+	URL: /api/search?q=<query>&type=<type>&page=<n>&per_page=<n>
+
+	Method: GET
+
+	Parameters:
+		q (str): The search terms. Quoted phrases, OR and -excluded words are understood on Postgres.
+		type (str): Optional, one of members, products, emergencies or acronyms. Searches all of them by default.
+		page (int): Optional page number, starting at 1.
+		per_page (int): Optional page size, capped at SEARCH_MAX_PER_PAGE.
+
+	Returns:
+		{'results': [...], 'total': <n>, 'page': <n>, 'per_page': <n>}, best match first. Each result has type, id, title, subtitle, url and rank. Anonymous requests only see public records, and no emergencies.
+	"""
+	q = request.args.get('q', '').strip()
+	if not q:
+		return jsonify({'error': 'No q provided'}), 400
+
+	try:
+		search_type = get_search_type()
+		page, per_page = get_page_args()
+	except ValueError as e:
+		return jsonify({'error': str(e)}), 400
+
+	types = None if search_type == 'all' else [search_type]
+	results, total = search_records(q, types=types, page=page, per_page=per_page, logged_in=current_user.is_authenticated)
+	return jsonify({'results': results, 'total': total, 'page': page, 'per_page': per_page})
+
+@search.route('/api/search/autocomplete', methods=['GET'])
+def api_search_autocomplete():
+	"""
+	Suggestions for a search box as the user types
+
+	URL: /api/search/autocomplete?q=<partial query>
+
+	Method: GET
+
+	Returns:
+		A list of up to SEARCH_AUTOCOMPLETE_LIMIT results shaped like those of /api/search, where the last word of q only has to start a word.
+	"""
+	q = request.args.get('q', '').strip()
+	if not q:
+		return jsonify([])
+	return jsonify(autocomplete(q, logged_in=current_user.is_authenticated, limit=current_app.config['SEARCH_AUTOCOMPLETE_LIMIT']))
@@ -0,0 +1,333 @@
+import logging
+import re
+
+from flask import current_app, url_for
+from sqlalchemy import bindparam, event, inspect, text
+from SIMS_Portal import db
+from SIMS_Portal.models import User, Portfolio, Emergency, Acronym, Log
+from SIMS_Portal.jobs.utils import report_progress
+
+logger = logging.getLogger(__name__)
+
+# Postgres ranks with setweight() letters and ts_rank_cd's default weights; the SQLite FTS5 fallback turns them into bm25() column weights
+SEARCH_WEIGHTS = {'A': 10.0, 'B': 4.0, 'C': 1.0}
+
+# every searchable record type. document is the text a row is indexed on, where {agg} is string_agg on Postgres and group_concat on SQLite (same arguments) and {where} limits it to some ids; fields are (document column, weight, Postgres text search configuration) and attributes are the model attributes that feed the document, so other edits don't reindex the row. visible filters rows for logged in users and visible_public for everyone else; login_required types are left out of anonymous searches altogether
+SEARCH_TYPES = {
+	'members': {
+		'label': 'Members',
+		'model': User,
+		'table': '"user"',
+		'document': """
+			SELECT t.id,
+				t.firstname || ' ' || t.lastname AS name,
+				(SELECT {agg}(skill.name, ' ') FROM user_skill JOIN skill ON skill.id = user_skill.skill_id WHERE user_skill.user_id = t.id) AS skills,
+				(SELECT {agg}(language.name, ' ') FROM user_language JOIN language ON language.id = user_language.language_id WHERE user_language.user_id = t.id) AS languages,
+				t.job_title, t.bio
+			FROM "user" t {where}
+		""",
+		'fields': [('name', 'A', 'simple'), ('skills', 'B', 'simple'), ('languages', 'B', 'simple'), ('job_title', 'C', 'english'), ('bio', 'C', 'english')],
+		'attributes': ['firstname', 'lastname', 'job_title', 'bio', 'skills', 'languages'],
+		'joins': '',
+		'title': "t.firstname || ' ' || t.lastname",
+		'subtitle': 't.job_title',
+		'visible': "t.status = 'Active'",
+		'visible_public': "t.status = 'Active' AND (t.private_profile IS NULL OR t.private_profile = false)",
+		'login_required': False,
+		'endpoint': 'users.view_profile',
+	},
+	'products': {
+		'label': 'Products',
+		'model': Portfolio,
+		'table': 'portfolio',
+		'document': """
+			SELECT t.id, t.title, t.type, t.format, t.description
+			FROM portfolio t {where}
+		""",
+		'fields': [('title', 'A', 'simple'), ('type', 'B', 'simple'), ('format', 'B', 'simple'), ('description', 'C', 'english')],
+		'attributes': ['title', 'type', 'format', 'description'],
+		'joins': '',
+		'title': 't.title',
+		'subtitle': 't.type',
+		'visible': "t.product_status <> 'Removed'",
+		'visible_public': "t.product_status = 'Approved' AND t.external = true",
+		'login_required': False,
+		'endpoint': 'portfolios.view_portfolio',
+	},
+	'emergencies': {
+		'label': 'Emergencies',
+		'model': Emergency,
+		'table': 'emergency',
+		'document': """
+			SELECT t.id, t.emergency_name, t.emergency_glide, et.emergency_type_name, ns.country_name, t.activation_details
+			FROM emergency t
+			LEFT JOIN emergencytype et ON et.id = t.emergency_type_id
+			LEFT JOIN nationalsociety ns ON ns.ns_go_id = t.emergency_location_id
+			{where}
+		""",
+		'fields': [('emergency_name', 'A', 'simple'), ('emergency_glide', 'B', 'simple'), ('emergency_type_name', 'B', 'simple'), ('country_name', 'B', 'simple'), ('activation_details', 'C', 'english')],
+		'attributes': ['emergency_name', 'emergency_glide', 'emergency_type_id', 'emergency_location_id', 'activation_details'],
+		'joins': 'LEFT JOIN emergencytype et ON et.id = t.emergency_type_id',
+		'title': 't.emergency_name',
+		'subtitle': 'et.emergency_type_name',
+		'visible': "t.emergency_status <> 'Removed'",
+		'visible_public': "t.emergency_status <> 'Removed'",
+		'login_required': True,
+		'endpoint': 'emergencies.view_emergency',
+	},
+	'acronyms': {
+		'label': 'Acronyms',
+		'model': Acronym,
+		'table': 'acronym',
+		'document': """
+			SELECT t.id, t.acronym_eng, t.acronym_esp, t.acronym_fra, t.def_eng, t.def_esp, t.def_fra, t.expl_eng, t.expl_esp, t.expl_fra
+			FROM acronym t {where}
+		""",
+		'fields': [
+			('acronym_eng', 'A', 'simple'), ('acronym_esp', 'A', 'simple'), ('acronym_fra', 'A', 'simple'),
+			('def_eng', 'B', 'english'), ('def_esp', 'B', 'spanish'), ('def_fra', 'B', 'french'),
+			('expl_eng', 'C', 'english'), ('expl_esp', 'C', 'spanish'), ('expl_fra', 'C', 'french'),
+		],
+		'attributes': ['acronym_eng', 'acronym_esp', 'acronym_fra', 'def_eng', 'def_esp', 'def_fra', 'expl_eng', 'expl_esp', 'expl_fra'],
+		'joins': '',
+		'title': 'COALESCE(t.acronym_eng, t.acronym_esp, t.acronym_fra)',
+		'subtitle': 'COALESCE(t.def_eng, t.def_esp, t.def_fra)',
+		'visible': 't.approved_by > 0',
+		'visible_public': 't.approved_by > 0',
+		'login_required': False,
+		'endpoint': 'acronym.view_acronym',
+	},
+}
+
+SEARCH_TYPES_BY_MODEL = {spec['model']: name for name, spec in SEARCH_TYPES.items()}
+
+# subtitles come from bios and descriptions, so they're cut down for the result lists
+SEARCH_SUBTITLE_LENGTH = 160
+
+# set once init_search_index() has created the SQLite FTS5 tables, so flushes against a plain SQLite database (e.g. the benchmarks) don't fail on missing tables
+_fts_ready = False
+
+def is_sqlite(connection=None):
+	return (connection or db.session.connection()).dialect.name == 'sqlite'
+
+def search_terms(q):
+	return re.findall(r'\w+', q or '', re.UNICODE)[:20]
+
+def fts_table(search_type):
+	return 'search_' + search_type
+
+def document_sql(search_type, sqlite, ids=False):
+	where = 'WHERE t.id IN :ids' if ids else ''
+	return SEARCH_TYPES[search_type]['document'].format(agg='group_concat' if sqlite else 'string_agg', where=where)
+
+def search_vector_sql(search_type):
+	"""
+	The Postgres tsvector for a row of document_sql(), aliased d.
+	"""
+	return ' || '.join(
+		"setweight(to_tsvector('{}', COALESCE(d.{}, '')), '{}')".format(config, column, weight)
+		for column, weight, config in SEARCH_TYPES[search_type]['fields']
+	)
+
+def search_query_sql(search_type, prefix):
+	"""
+	The Postgres tsquery for :q, ORed across every text search configuration the type is indexed with, so stemmed and unstemmed fields both match. Autocomplete passes an already built 'a & b:*' string to to_tsquery(); full searches get websearch_to_tsquery(), which understands quotes, OR and -.
+	"""
+	function = 'to_tsquery' if prefix else 'websearch_to_tsquery'
+	configs = list(dict.fromkeys(config for column, weight, config in SEARCH_TYPES[search_type]['fields']))
+	return '({})'.format(' || '.join("{}('{}', :q)".format(function, config) for config in configs))
+
+def fts_match(terms, prefix):
+	# every term is quoted, so user input can't be read as FTS5 syntax; the last one is a prefix for autocomplete
+	match = ['"{}"'.format(term) for term in terms]
+	if prefix:
+		match[-1] += '*'
+	return ' '.join(match)
+
+def visible_types(types, logged_in):
+	types = [search_type for search_type in (types or SEARCH_TYPES) if search_type in SEARCH_TYPES]
+	return [search_type for search_type in types if logged_in or not SEARCH_TYPES[search_type]['login_required']]
+
+def matches_sql(types, logged_in, prefix, sqlite):
+	"""
+	UNION ALL of one ranked select per type, with type, id, title, subtitle and rank columns.
+	"""
+	selects = []
+	for search_type in types:
+		spec = SEARCH_TYPES[search_type]
+		visible = spec['visible'] if logged_in else spec['visible_public']
+		if sqlite:
+			table = fts_table(search_type)
+			weights = ', '.join(str(SEARCH_WEIGHTS[weight]) for column, weight, config in spec['fields'])
+			selects.append(
+				"SELECT '{type}' AS type, t.id AS id, {title} AS title, {subtitle} AS subtitle, -bm25({table}, {weights}) AS rank "
+				"FROM {table} JOIN {model_table} t ON t.id = {table}.rowid {joins} "
+				"WHERE {table} MATCH :q AND {visible}".format(type=search_type, title=spec['title'], subtitle=spec['subtitle'], table=table, weights=weights, model_table=spec['table'], joins=spec['joins'], visible=visible)
+			)
+		else:
+			query = search_query_sql(search_type, prefix)
+			selects.append(
+				"SELECT '{type}' AS type, t.id AS id, {title} AS title, {subtitle} AS subtitle, ts_rank_cd(t.search_vector, {query}, 1) AS rank "
+				"FROM {model_table} t {joins} "
+				"WHERE t.search_vector @@ {query} AND {visible}".format(type=search_type, title=spec['title'], subtitle=spec['subtitle'], query=query, model_table=spec['table'], joins=spec['joins'], visible=visible)
+			)
+	return ' UNION ALL '.join(selects)
+
+def search_param(q, terms, prefix, sqlite):
+	if sqlite:
+		return fts_match(terms, prefix)
+	if prefix:
+		return ' & '.join(terms) + ':*'
+	return q.strip()[:200]
+
+def search_records(q, types=None, page=1, per_page=20, logged_in=False, prefix=False):
+	"""
+	Ranked search over the given types (all of them by default). Returns (results, total), where results is one page of dicts with type, id, title, subtitle, url and rank, best match first, and total counts every match. prefix treats the last word as the start of a word, for autocomplete.
+	"""
+	terms = search_terms(q)
+	types = visible_types(types, logged_in)
+	if not terms or not types:
+		return [], 0
+
+	sqlite = is_sqlite()
+	statement = text(
+		'SELECT type, id, title, subtitle, rank, count(*) OVER () AS total FROM ({}) matches '
+		'ORDER BY rank DESC, type, id LIMIT :limit OFFSET :offset'.format(matches_sql(types, logged_in, prefix, sqlite))
+	)
+	rows = db.session.execute(statement, {'q': search_param(q, terms, prefix, sqlite), 'limit': per_page, 'offset': (page - 1) * per_page}).all()
+
+	results = [{
+		'type': row.type,
+		'id': row.id,
+		'title': row.title,
+		'subtitle': (row.subtitle or '')[:SEARCH_SUBTITLE_LENGTH],
+		'url': url_for(SEARCH_TYPES[row.type]['endpoint'], id=row.id),
+		'rank': float(row.rank),
+	} for row in rows]
+
+	# a page past the end has no rows to read the total from
+	total = rows[0].total if rows else (search_counts(q, types, logged_in)['all'] if page > 1 else 0)
+	return results, total
+
+def search_counts(q, types=None, logged_in=False):
+	"""
+	Number of matches per type, plus 'all', for the tabs on the search page.
+	"""
+	types = visible_types(types, logged_in)
+	counts = {search_type: 0 for search_type in types}
+	terms = search_terms(q)
+	if terms and types:
+		sqlite = is_sqlite()
+		statement = text('SELECT type, count(*) AS count FROM ({}) matches GROUP BY type'.format(matches_sql(types, logged_in, False, sqlite)))
+		counts.update({row.type: row.count for row in db.session.execute(statement, {'q': search_param(q, terms, False, sqlite)})})
+	counts['all'] = sum(counts.values())
+	return counts
+
+def autocomplete(q, logged_in=False, limit=8):
+	return search_records(q, page=1, per_page=limit, logged_in=logged_in, prefix=True)[0]
+
+def reindex_rows(connection, search_type, ids=None):
+	"""
+	Recomputes the search index entries of the given rows of a type, or of every row when ids is None. Ids that no longer exist are dropped from the SQLite index; on Postgres their vector went with the row.
+	"""
+	sqlite = is_sqlite(connection)
+	if sqlite and not _fts_ready:
+		return
+
+	params = {}
+	if ids is not None:
+		ids = list(ids)
+		if not ids:
+			return
+		params['ids'] = ids
+
+	def statement(sql):
+		statement = text(sql)
+		if ids is not None:
+			statement = statement.bindparams(bindparam('ids', expanding=True))
+		return statement
+
+	spec = SEARCH_TYPES[search_type]
+	document = document_sql(search_type, sqlite, ids=ids is not None)
+	if sqlite:
+		table = fts_table(search_type)
+		columns = ', '.join(column for column, weight, config in spec['fields'])
+		if ids is None:
+			connection.execute(text('DELETE FROM {}'.format(table)))
+		else:
+			connection.execute(statement('DELETE FROM {} WHERE rowid IN :ids'.format(table)), params)
+		connection.execute(statement('INSERT INTO {table} (rowid, {columns}) SELECT d.id, {columns} FROM ({document}) d'.format(table=table, columns=columns, document=document)), params)
+	else:
+		connection.execute(statement('UPDATE {table} AS target SET search_vector = {vector} FROM ({document}) d WHERE target.id = d.id'.format(table=spec['table'], vector=search_vector_sql(search_type), document=document)), params)
+
+def _indexed_attributes_changed(instance, search_type):
+	state = inspect(instance)
+	if state.was_deleted or state.deleted:
+		return True
+	return any(state.attrs[attribute].history.has_changes() for attribute in SEARCH_TYPES[search_type]['attributes'])
+
+def _reindex_flushed_rows(session, flush_context):
+	changed = {}
+	for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+		search_type = SEARCH_TYPES_BY_MODEL.get(type(instance))
+		if search_type is None or getattr(instance, 'id', None) is None:
+			continue
+		if instance in session.new or _indexed_attributes_changed(instance, search_type):
+			changed.setdefault(search_type, set()).add(instance.id)
+
+	if changed:
+		connection = session.connection()
+		for search_type, ids in changed.items():
+			reindex_rows(connection, search_type, ids)
+
+def register_search_indexing():
+	"""
+	Keeps the search index current for ORM writes: after each flush, the rows whose indexed attributes changed are reindexed in the same transaction. Bulk query(...).update() calls that change indexed text bypass the flush and need rebuild_search_index(); status changes don't, since visibility is checked at query time.
+	"""
+	event.listen(db.session, 'after_flush', _reindex_flushed_rows)
+
+def init_search_index(app):
+	"""
+	Creates the FTS5 tables the SQLite fallback searches, for local development without Postgres, and fills any that are empty. Does nothing on Postgres, where the search_vector columns come from the migrations.
+	"""
+	global _fts_ready
+	with app.app_context():
+		if db.engine.dialect.name != 'sqlite':
+			return
+		with db.engine.begin() as connection:
+			for search_type, spec in SEARCH_TYPES.items():
+				columns = ', '.join(column for column, weight, config in spec['fields'])
+				connection.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}, tokenize='porter unicode61 remove_diacritics 2')".format(fts_table(search_type), columns)))
+			_fts_ready = True
+			for search_type in SEARCH_TYPES:
+				if not connection.execute(text('SELECT count(*) FROM {}'.format(fts_table(search_type)))).scalar():
+					reindex_rows(connection, search_type)
+
+def rebuild_search_index():
+	"""
+	Reindexes every searchable row in batches, for repairing drift after bulk updates or a change to SEARCH_TYPES.
+	"""
+	batch_size = current_app.config['SEARCH_REBUILD_BATCH_SIZE']
+	ids_by_type = {search_type: [row[0] for row in db.session.query(spec['model'].id).order_by(spec['model'].id)] for search_type, spec in SEARCH_TYPES.items()}
+	total = sum(len(ids) for ids in ids_by_type.values())
+
+	done = 0
+	for search_type, ids in ids_by_type.items():
+		# the SQLite index can hold rows that have since been deleted, so it's rebuilt whole
+		if is_sqlite():
+			report_progress(done, total, 'Indexing {}'.format(SEARCH_TYPES[search_type]['label'].lower()))
+			reindex_rows(db.session.connection(), search_type)
+			db.session.commit()
+			done += len(ids)
+			continue
+		for batch_start in range(0, len(ids), batch_size):
+			report_progress(done, total, 'Indexing {}'.format(SEARCH_TYPES[search_type]['label'].lower()))
+			batch = ids[batch_start:batch_start + batch_size]
+			reindex_rows(db.session.connection(), search_type, batch)
+			db.session.commit()
+			done += len(batch)
+
+	log_message = '[INFO] The search index was rebuilt for {} records.'.format(total)
+	current_app.logger.info(log_message)
+	db.session.add(Log(message=log_message, user_id=0))
+	db.session.commit()
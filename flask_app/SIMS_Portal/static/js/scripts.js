@@ -72,6 +72,15 @@ $(document).ready(function () {
 	});
 });
 
+$(document).ready(function () {
+	$('#query-profile-datatable').DataTable({
+		order: [[4, 'desc']],
+		lengthChange: true,
+		searching: true,
+		pageLength: 100,
+	});
+});
+
 $(document).ready(function () {
 	$('#acronyms-preview-datatable').DataTable({
 		order: [[0, 'desc']],
@@ -92,11 +101,14 @@ $(document).ready(function () {
 });
 
 $(document).ready(function () {
+	// the page is one server-side page of the glossary (already sorted, or ranked by the search), so DataTables only lays it out; the full CSV is /acronyms/export.csv
 	$('#acronyms-datatable').DataTable({
-		order: [[0, 'asc']],
-		lengthChange: false,
+		ordering: false,
+		paging: false,
+		searching: false,
+		info: false,
 		autoWidth: true,
-		dom: 'frtipB', 
+		dom: 'rtB', 
 		buttons: [
 			{
 				extend: 'copy',
@@ -104,17 +116,6 @@ $(document).ready(function () {
 					columns: [0, 2, 5, 6, 7, 8, 9]
 				}
 			},
-			{
-				extend: 'csv',
-				filename: function () {
-					// customize the csv file name
-					return "SIMS_Portal_Acronyms";
-				},
-				exportOptions: {
-					columns: [0, 2, 5, 6, 7, 8, 9] 
-				},
-				charset: 'utf-8' 
-			},
 		],
 		columns: [
 			null, 
@@ -394,4 +395,104 @@ $(document).ready(function() {
   $("h5").html(function(_, html) {
 	return html.replace(/(\#\w+)/g, '<span class="tweet">$1</span>');
   });
-});
\ No newline at end of file
+});
+// member, emergency and country pickers (RemoteSelectField in main/fields.py): the <select> only holds the current choice, so swap it for a search box that pages options in from its data-remote-select URL
+$(document).ready(function() {
+  document.querySelectorAll('select[data-remote-select]').forEach(function(select) {
+	const url = select.dataset.remoteSelect;
+	const wrapper = document.createElement('div');
+	const input = document.createElement('input');
+	const menu = document.createElement('div');
+	let page = 1;
+	let more = false;
+	let loading = false;
+	let latest = 0;
+	let timer = null;
+
+	wrapper.className = 'position-relative';
+	input.type = 'search';
+	input.className = select.className;
+	input.autocomplete = 'off';
+	input.placeholder = select.dataset.placeholder || 'Type to search...';
+	menu.className = 'list-group position-absolute w-100 shadow-sm d-none overflow-auto';
+	menu.style.maxHeight = '300px';
+	menu.style.zIndex = 1000;
+	select.classList.add('d-none');
+	select.parentNode.insertBefore(wrapper, select);
+	wrapper.append(input, menu, select);
+
+	function selectedText() {
+	  const option = select.options[select.selectedIndex];
+	  return option && option.value ? option.text : '';
+	}
+	input.value = selectedText();
+
+	function load(reset) {
+	  if (reset) {
+		page = 1;
+	  }
+	  const request = ++latest;
+	  loading = true;
+	  fetch(url + (url.indexOf('?') === -1 ? '?' : '&') + 'q=' + encodeURIComponent(input.value.trim()) + '&page=' + page)
+		.then(function(response) { return response.json(); })
+		.then(function(data) {
+		  if (request !== latest) {
+			return;
+		  }
+		  if (reset) {
+			menu.innerHTML = '';
+			menu.scrollTop = 0;
+		  }
+		  data.results.forEach(function(result) {
+			const item = document.createElement('button');
+			item.type = 'button';
+			item.className = 'list-group-item list-group-item-action';
+			item.textContent = result.text;
+			// mousedown rather than click, so it lands before the input's blur
+			item.addEventListener('mousedown', function(event) {
+			  event.preventDefault();
+			  choose(result);
+			});
+			menu.appendChild(item);
+		  });
+		  more = data.more;
+		  loading = false;
+		  menu.classList.toggle('d-none', menu.children.length === 0);
+		})
+		.catch(function() { loading = false; });
+	}
+
+	function choose(result) {
+	  let option = Array.from(select.options).find(function(option) { return option.value === String(result.id); });
+	  if (!option) {
+		option = new Option(result.text, result.id);
+		select.add(option);
+	  }
+	  select.value = String(result.id);
+	  input.value = result.text;
+	  menu.classList.add('d-none');
+	  select.dispatchEvent(new Event('change', { bubbles: true }));
+	}
+
+	input.addEventListener('focus', function() { load(true); });
+	input.addEventListener('input', function() {
+	  clearTimeout(timer);
+	  if (!input.value.trim()) {
+		select.value = '';
+	  }
+	  timer = setTimeout(function() { load(true); }, 150);
+	});
+	input.addEventListener('blur', function() {
+	  menu.classList.add('d-none');
+	  input.value = selectedText();
+	});
+	// keep focus in the input when dragging the menu's scrollbar
+	menu.addEventListener('mousedown', function(event) { event.preventDefault(); });
+	menu.addEventListener('scroll', function() {
+	  if (more && !loading && menu.scrollTop + menu.clientHeight >= menu.scrollHeight - 20) {
+		page += 1;
+		load(false);
+	  }
+	});
+  });
+});
@@ -4,6 +4,7 @@ from flask_wtf.file import FileField, FileAllowed
 from flask_login import current_user
 from wtforms import StringField, PasswordField, FileField, SubmitField, BooleanField, IntegerField, DateField, DateTimeField, TextAreaField, SelectField, SelectMultipleField, RadioField
 from wtforms_sqlalchemy.fields import QuerySelectField
+from SIMS_Portal.main.fields import RemoteSelectField
 from flask_sqlalchemy import SQLAlchemy
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError, Optional
 from SIMS_Portal.models import User, Emergency, NationalSociety, EmergencyType, Portfolio, Skill, Language, Profile, Region
@@ -12,7 +13,7 @@ class RegistrationForm(FlaskForm):
 	firstname = StringField('First Name', validators=[DataRequired(), Length(min=2, max=40)])
 	lastname = StringField('Last Name', validators=[DataRequired(), Length(min=2, max=40)])
 	email = StringField('Email', validators=[DataRequired(), Email()])
-	ns_id = QuerySelectField('National Society Country', query_factory=lambda:NationalSociety.query.all(), get_label='country_name', allow_blank=True)
+	ns_id = RemoteSelectField('National Society Country', source='national_societies', allow_blank=True)
 	slack_id = StringField('SIMS Slack ID', validators=[DataRequired()])
 	password = PasswordField('Password', validators=[DataRequired(), Length(min=6, max=24)])
 	confirm_password = PasswordField('Confirm Password', validators=[DataRequired(), Length(min=6, max=24), EqualTo('password')])
@@ -30,7 +31,7 @@ class LoginForm(FlaskForm):
 	submit = SubmitField('Login')
 
 class AssignProfileTypesForm(FlaskForm):
-	user_name = QuerySelectField('Member', query_factory=lambda:User.query.order_by(User.firstname).filter(User.status == 'Active').all(), get_label='fullname', allow_blank=True)
+	user_name = RemoteSelectField('Member', source='users', allow_blank=True)
 	profiles = QuerySelectField('Profiles', query_factory=lambda:Profile.query.order_by(Profile.name).all(), get_label='name', allow_blank=True, validators=[DataRequired()])
 	tier = SelectField('Tier', choices=[('',''), ('1', '1 - Foundational'), ('2', '2 - Officer'), ('3', '3 - Coordinator'), ('4', '4 - Manager')])
 	submit = SubmitField('Assign')
@@ -42,7 +43,7 @@ class UpdateAccountForm(FlaskForm):
 	email = StringField('Email', validators=[DataRequired(), Email()])
 	job_title = StringField('Job Title')
 	unit = StringField('Unit')
-	ns_id = QuerySelectField('National Society Country', query_factory=lambda:NationalSociety.query.all(), get_label='country_name', allow_blank=True)
+	ns_id = RemoteSelectField('National Society Country', source='national_societies', allow_blank=True)
 	bio = TextAreaField('Short Bio (Supports Markdown)', render_kw={'style':'height: 200px'})
 	birthday = DateField('Birthday')
 	linked_in = StringField('LinkedIn ID')
@@ -83,6 +84,6 @@ class UserLocationForm(FlaskForm):
 	submit = SubmitField('Search')
 
 class RegionalFocalPointForm(FlaskForm):
-	user_name = QuerySelectField('Member', query_factory=lambda: User.query.order_by(User.firstname).filter(User.status == 'Active').all(), get_label='fullname', allow_blank=True)
+	user_name = RemoteSelectField('Member', source='users', allow_blank=True)
 	region = QuerySelectField('Region', query_factory=lambda: Region.query.order_by(Region.name).all(), get_label='name', allow_blank=True)
 	submit = SubmitField('Assign Regional Focal Point')
\ No newline at end of file
@@ -28,11 +28,16 @@ from SIMS_Portal.users.forms import (
 from SIMS_Portal.users.utils import (
 	save_picture, new_user_slack_alert, send_slack_dm,
 	check_valid_slack_ids, send_reset_slack, search_location,
-	update_member_locations, update_robots_txt
+	update_member_locations, update_robots_txt, get_user_stats,
+	get_qualifying_profiles
 )
 from SIMS_Portal.portfolios.utils import get_full_portfolio
 from SIMS_Portal.users.utils import download_profile_photo
-from SIMS_Portal.main.utils import send_error_message
+from SIMS_Portal.images.utils import flash_image_upload_status
+from SIMS_Portal.main.utils import (
+	send_error_message, make_etag, not_modified, get_keyset_args,
+	ndjson_response
+)
 
 users = Blueprint('users', __name__)
 
@@ -69,19 +74,13 @@ def inactive_members():
 def members_all(): 
 	members = db.session.execute("""
 		SELECT u.id, u.firstname, u.lastname, u.status, u.email, u.job_title, u.slack_id, u.ns_id,
-			   u.image_file, ns.ns_name, pg_catalog.string_agg(DISTINCT l.name, ', ') as languages,
-			   pg_catalog.string_agg(DISTINCT s.name, ', ') as skills,
-			   pg_catalog.string_agg(DISTINCT p.name, ', ') as profiles
+			   u.image_file, u.image_renditions, ns.ns_name, array_to_string(us.languages, ', ') as languages,
+			   array_to_string(us.skills, ', ') as skills,
+			   array_to_string(us.profiles, ', ') as profiles
 		FROM "user" u
 		JOIN nationalsociety ns ON ns.ns_go_id = u.ns_id
-		LEFT JOIN user_language ul ON ul.user_id = u.id
-		LEFT JOIN language l ON l.id = ul.language_id
-		LEFT JOIN user_profile up ON up.user_id = u.id
-		LEFT JOIN profile p ON p.id = up.profile_id
-		LEFT JOIN user_skill us ON us.user_id = u.id
-		LEFT JOIN skill s ON s.id = us.skill_id
+		LEFT JOIN user_stats us ON us.user_id = u.id
 		WHERE u.status = 'Active' OR u.status = 'Inactive'
-		GROUP BY u.id, ns.ns_name
 		ORDER BY u.firstname
 	""")
 	return render_template('members_all.html', members=members)
@@ -188,34 +187,18 @@ def profile():
 	user_portfolio = get_full_portfolio(current_user.id)
 	user_portfolio_size = len(user_portfolio)
 	
-	user_products = db.session.query(User, Portfolio).join(Portfolio, Portfolio.creator_id==User.id).where(or_(User.id==current_user.id, Portfolio.collaborator_ids.like(str(user_info.id)))).filter(Portfolio.product_status != 'Removed').all()
-	
-	skills_list = db.engine.execute(text('SELECT * FROM "user" JOIN user_skill ON "user".id = user_skill.user_id JOIN skill ON skill.id = user_skill.skill_id WHERE "user".id=:current_user'), {'current_user': current_user.id})
-	
-	qualifying_profile_list_query = text("""
-		SELECT profile.image, profile.name
-		FROM user_profile
-		JOIN profile ON profile.id = user_profile.profile_id
-		JOIN (
-			SELECT p.name AS name, MAX(up.tier) AS tier
-			FROM user_profile up
-			JOIN profile p ON p.id = up.profile_id
-			WHERE up.user_id = :user_id
-			GROUP BY p.name
-		) highest_for_user ON profile.name = highest_for_user.name AND user_profile.tier = highest_for_user.tier
-		WHERE user_profile.user_id = :user_id
-	""")
-	
-	qualifying_profile_list = db.engine.execute(qualifying_profile_list_query, user_id=user_info.id).fetchall()
-	qualifying_profile_count = db.engine.execute(qualifying_profile_list_query, user_id=user_info.id).scalar()
-	
-	languages_list = db.engine.execute(text('SELECT * FROM "user" JOIN user_language ON "user".id = user_language.user_id JOIN language ON language.id = user_language.language_id WHERE "user".id=:current_user'), {'current_user': current_user.id})
+	user_stats = get_user_stats(current_user.id)
+	skills_list = user_stats.skills or []
+	languages_list = user_stats.languages or []
+	qualifying_profile_list = get_qualifying_profiles(user_stats)
+	qualifying_profile_count = len(qualifying_profile_list)
 	
 	profile_picture = '/uploads/' + current_user.image_file
+	flash_image_upload_status('avatar', current_user.id)
 	
 	badges = db.engine.execute('SELECT * FROM "user" JOIN user_badge ON user_badge.user_id = "user".id JOIN badge ON badge.id = user_badge.badge_id WHERE "user".id={} ORDER BY name LIMIT 4'.format(current_user.id))
 	
-	count_badges = db.engine.execute(text("SELECT count(user_id) as count FROM user_badge WHERE user_id = :user_id"), {'user_id': current_user.id}).scalar()
+	count_badges = user_stats.count_badges
 
 	return render_template('profile.html', title='Profile', profile_picture=profile_picture, ns_association=ns_association, user_info=user_info, assignment_history=assignment_history, deployment_history_count=deployment_history_count, user_portfolio=user_portfolio[:3], skills_list=skills_list, languages_list=languages_list, badges=badges, user_portfolio_size=user_portfolio_size, count_badges=count_badges, qualifying_profile_list=qualifying_profile_list, qualifying_profile_count=qualifying_profile_count)
 	
@@ -233,6 +216,9 @@ def view_profile(id):
 		
 	deployment_history_count = len(set(emergency.id for _, _, emergency in assignment_history))	
 	
+	if current_user.is_authenticated and (current_user.id == id or current_user.is_admin == 1):
+		flash_image_upload_status('avatar', id)
+	
 	# show full portfolio if user is logged in
 	if current_user.is_authenticated:
 		user_portfolio = get_full_portfolio(id)
@@ -242,30 +228,15 @@ def view_profile(id):
 	
 	user_portfolio_size = len(user_portfolio)
 	
-	skills_list = db.engine.execute(text('SELECT * FROM "user" JOIN user_skill ON "user".id = user_skill.user_id JOIN skill ON skill.id = user_skill.skill_id WHERE "user".id = :member_id'), {'member_id': id})
-	
-	languages_list = db.engine.execute(text('SELECT * FROM "user" JOIN user_language ON "user".id = user_language.user_id JOIN language ON language.id = user_language.language_id WHERE "user".id=:member_id'), {'member_id': id})
-	
-	qualifying_profile_list_query = text("""
-		SELECT profile.image, profile.name
-		FROM user_profile
-		JOIN profile ON profile.id = user_profile.profile_id
-		JOIN (
-			SELECT p.name AS name, MAX(up.tier) AS tier
-			FROM user_profile up
-			JOIN profile p ON p.id = up.profile_id
-			WHERE up.user_id = :user_id
-			GROUP BY p.name
-		) highest_for_user ON profile.name = highest_for_user.name AND user_profile.tier = highest_for_user.tier
-		WHERE user_profile.user_id = :user_id
-	""")
-	
-	qualifying_profile_list = db.engine.execute(qualifying_profile_list_query, user_id=id).fetchall()
-	qualifying_profile_count = db.engine.execute(qualifying_profile_list_query, user_id=id).scalar()
+	user_stats = get_user_stats(id)
+	skills_list = user_stats.skills or []
+	languages_list = user_stats.languages or []
+	qualifying_profile_list = get_qualifying_profiles(user_stats)
+	qualifying_profile_count = len(qualifying_profile_list)
 	
 	profile_picture = '/uploads/' + user_info.image_file
 	
-	count_badges = db.engine.execute(text('SELECT count(*) as count FROM "user" JOIN user_badge ON user_badge.user_id = "user".id JOIN badge ON badge.id = user_badge.badge_id WHERE "user".id=:member_id'), {'member_id': id}).scalar()
+	count_badges = user_stats.count_badges
 	
 	badges = db.engine.execute(text('SELECT * FROM "user" JOIN user_badge ON user_badge.user_id = "user".id JOIN badge ON badge.id = user_badge.badge_id WHERE "user".id=:member_id ORDER BY name LIMIT 4'), {'member_id': id})
 	
@@ -335,16 +306,7 @@ def view_all_user_badges(user_id):
 def view_all_user_profiles(user_id):
 	this_user = db.session.query(User).filter(User.id == user_id).first()
 	
-	qualifying_profile_list = db.engine.execute(text('SELECT profile.image, user_profile.tier FROM user_profile JOIN profile ON profile.id = user_profile.profile_id JOIN ('
-		'SELECT p.name AS name, MAX(up.tier) AS tier FROM user_profile up JOIN profile p ON p.id = up.profile_id WHERE up.user_id = :user_id GROUP BY p.name'
-	') highest_for_user ON profile.name = highest_for_user.name AND user_profile.tier = highest_for_user.tier WHERE user_profile.user_id = :user_id'), {'user_id': user_id})
-	
-	list_profiles = []
-	for profile in qualifying_profile_list:
-		temp_dict = {}
-		temp_dict['image'] = profile.image
-		temp_dict['tier'] = profile.tier
-		list_profiles.append(temp_dict)
+	list_profiles = get_qualifying_profiles(get_user_stats(user_id))
 	
 	return render_template('support_profile_details.html', list_profiles = list_profiles, this_user = this_user)
 
@@ -358,8 +320,9 @@ def update_profile():
 		ns_association = 'None'
 	if form.validate_on_submit():
 		if form.picture.data:
-			picture_file = save_picture(form.picture.data)
-			current_user.image_file = picture_file
+			save_picture(form.picture.data, current_user.id)
+			# an uploaded photo takes over from the Slack one, so the avatar sync leaves it alone
+			current_user.slack_avatar_hash = None
 		current_user.firstname = form.firstname.data
 		current_user.lastname = form.lastname.data
 		current_user.email = form.email.data
@@ -458,8 +421,9 @@ def update_specified_profile(id):
 			ns_association = 'None'
 		if form.validate_on_submit():
 			if form.picture.data:
-				picture_file = save_picture(form.picture.data)
-				this_user.image_file = picture_file
+				save_picture(form.picture.data, this_user.id)
+				# an uploaded photo takes over from the Slack one, so the avatar sync leaves it alone
+				this_user.slack_avatar_hash = None
 			this_user.firstname = form.firstname.data
 			this_user.lastname = form.lastname.data
 			this_user.email = form.email.data
@@ -720,29 +684,82 @@ def save_slack_photo_to_profile(user_id):
 		list_of_admins = db.session.query(User).filter(User.is_admin==True).all()
 		return render_template('errors/403.html', list_of_admins=list_of_admins), 403
 		
+# largest page a single /api/users request can ask for
+API_USERS_MAX_LIMIT = 1000
+
+API_USERS_COLUMNS = [
+	User.id, User.firstname, User.lastname, User.email, User.job_title, User.slack_id,
+	User.ns_id, User.place_label, User.time_zone, User.is_admin, User.status
+]
+
+def api_user_dict(row):
+	return {
+		'id': row.id, 
+		'first_name': row.firstname, 
+		'last_name': row.lastname, 
+		'email': row.email, 
+		'title': row.job_title, 
+		'slack': row.slack_id, 
+		'ns_id': row.ns_id, 
+		'location': row.place_label, 
+		'time_zone': row.time_zone, 
+		'admin': row.is_admin, 
+		'status': row.status
+	}
+
 @users.route('/api/users', methods=['GET'])
 def api_get_users():
-	status_param = request.args.get('status')  
+	"""
+	Get the member roster
+	
+	URL: /api/users?status=<status>&limit=<n>&after=<user_id>&format=ndjson
+	
+	Method: GET
 	
+	Parameters:
+		status (str): Only return members with this status.
+		limit (int): Page size, capped at API_USERS_MAX_LIMIT. Without it every matching member is returned.
+		after (int): Only return members whose id is greater than this, i.e. the next_after of the previous page.
+		format (str): 'ndjson' (or an Accept header of application/x-ndjson) streams one member per line instead of a JSON document.
+	
+	Returns:
+		Without limit, a list of member dictionaries as before. With limit, {'users': [...], 'next_after': <id or null>}, where next_after is null on the last page. Responses carry an ETag derived from the roster's size and latest change, and a matching If-None-Match gets an empty 304.
+	"""
+	status_param = request.args.get('status')
+	ndjson = request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+	
+	try:
+		limit, after = get_keyset_args(API_USERS_MAX_LIMIT)
+	except ValueError as e:
+		return jsonify({'error': str(e)}), 400
+	
+	filters = []
 	if status_param:
-		users = db.session.query(User).filter_by(status=status_param).order_by(User.id).all()
+		filters.append(User.status == status_param)
+	
+	# count and max id catch deletions and inserts that max(updated_at) alone would miss
+	count_users, max_id, last_change = db.session.query(
+		func.count(User.id), func.max(User.id), func.max(func.coalesce(User.updated_at, User.created_at))
+	).filter(*filters).one()
+	etag = make_etag('users', status_param, count_users, max_id, last_change, limit, after, ndjson)
+	cached_response = not_modified(etag)
+	if cached_response is not None:
+		return cached_response
+	
+	query = db.session.query(*API_USERS_COLUMNS).filter(*filters).order_by(User.id)
+	if after is not None:
+		query = query.filter(User.id > after)
+	if limit is not None:
+		query = query.limit(limit)
+	
+	if ndjson:
+		response = ndjson_response(api_user_dict(row) for row in query.yield_per(500))
+	elif limit is not None:
+		result = [api_user_dict(row) for row in query]
+		next_after = result[-1]['id'] if len(result) == limit else None
+		response = jsonify({'users': result, 'next_after': next_after})
 	else:
-		users = db.session.query(User).order_by(User.id).all()
-	
-	result = [
-		{
-			'id': user.id, 
-			'first_name': user.firstname, 
-			'last_name': user.lastname, 
-			'email': user.email, 
-			'title': user.job_title, 
-			'slack': user.slack_id, 
-			'ns_id': user.ns_id, 
-			'location': user.place_label, 
-			'time_zone': user.time_zone, 
-			'admin': user.is_admin, 
-			'status': user.status} 
-		for user in users
-	]
-	
-	return jsonify(result)
\ No newline at end of file
+		response = jsonify([api_user_dict(row) for row in query.yield_per(500)])
+	
+	response.set_etag(etag)
+	return response
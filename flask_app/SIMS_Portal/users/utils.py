@@ -1,36 +1,33 @@
 import boto3
 from flask import url_for, current_app, flash, redirect, session
-from PIL import Image
 from flask_mail import Message
 from SIMS_Portal import db, cache
-from SIMS_Portal.models import User, NationalSociety, user_language, Language, Assignment, user_profile, Profile, user_skill, Skill, Emergency
+from SIMS_Portal.models import User, NationalSociety, user_language, Language, Assignment, user_profile, Profile, user_skill, Skill, Emergency, UserStats, Log
+from SIMS_Portal.notifications.utils import enqueue_slack_message
+from SIMS_Portal.jobs.utils import report_progress
+from SIMS_Portal.images.utils import queue_image_upload, make_renditions, upload_renditions
+from SIMS_Portal.caching.utils import add_pending_tags
+from SIMS_Portal.search.utils import reindex_rows
 from slack_sdk import WebClient
 import os
 import secrets
-import tempfile
 import requests
 import http.client, urllib.parse
 import json
 import logging
-from io import BytesIO
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from sqlalchemy import text, or_
 
-def save_picture(form_picture):
-	random_hex = secrets.token_hex(8)
-	filename, file_ext = os.path.splitext(form_picture.filename)
-	if file_ext.lower() == '.jpeg':
-		file_ext = '.jpg'
-	picture_filename = random_hex + file_ext
-	picture_path = f"pictures/{picture_filename}"
-
-	with tempfile.NamedTemporaryFile(suffix=file_ext) as resized_image_file:
-		output_size = (400, 400)
-		resized_image = Image.open(form_picture)
-		resized_image.thumbnail(output_size)
-		resized_image.save(resized_image_file.name)
-		s3 = boto3.client("s3")
-		s3.upload_file(resized_image_file.name, current_app.config["UPLOAD_BUCKET"], picture_path)
-
-	return picture_path
+def save_picture(form_picture, user_id):
+	"""
+	Queues an uploaded profile picture to be resized into the avatar renditions (see images/utils.py). The member keeps their current picture until the renditions are uploaded, which is a few seconds after the form POST returns.
+	"""
+	key_prefix = 'pictures/{}'.format(secrets.token_hex(8))
+	queue_image_upload('avatar', user_id, form_picture.read(), key_prefix)
+	return key_prefix
 
 def send_reset_slack(user):
 	token = user.get_reset_token()
@@ -39,63 +36,26 @@ def send_reset_slack(user):
 	send_slack_dm(msg, user.slack_id)
 
 def new_user_slack_alert(message):
-	client = WebClient(token = current_app.config['SIMS_PORTAL_SLACK_BOT'])
-	try:
-		result = client.chat_postMessage(
-			channel = 'C046A8T9ZJB',
-			text = message
-		)
-	except Exception as e:
-		current_app.logger.error('new_user_slack_alert Slack message failed: {}'.format(e))
+	enqueue_slack_message('C046A8T9ZJB', message)
 
 def new_surge_alert(message):
-	client = WebClient(token = current_app.config['SIMS_PORTAL_SLACK_BOT'])
-	try:
-		result = client.chat_postMessage(
-			channel = 'CDUMNN3J8',
-			text = message
-		)
-	except Exception as e:
-		current_app.logger.error('new_surge_alert Slack message failed: {}'.format(e))
+	enqueue_slack_message('CDUMNN3J8', message)
 
 def test_surge_alert(message):
-	client = WebClient(token = current_app.config['SIMS_PORTAL_SLACK_BOT'])
-	try:
-		result = client.chat_postMessage(
-			channel = 'C046A8T9ZJB',
-			text = message
-		)
-	except Exception as e:
-		current_app.logger.error('new_surge_alert Slack message failed: {}'.format(e))
+	enqueue_slack_message('C046A8T9ZJB', message)
 
 def new_acronym_alert(message):
-	client = WebClient(token = current_app.config['SIMS_PORTAL_SLACK_BOT'])
-	try:
-		result = client.chat_postMessage(
-			channel = 'C046A8T9ZJB',
-			text = message
-		)
-	except Exception as e:
-		current_app.logger.error('new_acronym_alert Slack message failed: {}'.format(e))
+	enqueue_slack_message('C046A8T9ZJB', message)
 
 def rem_cos_search():
 	with app.app_context():
 		active_SIMS_cos = db.session.query(Assignment, User, Emergency).join(User, User.id == Assignment.user_id).join(Emergency, Emergency.id == Assignment.emergency_id).filter(Emergency.emergency_status == 'Active', Assignment.role == 'SIMS Remote Coordinator').all()
 
 def send_slack_dm(message, user):
-	slack_token = current_app.config['SIMS_PORTAL_SLACK_BOT']
-	data = {
-			'token': slack_token,
-			'channel': user,    # User's Slack ID
-			'as_user': True,
-			'text': message
-	}
-	try:
-		requests.post(url='https://slack.com/api/chat.postMessage', data=data)
-	except Exception as e:
-		current_app.logger.error('send_slack_dm failed: {}'.format(e))
+	# user is the recipient's Slack ID
+	enqueue_slack_message(user, message, as_user=True)
 
-@cache.cached(timeout=120)
+@cache.cached(timeout=120, key_prefix='slack_valid_user_ids')
 def get_valid_slack_ids():
 	client = WebClient(token=current_app.config['SIMS_PORTAL_SLACK_BOT'])
 	
@@ -192,11 +152,10 @@ def download_profile_photo(slack_id):
 
 			photo_response = requests.get(profile_photo_url)
 			if photo_response.status_code == 200:
-				picture_path = save_picture_from_slack(photo_response.content)
-				db.session.query(User).filter(User.slack_id == slack_id).update({'image_file':picture_path})
-				db.session.commit()
+				user_id = db.session.query(User.id).filter(User.slack_id == slack_id).order_by(User.id).first()[0]
+				picture_path = save_picture_from_slack(photo_response.content, user_id)
 				
-				current_app.logger.info(f"Slack profile photo saved as '{picture_path}' successfully.")
+				current_app.logger.info(f"Slack profile photo queued as '{picture_path}' successfully.")
 				return picture_path
 			else:
 				current_app.logger.error("Failed to download profile photo for user with Slack ID {}.".format(slack_id))
@@ -205,43 +164,119 @@ def download_profile_photo(slack_id):
 	else:
 		current_app.logger.error("Slack API call failed on download_profile_photo function. Check access token and user ID.")
 		
-def save_picture_from_slack(picture):
-	random_hex = secrets.token_hex(8)
-	picture_path = f"pictures/{random_hex}.jpg"
+def save_picture_from_slack(picture, user_id):
+	"""
+	Queues a photo downloaded from Slack for the avatar renditions, like save_picture().
+	"""
+	key_prefix = 'pictures/{}'.format(secrets.token_hex(8))
+	queue_image_upload('avatar', user_id, picture, key_prefix)
+	return key_prefix
+
+def build_slack_avatar_session(max_workers):
+	"""
+	Returns a `requests.Session` shared by the avatar sync threads, with a connection pool sized to match and retries that honour Slack's Retry-After on 429s.
+	"""
+	retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504], respect_retry_after_header=True)
+	adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_workers, max_retries=retries)
 	
-	output_size = (400, 400)
+	http_session = requests.Session()
+	http_session.mount('http://', adapter)
+	http_session.mount('https://', adapter)
+	http_session.headers['Authorization'] = 'Bearer {}'.format(current_app.config['SIMS_PORTAL_SLACK_BOT'])
 	
-	try:
-		image = Image.open(BytesIO(picture))
-	except Exception as e:
-		current_app.logger.error("Error opening image: {}".format(e))
-		return None
-	
-	image.thumbnail(output_size)
+	return http_session
+
+def fetch_changed_slack_avatar(http_session, api_url, member):
+	"""
+	Looks up one member's Slack profile and, if their avatar has changed since the last sync, downloads the original image. Returns (member id, avatar hash, image bytes), with image bytes None when the avatar is unchanged.
+	"""
+	response = http_session.get(api_url + 'users.profile.get', params={'user': member.slack_id}, timeout=15)
+	response.raise_for_status()
+	profile = response.json().get('profile') or {}
+	image_url = profile.get('image_original')
+	if not image_url:
+		raise ValueError('Slack profile has no image_original')
 	
-	s3 = boto3.client("s3")
-	with BytesIO() as image_stream:
-		image.save(image_stream, format='JPEG')
-		image_stream.seek(0)
-		s3.upload_fileobj(image_stream, current_app.config["UPLOAD_BUCKET"], picture_path)
+	avatar_hash = profile.get('avatar_hash') or hashlib.sha1(image_url.encode('utf-8')).hexdigest()
+	if avatar_hash == member.slack_avatar_hash:
+		return member.id, avatar_hash, None
 	
-	return picture_path
+	image_response = http_session.get(image_url, timeout=30)
+	image_response.raise_for_status()
+	return member.id, avatar_hash, image_response.content
 
 def bulk_slack_photo_update():
-	# lazy import to avoid circular import error
-	from SIMS_Portal.users.routes import save_slack_photo_to_profile
+	"""
+	Syncs Slack photos to the portal for members with a Slack ID who either still have the default avatar or whose current avatar came from an earlier sync. Members are processed in batches of SLACK_AVATAR_SYNC_BATCH_SIZE:
+	
+	- profiles are looked up and changed images downloaded concurrently by SLACK_AVATAR_SYNC_WORKERS threads sharing one HTTP session; members whose Slack avatar_hash matches the stored one are skipped without downloading anything
+	- the avatar renditions (see images/utils.py) are made and uploaded to S3 on the same threads; PIL releases the GIL while it resizes and encodes. This runs as a manual job inside a multithreaded gunicorn worker, where forking a process pool isn't safe
 	
-	users_with_default_avatar = db.session.query(User).filter(User.image_file == 'default.png').all()
+	The new image_file, image_renditions and slack_avatar_hash values for everyone are written in one transaction at the end. bulk_update_mappings() skips the flush listeners, so the members' cache tags and search entries are refreshed here. Returns counts of checked, unchanged, updated and failed members.
+	"""
+	config = current_app.config
+	members = db.session.query(User.id, User.slack_id, User.slack_avatar_hash).filter(
+		User.slack_id.isnot(None),
+		or_(User.image_file == 'default.png', User.slack_avatar_hash.isnot(None))
+	).order_by(User.id).all()
 	
-	for user in users_with_default_avatar:
-		try:
-			save_slack_photo_to_profile(user.id)
-			current_app.logger.info("User-{} ({} {}) has had their avatar automatically updated with their Slack photo.".format(user.id, user.firstname, user.lastname))
+	counts = {'checked': len(members), 'unchanged': 0, 'updated': 0, 'failed': 0}
+	updates = []
+	batch_size = config['SLACK_AVATAR_SYNC_BATCH_SIZE']
+	s3 = boto3.client('s3', endpoint_url=config['S3_ENDPOINT_URL'])
+	
+	with build_slack_avatar_session(config['SLACK_AVATAR_SYNC_WORKERS']) as http_session, \
+		ThreadPoolExecutor(max_workers=config['SLACK_AVATAR_SYNC_WORKERS']) as threads:
+		for batch_start in range(0, len(members), batch_size):
+			report_progress(batch_start, len(members), 'Checked {} of {} members'.format(batch_start, len(members)))
+			batch = members[batch_start:batch_start + batch_size]
+			
+			fetches = {threads.submit(fetch_changed_slack_avatar, http_session, config['SLACK_API_URL'], member): member for member in batch}
+			changed = []
+			for future in as_completed(fetches):
+				member = fetches[future]
+				try:
+					member_id, avatar_hash, image_bytes = future.result()
+				except Exception as e:
+					counts['failed'] += 1
+					current_app.logger.warning("bulk_slack_photo_update could not fetch the Slack photo for user-{}: {}".format(member.id, e))
+					continue
+				if image_bytes is None:
+					counts['unchanged'] += 1
+				else:
+					changed.append((member_id, avatar_hash, threads.submit(make_renditions, image_bytes, 'avatar')))
+			
+			uploads = []
+			for member_id, avatar_hash, renditions_future in changed:
+				try:
+					key_prefix = 'pictures/{}'.format(secrets.token_hex(8))
+					uploads.append((member_id, avatar_hash, threads.submit(upload_renditions, s3, config['UPLOAD_BUCKET'], key_prefix, renditions_future.result())))
+				except Exception as e:
+					counts['failed'] += 1
+					current_app.logger.warning("bulk_slack_photo_update could not resize the Slack photo for user-{}: {}".format(member_id, e))
 			
-			# flush pending flashes to avoid alerting all users to this change
-			session['_flashes'] = []
-		except Exception as e:
-			current_app.logger.warning("bulk_slack_photo_update failed for user-{}: {}".format(user.id, e))
+			for member_id, avatar_hash, upload_future in uploads:
+				try:
+					image_file, image_renditions = upload_future.result()
+					updates.append({'id': member_id, 'image_file': image_file, 'image_renditions': image_renditions, 'slack_avatar_hash': avatar_hash})
+				except Exception as e:
+					counts['failed'] += 1
+					current_app.logger.warning("bulk_slack_photo_update could not upload the Slack photo for user-{}: {}".format(member_id, e))
+	
+	if updates:
+		updated_ids = [update['id'] for update in updates]
+		db.session.bulk_update_mappings(User, updates)
+		reindex_rows(db.session.connection(), 'members', updated_ids)
+		add_pending_tags(db.session, 'user', *['user:{}'.format(user_id) for user_id in updated_ids])
+		db.session.commit()
+	counts['updated'] = len(updates)
+	
+	log_message = f"[INFO] The Slack avatar sync checked {counts['checked']} members: {counts['updated']} updated, {counts['unchanged']} unchanged, {counts['failed']} failed."
+	current_app.logger.info(log_message)
+	db.session.add(Log(message=log_message, user_id=0))
+	db.session.commit()
+	
+	return counts
 			
 def update_robots_txt(user_id, disallow=True):
 	robots_txt_path = os.path.join(current_app.root_path, 'robots.txt')
@@ -284,3 +319,35 @@ def update_robots_txt(user_id, disallow=True):
 		current_app.logger.info('User {} has updated their search engine settings on robots.txt'.format(user_id))
 	else:
 		current_app.logger.info('A new robots.txt rule as has been added for user {}'.format(user_id))
+
+def get_user_stats(user_id):
+	"""
+	Returns the user_stats row for a member. The row is kept current by database triggers on the skill, language, badge, profile, assignment and portfolio tables, so this is a single primary key lookup. Falls back to an empty UserStats if the row hasn't been built yet.
+	"""
+	stats = UserStats.query.get(user_id)
+	if stats is None:
+		stats = UserStats(user_id=user_id, count_assignments=0, count_remote_coordinator=0, count_countries=0, count_badges=0, count_skills=0, count_languages=0, count_profiles=0, count_infographics=0, bio_length=0, skills=[], languages=[], profiles=[])
+	return stats
+
+def get_qualifying_profiles(stats):
+	"""
+	Returns the support profiles a member holds at their highest tier, using the tier columns on their user_stats row.
+	"""
+	return [
+		{'image': profile.image, 'name': profile.name, 'tier': getattr(stats, 'tier_' + profile.image.lower(), None)}
+		for profile in db.session.query(Profile).order_by(Profile.id).all()
+		if getattr(stats, 'tier_' + profile.image.lower(), None)
+	]
+
+def rebuild_user_stats():
+	"""
+	Recomputes every row in user_stats from scratch. The triggers keep the table current on their own; this is for repairing drift, e.g. after restoring data with triggers disabled.
+	"""
+	db.session.execute(text('SELECT refresh_user_stats(NULL)'))
+	db.session.commit()
+	
+	count_rows = db.session.query(UserStats).count()
+	log_message = f"[INFO] The user_stats table was rebuilt for {count_rows} users."
+	current_app.logger.info(log_message)
+	db.session.add(Log(message=log_message, user_id=0))
+	db.session.commit()
@@ -0,0 +1,88 @@
+"""
+Benchmark for the in-memory acronym index (acronym.utils.AcronymIndex).
+
+Builds the index from 30,000 made-up trilingual acronyms and times typeahead lookups (exact, prefix, definition words, typos), a page of the list and single-row updates. The same lookups are also timed as a linear scan over every row, which is what filtering the full .all() list costs. No database is needed. Run from the flask_app folder:
+
+	python benchmarks/bench_acronym_index.py
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SIMS_Portal.acronym.utils import AcronymIndex, acronym_key, fold
+
+COUNT_ACRONYMS = 30000
+REPEATS = 200
+
+WORDS = [
+	'international', 'federation', 'emergency', 'information', 'management', 'response', 'operation', 'logistics',
+	'health', 'shelter', 'water', 'sanitation', 'assessment', 'coordination', 'support', 'national', 'society',
+	'federación', 'información', 'gestión', 'respuesta', 'evaluación', 'fédération', 'gestion', 'réponse', 'opération',
+]
+
+def make_rows():
+	random.seed(7)
+	rows = []
+	for i in range(COUNT_ACRONYMS):
+		letters = ''.join(random.choice(string.ascii_uppercase) for _ in range(random.randint(2, 6)))
+		rows.append({
+			'id': i + 1,
+			'acronym_eng': letters,
+			'def_eng': ' '.join(random.choice(WORDS[:17]) for _ in range(random.randint(2, 6))),
+			'expl_eng': '',
+			'acronym_esp': letters[::-1] if i % 3 == 0 else None,
+			'def_esp': ' '.join(random.choice(WORDS[17:21]) for _ in range(3)) if i % 3 == 0 else None,
+			'expl_esp': None,
+			'acronym_fra': letters.lower() if i % 4 == 0 else None,
+			'def_fra': ' '.join(random.choice(WORDS[21:]) for _ in range(3)) if i % 4 == 0 else None,
+			'expl_fra': None,
+			'relevant_link': '',
+			'added_by': 1,
+			'approved_by': 1,
+		})
+	return rows
+
+def linear_scan(rows, q, limit):
+	# what a request does without the index: look at every row
+	key, folded = acronym_key(q), fold(q)
+	matches = [row for row in rows if any(acronym_key(row[column]).startswith(key) for column in ('acronym_eng', 'acronym_esp', 'acronym_fra'))
+		or any(folded in fold(row[column]) for column in ('def_eng', 'def_esp', 'def_fra'))]
+	return matches[:limit]
+
+def timed(label, function, repeats=REPEATS):
+	started = time.perf_counter()
+	for _ in range(repeats):
+		result = function()
+	elapsed_ms = (time.perf_counter() - started) * 1000 / repeats
+	print('{:<44} {:9.3f} ms  ({} results)'.format(label, elapsed_ms, len(result)))
+
+def main():
+	rows = make_rows()
+
+	started = time.perf_counter()
+	index = AcronymIndex(rows)
+	print('built index of {} acronyms in {:.2f} s'.format(len(index), time.perf_counter() - started))
+	print()
+
+	queries = [('exact', rows[123]['acronym_eng']), ('prefix', rows[456]['acronym_eng'][:2]), ('definition prefix', 'coordin'), ('two words', 'water sanit'), ('accented', 'federacion'), ('typo in definition', 'managment')]
+	for label, q in queries:
+		timed('index: {} ({!r})'.format(label, q), lambda: index.search(q, limit=10))
+		timed('linear scan: {} ({!r})'.format(label, q), lambda: linear_scan(rows, q, 10), repeats=5)
+
+	print()
+	timed('index: page 100 of the list', lambda: index.page(99 * 100, 100))
+	timed('index: similar to one acronym', lambda: index.similar(rows[789]['id']))
+
+	row = dict(rows[1000])
+	def update():
+		row['def_eng'] = row['def_eng'] + ' updated'
+		index.upsert(row)
+		return [row]
+	timed('index: upsert one edited acronym', update)
+
+if __name__ == '__main__':
+	main()
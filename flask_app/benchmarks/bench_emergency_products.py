@@ -0,0 +1,82 @@
+"""
+Benchmark for the /api/portfolio product lookup by GO emergency id.
+
+Seeds a throwaway SQLite database with 500 emergencies and 50,000 products, then times the lookup three ways: without the lookup indexes, with the indexes from the e7a4c2d19b58 migration, and through the per-emergency cache. Run from the flask_app folder:
+
+	python benchmarks/bench_emergency_products.py
+"""
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from SIMS_Portal import db, cache
+from SIMS_Portal.models import Emergency, Portfolio
+from SIMS_Portal.portfolios.utils import build_emergency_products, get_emergency_products
+
+COUNT_EMERGENCIES = 500
+COUNT_PRODUCTS = 50000
+LOOKUP_INDEXES = ['ix_emergency_emergency_go_id', 'ix_portfolio_emergency_id_product_status']
+
+def make_app(database_path):
+	app = Flask(__name__)
+	app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database_path
+	app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+	app.config['CACHE_TYPE'] = 'SimpleCache'
+	db.init_app(app)
+	cache.init_app(app)
+	return app
+
+def seed():
+	random.seed(1)
+	db.metadata.create_all(db.engine, tables=[Emergency.__table__, Portfolio.__table__])
+	db.session.bulk_insert_mappings(Emergency, [
+		{'id': i, 'emergency_name': 'Emergency {}'.format(i), 'emergency_go_id': 1000 + i}
+		for i in range(1, COUNT_EMERGENCIES + 1)
+	])
+	db.session.bulk_insert_mappings(Portfolio, [
+		{
+			'title': 'Product {}'.format(i), 'type': 'Map', 'local_file': 'product.pdf', 'creator_id': 1,
+			'emergency_id': random.randint(1, COUNT_EMERGENCIES),
+			'product_status': random.choice(['Approved', 'Approved', 'Personal', 'Pending Approval', 'Removed'])
+		}
+		for i in range(COUNT_PRODUCTS)
+	])
+	db.session.commit()
+
+def time_lookups(lookup, number):
+	go_ids = [1000 + random.randint(1, COUNT_EMERGENCIES) for _ in range(number)]
+	seconds = min(timeit.repeat(lambda: [lookup(go_id) for go_id in go_ids], repeat=3, number=1))
+	return seconds / number * 1000
+
+def main(number=200):
+	with tempfile.TemporaryDirectory() as folder:
+		app = make_app(os.path.join(folder, 'bench.db'))
+		with app.app_context():
+			seed()
+
+			for index_name in LOOKUP_INDEXES:
+				db.session.execute('DROP INDEX IF EXISTS {}'.format(index_name))
+			no_index_ms = time_lookups(build_emergency_products, number)
+
+			for table in [Emergency.__table__, Portfolio.__table__]:
+				for index in table.indexes:
+					index.create(db.engine, checkfirst=True)
+			index_ms = time_lookups(build_emergency_products, number)
+
+			# warm every emergency's entry so the timing is all cache hits
+			for i in range(1, COUNT_EMERGENCIES + 1):
+				get_emergency_products(1000 + i)
+			cached_ms = time_lookups(get_emergency_products, number)
+
+	print('{} products, {} emergencies, {} lookups, best of 3'.format(COUNT_PRODUCTS, COUNT_EMERGENCIES, number))
+	print('{:<16} {:8.3f} ms per lookup'.format('no indexes', no_index_ms))
+	print('{:<16} {:8.3f} ms per lookup ({:.1f}x)'.format('indexes', index_ms, no_index_ms / index_ms))
+	print('{:<16} {:8.3f} ms per lookup ({:.1f}x)'.format('indexes + cache', cached_ms, no_index_ms / cached_ms))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,96 @@
+"""
+Benchmark for a member's full portfolio (portfolios.utils.get_full_portfolio).
+
+Seeds a throwaway SQLite database with 2,000 members, 50,000 products and their collaborators, including a few members with hundreds of products, then times the lookup through the portfolio_collaborator table against the old approach of scanning every product's comma-separated collaborator_ids and loading the matches one query at a time. Run from the flask_app folder:
+
+	python benchmarks/bench_full_portfolio.py
+"""
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from SIMS_Portal import db
+from SIMS_Portal.models import User, Portfolio, portfolio_collaborator
+from SIMS_Portal.portfolios.utils import get_full_portfolio
+
+COUNT_USERS = 2000
+COUNT_PRODUCTS = 50000
+# members who post or tag themselves on far more products than the rest
+PROLIFIC_USERS = [1, 2, 3]
+
+def make_app(database_path):
+	app = Flask(__name__)
+	app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database_path
+	app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+	db.init_app(app)
+	return app
+
+def pick_user():
+	return random.choice(PROLIFIC_USERS) if random.random() < 0.01 else random.randint(1, COUNT_USERS)
+
+def seed():
+	random.seed(3)
+	db.metadata.create_all(db.engine, tables=[User.__table__, Portfolio.__table__, portfolio_collaborator])
+	db.session.bulk_insert_mappings(User, [
+		{'id': i, 'firstname': 'Member', 'lastname': str(i), 'email': 'member{}@example.org'.format(i), 'password': 'x', 'status': 'Active'}
+		for i in range(1, COUNT_USERS + 1)
+	])
+	products, collaborators = [], []
+	for i in range(1, COUNT_PRODUCTS + 1):
+		creator_id = pick_user()
+		products.append({
+			'id': i, 'title': 'Product {}'.format(i), 'type': 'Map', 'local_file': 'product.pdf', 'creator_id': creator_id,
+			'product_status': random.choice(['Approved', 'Approved', 'Personal', 'Removed'])
+		})
+		tagged = {pick_user() for _ in range(random.choice([0, 0, 1, 2, 3]))} - {creator_id}
+		collaborators.extend({'portfolio_id': i, 'user_id': user_id} for user_id in tagged)
+	db.session.bulk_insert_mappings(Portfolio, products)
+	db.session.execute(portfolio_collaborator.insert(), collaborators)
+
+	# the products as they were stored before portfolio_collaborator, with collaborators as a comma-separated string
+	db.session.execute('CREATE TABLE legacy_portfolio (id INTEGER PRIMARY KEY, creator_id INTEGER, product_status TEXT, collaborator_ids TEXT)')
+	csv_by_product = {}
+	for row in collaborators:
+		csv_by_product.setdefault(row['portfolio_id'], []).append(str(row['user_id']))
+	db.session.execute('INSERT INTO legacy_portfolio VALUES (:id, :creator_id, :product_status, :collaborator_ids)', [
+		{'id': product['id'], 'creator_id': product['creator_id'], 'product_status': product['product_status'], 'collaborator_ids': ','.join(csv_by_product[product['id']]) if product['id'] in csv_by_product else None}
+		for product in products
+	])
+	db.session.commit()
+
+def legacy_full_portfolio(id):
+	# what get_full_portfolio did before: read every product, split the strings in Python, then one query per match
+	rows = db.session.execute("SELECT id, collaborator_ids, creator_id FROM legacy_portfolio WHERE product_status != 'Removed'").fetchall()
+	product_ids = []
+	for product_id, collaborator_ids, creator_id in rows:
+		user_ids = [int(user_id) for user_id in (collaborator_ids or '').split(',') if user_id.isdigit()] + [creator_id]
+		if id in user_ids:
+			product_ids.append(product_id)
+	return [db.session.query(Portfolio).filter(Portfolio.id == product_id).all()[0] for product_id in product_ids]
+
+def time_lookup(lookup, user_id, number):
+	seconds = min(timeit.repeat(lambda: (lookup(user_id), db.session.expunge_all()), repeat=3, number=number))
+	return seconds / number * 1000
+
+def main(number=5):
+	with tempfile.TemporaryDirectory() as folder:
+		app = make_app(os.path.join(folder, 'bench.db'))
+		with app.app_context():
+			seed()
+			print('{} products, {} members, {} collaborator tags, best of 3'.format(COUNT_PRODUCTS, COUNT_USERS, db.session.query(portfolio_collaborator).count()))
+			for label, user_id in [('prolific member', PROLIFIC_USERS[0]), ('typical member', COUNT_USERS // 2)]:
+				size = len(get_full_portfolio(user_id))
+				assert sorted(product.id for product in legacy_full_portfolio(user_id)) == [product.id for product in get_full_portfolio(user_id)]
+				legacy_ms = time_lookup(legacy_full_portfolio, user_id, number)
+				joined_ms = time_lookup(get_full_portfolio, user_id, number)
+				print('{} ({} products)'.format(label, size))
+				print('  {:<28} {:9.3f} ms'.format('collaborator_ids scan + N+1', legacy_ms))
+				print('  {:<28} {:9.3f} ms ({:.1f}x)'.format('portfolio_collaborator', joined_ms, legacy_ms / joined_ms))
+
+if __name__ == '__main__':
+	main()
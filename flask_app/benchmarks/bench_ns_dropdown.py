@@ -0,0 +1,73 @@
+"""
+Benchmark for the navbar national society dropdown context processor.
+
+Renders two templates, one that shows the NS dropdown and one that doesn't, under the old context processor (get_ns_list() on every render) and the new one (LazyNSList backed by the per-worker snapshot), and prints templates per second for each. Uses a throwaway SQLite database seeded with 190 national societies and 2,000 members. Run from the flask_app folder:
+
+	python benchmarks/bench_ns_dropdown.py
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, render_template_string
+from SIMS_Portal import db, cache
+from SIMS_Portal.models import NationalSociety, User
+from SIMS_Portal.main.utils import get_ns_list, LazyNSList
+
+TEMPLATE_WITH_DROPDOWN = '<ul>{% for ns in ns_list %}<li><a href="/national_societies/{{ ns[0] }}">{{ ns[2] }}</a></li>{% endfor %}</ul>'
+TEMPLATE_WITHOUT_DROPDOWN = '<p>{{ title }}</p>'
+
+def old_ns_dropdown():
+	return {'ns_list': get_ns_list()}
+
+def new_ns_dropdown():
+	return {'ns_list': LazyNSList()}
+
+def make_app(database_path, context_processor):
+	app = Flask(__name__)
+	app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database_path
+	app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+	app.config['CACHE_TYPE'] = 'SimpleCache'
+	db.init_app(app)
+	cache.init_app(app)
+	app.context_processor(context_processor)
+	return app
+
+def seed(app):
+	with app.app_context():
+		engine = db.get_engine(app)
+		db.metadata.create_all(engine, tables=[NationalSociety.__table__, User.__table__])
+		db.session.bulk_insert_mappings(NationalSociety, [
+			{'ns_name': 'National Society {}'.format(i), 'country_name': 'Country {:03d}'.format(i), 'ns_go_id': i}
+			for i in range(1, 191)
+		])
+		db.session.bulk_insert_mappings(User, [
+			{'firstname': 'Member', 'lastname': str(i), 'email': 'member{}@example.org'.format(i), 'password': 'x', 'status': 'Active', 'ns_id': (i % 190) + 1}
+			for i in range(2000)
+		])
+		db.session.commit()
+
+def templates_per_second(app, template, number):
+	with app.test_request_context('/'):
+		render_template_string(template, title='warm up')
+		seconds = min(timeit.repeat(lambda: render_template_string(template, title='benchmark'), repeat=3, number=number))
+	return number / seconds
+
+def main(number=500):
+	with tempfile.TemporaryDirectory() as folder:
+		database_path = os.path.join(folder, 'bench.db')
+		old_app = make_app(database_path, old_ns_dropdown)
+		new_app = make_app(database_path, new_ns_dropdown)
+		seed(old_app)
+
+		print('Rendering each template {} times, best of 3'.format(number))
+		for label, template in [('with dropdown', TEMPLATE_WITH_DROPDOWN), ('without dropdown', TEMPLATE_WITHOUT_DROPDOWN)]:
+			before = templates_per_second(old_app, template, number)
+			after = templates_per_second(new_app, template, number)
+			print('{:<18} before {:10.0f}/s  after {:10.0f}/s  ({:.1f}x)'.format(label, before, after, after / before))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,143 @@
+"""
+Benchmark for the bulk Slack avatar sync (users.utils.bulk_slack_photo_update).
+
+Runs the sync against a fake Slack API served from a local thread and an in-memory S3 from moto (pip install -r requirements-dev.txt), with a throwaway SQLite database of 200 members. Each fake Slack request sleeps for SLACK_LATENCY_SECONDS to stand in for the network. The sync runs three times: a cold run where every avatar is new, a repeat where every avatar_hash is unchanged, and a run after a quarter of the members changed their Slack photo, which also checks that exactly those members' cache tags were invalidated. Run from the flask_app folder:
+
+	python benchmarks/bench_slack_avatar_sync.py
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3
+from flask import Flask
+from PIL import Image
+from SIMS_Portal import db, cache
+from SIMS_Portal.caching.utils import get_tag_versions, register_cache_invalidation
+from SIMS_Portal.models import User, Log
+from SIMS_Portal.users.utils import bulk_slack_photo_update
+
+try:
+	from moto import mock_aws as mock_s3
+except ImportError:
+	try:
+		from moto import mock_s3
+	except ImportError:
+		sys.exit('This benchmark needs moto for its S3 stand-in: pip install -r requirements-dev.txt')
+
+COUNT_MEMBERS = 200
+SLACK_LATENCY_SECONDS = 0.02
+BUCKET = 'sims-portal-uploads-bench'
+
+# slack id -> avatar version; bumping a version gives that member a new avatar_hash and image
+avatar_versions = {}
+
+def make_png(seed):
+	image = Image.new('RGB', (1024, 1024), ((seed * 37) % 256, (seed * 91) % 256, (seed * 53) % 256))
+	with BytesIO() as image_stream:
+		image.save(image_stream, format='PNG')
+		return image_stream.getvalue()
+
+class FakeSlackHandler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		time.sleep(SLACK_LATENCY_SECONDS)
+		url = urlparse(self.path)
+		if url.path == '/api/users.profile.get':
+			slack_id = parse_qs(url.query)['user'][0]
+			version = avatar_versions[slack_id]
+			body = json.dumps({'ok': True, 'profile': {
+				'avatar_hash': '{}-{}'.format(slack_id, version),
+				'image_original': 'http://{}:{}/images/{}/{}.png'.format(*self.server.server_address, slack_id, version)
+			}}).encode('utf-8')
+			content_type = 'application/json'
+		elif url.path.startswith('/images/'):
+			body = make_png(len(url.path))
+			content_type = 'image/png'
+		else:
+			self.send_response(404)
+			self.end_headers()
+			return
+		self.send_response(200)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+def make_app(database_path, slack_api_url):
+	app = Flask(__name__)
+	app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database_path
+	app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+	app.config['SIMS_PORTAL_SLACK_BOT'] = 'xoxb-bench'
+	app.config['SLACK_API_URL'] = slack_api_url
+	app.config['UPLOAD_BUCKET'] = BUCKET
+	app.config['S3_ENDPOINT_URL'] = None
+	app.config['SLACK_AVATAR_SYNC_WORKERS'] = 8
+	app.config['SLACK_AVATAR_SYNC_BATCH_SIZE'] = 50
+	app.config['CACHE_TYPE'] = 'SimpleCache'
+	db.init_app(app)
+	cache.init_app(app)
+	return app
+
+def seed():
+	db.metadata.create_all(db.engine, tables=[User.__table__, Log.__table__])
+	db.session.bulk_insert_mappings(User, [
+		{'firstname': 'Member', 'lastname': str(i), 'email': 'member{}@example.org'.format(i), 'password': 'x', 'slack_id': 'U{:05d}'.format(i), 'image_file': 'default.png'}
+		for i in range(COUNT_MEMBERS)
+	])
+	db.session.commit()
+	for i in range(COUNT_MEMBERS):
+		avatar_versions['U{:05d}'.format(i)] = 1
+
+def timed_sync(label):
+	started = time.perf_counter()
+	counts = bulk_slack_photo_update()
+	print('{:<22} {:6.2f} s  {}'.format(label, time.perf_counter() - started, counts))
+
+def main():
+	server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSlackHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	slack_api_url = 'http://{}:{}/api/'.format(*server.server_address)
+
+	os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+	os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+	os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+	register_cache_invalidation()
+	with tempfile.TemporaryDirectory() as folder, mock_s3():
+		boto3.client('s3').create_bucket(Bucket=BUCKET)
+		app = make_app(os.path.join(folder, 'bench.db'), slack_api_url)
+		with app.app_context():
+			seed()
+			print('{} members, {} ms fake Slack latency per request'.format(COUNT_MEMBERS, SLACK_LATENCY_SECONDS * 1000))
+			timed_sync('cold (all new)')
+			timed_sync('repeat (all unchanged)')
+			changed_slack_ids = list(avatar_versions)[::4]
+			for slack_id in changed_slack_ids:
+				avatar_versions[slack_id] += 1
+			member_tags = ['user:{}'.format(user_id) for (user_id,) in db.session.query(User.id).order_by(User.id)]
+			versions_before = get_tag_versions(member_tags)
+			timed_sync('quarter changed')
+			versions_after = get_tag_versions(member_tags)
+			changed_ids = {user_id for (user_id,) in db.session.query(User.id).filter(User.slack_id.in_(changed_slack_ids))}
+			invalidated_ids = {int(tag.split(':')[1]) for tag in member_tags if versions_before[tag] != versions_after[tag]}
+			assert invalidated_ids == changed_ids, 'cache tags invalidated for {} members, expected the {} who changed photo'.format(len(invalidated_ids), len(changed_ids))
+
+			count_objects = boto3.client('s3').list_objects_v2(Bucket=BUCKET).get('KeyCount')
+			count_synced = db.session.query(User).filter(User.slack_avatar_hash.isnot(None)).count()
+			print('{} avatar renditions in S3, {} members with a synced avatar'.format(count_objects, count_synced))
+
+	server.shutdown()
+
+if __name__ == '__main__':
+	main()
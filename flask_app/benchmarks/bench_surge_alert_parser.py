@@ -0,0 +1,99 @@
+"""
+Micro-benchmark for the surge alert parser in SIMS_Portal/alerts/parser.py.
+
+Parses a recorded page of 1,000 GO surge_alert results with the shared parser (row and columnar modes) and with the inline parsing block that the two cron jobs used to carry, and prints the best time per run for each. Run from the flask_app folder:
+
+	python benchmarks/bench_surge_alert_parser.py
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SIMS_Portal.alerts.parser import parse_surge_alerts, parse_surge_alerts_columnar
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'surge_alerts_1000.json')
+
+def legacy_parse(results):
+	"""The per-result parsing the cron jobs ran before alerts/parser.py, kept here as the baseline."""
+	result_list = []
+	for result in results:
+		molnix_tags = result.get("molnix_tags", [])
+		sectors = []
+		roles = []
+		role_profile = scope = region_id = None
+		modality = None
+		for tag in molnix_tags:
+			groups = tag.get("groups", [])
+			if "REGION" in groups:
+				region_id = tag.get("description", None)
+			if "SECTOR" in groups:
+				sectors.append(tag.get("description", None))
+			if "ROLES" in groups:
+				role_profile = tag.get("description", None)
+				roles.append(role_profile)
+			if "Modality" in groups:
+				modality = tag.get("name", None)
+			if "ALERT TYPE" in groups:
+				scope = tag.get("name", None).title()
+		im_filter = "Information Management" in sectors
+		language_required = next((tag.get("description", None) for tag in molnix_tags if tag.get("tag_type") == "language"), None)
+		rotation = next((group.get("name", None) for group in molnix_tags if "rotation" in group.get("groups", [])), None)
+		country = result.get("country", {})
+		region_ids_dict = {
+			"Europe Region": 4,
+			"Asia Pacific Region": 3,
+			"Americas Region": 2,
+			"Africa Region": 1,
+			"Middle East & North Africa Region": 5
+		}
+		event = result.get("event", {})
+		result_list.append({
+			"molnix_id": result.get("molnix_id", None),
+			"alert_record_created_at": result.get("created_at", None),
+			"event": event.get("name", None),
+			"role_profile": role_profile,
+			"rotation": rotation,
+			"modality": modality,
+			"language_required": language_required,
+			"molnix_status": result.get("molnix_status", None),
+			"alert_status": result.get("status_display", None),
+			"opens": result.get("opens", None),
+			"start": result.get("start", None),
+			"end_time": result.get("end", None),
+			"sectors": ', '.join(sectors),
+			"role_tags": ', '.join(roles),
+			"scope": scope,
+			"im_filter": im_filter,
+			"iso3": country.get("iso3", None),
+			"country_name": country.get("name", None),
+			"disaster_type_id": event.get("dtype", {}).get("id", None),
+			"disaster_type_name": event.get("dtype", {}).get("name", None),
+			"disaster_go_id": event.get("id", None),
+			"ifrc_severity_level_display": event.get("ifrc_severity_level_display", None),
+			"alert_id": result.get("id", None),
+			"region_id": region_ids_dict.get(region_id, None),
+		})
+	return result_list
+
+def main(repeat=5, number=20):
+	with open(FIXTURE_PATH) as fixture:
+		results = json.load(fixture)['results']
+
+	# both parsers must agree before their timings mean anything
+	assert [record._asdict() for record in parse_surge_alerts(results)] == legacy_parse(results)
+
+	candidates = [
+		('legacy inline parser', legacy_parse),
+		('parse_surge_alerts', parse_surge_alerts),
+		('parse_surge_alerts_columnar', parse_surge_alerts_columnar),
+	]
+	print('Parsing {} surge alerts, best of {} x {} runs'.format(len(results), repeat, number))
+	for label, parser in candidates:
+		best = min(timeit.repeat(lambda: parser(results), repeat=repeat, number=number)) / number
+		print('{:<30} {:8.2f} ms/page  {:8.1f} us/alert'.format(label, best * 1000, best * 1e6 / len(results)))
+
+if __name__ == '__main__':
+	main()
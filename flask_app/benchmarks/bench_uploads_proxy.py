@@ -0,0 +1,134 @@
+"""
+Checks and benchmarks the /uploads/<path:name> S3 proxy (main.utils.s3_object_response).
+
+Uses moto for an in-memory S3 (pip install -r requirements-dev.txt). Runs the real route through Flask's test client and checks full, ranged, conditional, out-of-range, missing and presigned-redirect responses. Then it streams a 50 MB object and reports time to first byte and the peak memory allocated while serving it, next to the old approach of downloading the whole object into a BytesIO first. Run from the flask_app folder:
+
+	python benchmarks/bench_uploads_proxy.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3
+from flask import Flask
+from werkzeug.http import http_date
+from SIMS_Portal.main.routes import main as main_blueprint
+
+try:
+	from moto import mock_aws as mock_s3
+except ImportError:
+	try:
+		from moto import mock_s3
+	except ImportError:
+		sys.exit('This benchmark needs moto for its S3 stand-in: pip install -r requirements-dev.txt')
+
+BUCKET = 'sims-portal-uploads-bench'
+SMALL_BYTES = 256 * 1024
+LARGE_BYTES = 50 * 1000 * 1000
+
+def make_app(redirect_bytes):
+	app = Flask(__name__)
+	app.config['UPLOAD_BUCKET'] = BUCKET
+	app.config['S3_ENDPOINT_URL'] = None
+	app.config['UPLOAD_STREAM_CHUNK_BYTES'] = 64 * 1024
+	app.config['UPLOAD_PRESIGNED_REDIRECT_BYTES'] = redirect_bytes
+	app.config['UPLOAD_PRESIGNED_URL_SECONDS'] = 300
+	app.register_blueprint(main_blueprint)
+	return app
+
+def check(label, condition):
+	print('{:<48} {}'.format(label, 'ok' if condition else 'FAILED'))
+	return condition
+
+def check_responses(client, small):
+	results = []
+	response = client.get('/uploads/files/small.pdf')
+	etag = response.headers.get('ETag')
+	results.append(check('full object: 200, same bytes', response.status_code == 200 and response.get_data() == small))
+	results.append(check('full object: ETag, Last-Modified, Accept-Ranges', bool(etag and response.headers.get('Last-Modified') and response.headers.get('Accept-Ranges') == 'bytes')))
+
+	response = client.get('/uploads/files/small.pdf', headers={'Range': 'bytes=100-199'})
+	results.append(check('range: 206 with Content-Range', response.status_code == 206 and response.headers.get('Content-Range') == 'bytes 100-199/{}'.format(SMALL_BYTES)))
+	results.append(check('range: the requested bytes', response.get_data() == small[100:200]))
+
+	response = client.get('/uploads/files/small.pdf', headers={'Range': 'bytes=-500'})
+	results.append(check('suffix range: last 500 bytes', response.status_code == 206 and response.get_data() == small[-500:]))
+
+	response = client.get('/uploads/files/small.pdf', headers={'Range': 'bytes={}-'.format(SMALL_BYTES * 2)})
+	results.append(check('unsatisfiable range: 416', response.status_code == 416))
+
+	response = client.get('/uploads/files/small.pdf', headers={'If-None-Match': etag})
+	results.append(check('If-None-Match with current ETag: 304', response.status_code == 304 and not response.get_data()))
+
+	response = client.get('/uploads/files/small.pdf', headers={'If-None-Match': '"stale"'})
+	results.append(check('If-None-Match with stale ETag: 200', response.status_code == 200))
+
+	response = client.get('/uploads/files/small.pdf', headers={'If-Modified-Since': http_date(time.time() + 3600)})
+	results.append(check('If-Modified-Since in the future: 304', response.status_code == 304))
+
+	response = client.get('/uploads/files/missing.pdf')
+	results.append(check('missing object: 404', response.status_code == 404))
+	return all(results)
+
+def old_download(s3, key):
+	file_stream = BytesIO()
+	s3.download_fileobj(BUCKET, key, file_stream)
+	file_stream.seek(0)
+	return file_stream.read()
+
+def measure(serve):
+	tracemalloc.start()
+	started = time.perf_counter()
+	first_byte_seconds, size = serve(started)
+	total_seconds = time.perf_counter() - started
+	peak_bytes = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return first_byte_seconds, total_seconds, size, peak_bytes
+
+def main():
+	os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+	os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+	os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+	with mock_s3():
+		s3 = boto3.client('s3')
+		s3.create_bucket(Bucket=BUCKET)
+		small = os.urandom(SMALL_BYTES)
+		s3.put_object(Bucket=BUCKET, Key='files/small.pdf', Body=small, ContentType='application/pdf')
+		s3.put_object(Bucket=BUCKET, Key='files/large.pdf', Body=os.urandom(LARGE_BYTES), ContentType='application/pdf')
+
+		passed = check_responses(make_app(redirect_bytes=0).test_client(), small)
+
+		response = make_app(redirect_bytes=10 * 1000 * 1000).test_client().get('/uploads/files/large.pdf')
+		passed = check('large object in redirect mode: 302 presigned', response.status_code == 302 and 'Signature' in response.headers.get('Location', '')) and passed
+
+		client = make_app(redirect_bytes=0).test_client()
+		def serve_streamed(started):
+			response = client.get('/uploads/files/large.pdf', buffered=False)
+			first_byte_seconds, size = None, 0
+			for chunk in response.response:
+				if first_byte_seconds is None:
+					first_byte_seconds = time.perf_counter() - started
+				size += len(chunk)
+			response.close()
+			return first_byte_seconds, size
+
+		def serve_buffered(started):
+			data = old_download(s3, 'files/large.pdf')
+			return time.perf_counter() - started, len(data)
+
+		print()
+		print('{} MB object'.format(LARGE_BYTES // 1000 // 1000))
+		for label, serve in [('BytesIO (old)', serve_buffered), ('streamed', serve_streamed)]:
+			first_byte_seconds, total_seconds, size, peak_bytes = measure(serve)
+			print('{:<16} first byte {:7.1f} ms  total {:7.1f} ms  peak {:7.1f} MB  ({} bytes)'.format(label, first_byte_seconds * 1000, total_seconds * 1000, peak_bytes / 1e6, size))
+
+	if not passed:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
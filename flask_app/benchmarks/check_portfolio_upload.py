@@ -0,0 +1,240 @@
+"""
+Walks a portfolio upload end to end, from the upload form's start call to the product's copy on Dropbox, against moto's S3 server on localhost, a fake Dropbox client and a throwaway SQLite database. Run from the flask_app folder:
+
+	python benchmarks/check_portfolio_upload.py
+
+Needs moto's server (pip install -r requirements-dev.txt). The real portfolio routes are driven through Flask's test client, and the file parts are PUT to the presigned S3 URLs just as the upload form's script sends them. The check covers:
+
+- the upload form's script, which has to submit the form without calling form.submit(): the form's submit button is named "submit" and shadows the method
+- start, part uploads, finalize and the form POST, ending with a product that records the size S3 reports
+- a browser that sends more bytes than it declared, and one that goes over PORTFOLIO_UPLOAD_MAX_BYTES; both files have to be deleted
+- the Dropbox copy made by worker.py's mirror pass, including a failed attempt that is retried, and an S3 body that ends early
+"""
+import os
+import re
+import socket
+import sys
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3
+import botocore
+import requests
+from flask import Flask
+from SIMS_Portal import db, cache, login_manager
+from SIMS_Portal.config import Config
+from SIMS_Portal.models import User, Emergency, Assignment, Portfolio, Log, portfolio_collaborator
+from SIMS_Portal.portfolios.forms import PortfolioUploadForm
+from SIMS_Portal.portfolios.routes import portfolios as portfolios_blueprint
+import SIMS_Portal.portfolios.utils as portfolio_utils
+
+try:
+	from moto.server import ThreadedMotoServer
+except ImportError:
+	sys.exit('This check needs moto\'s S3 server: pip install -r requirements-dev.txt')
+
+BUCKET = 'sims-portal-uploads-check'
+PART_BYTES = 5 * 1024 * 1024
+MAX_BYTES = 12 * 1024 * 1024
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SIMS_Portal', 'templates', 'create_portfolio_from_assignment.html')
+
+class FakeDropbox:
+	"""
+	The parts of the Dropbox client mirror_portfolio_to_dropbox() uses. Files are kept in files by path; fail_next makes the next upload call raise once.
+	"""
+	def __init__(self):
+		self.files = {}
+		self.sessions = {}
+		self.fail_next = False
+
+	def check_failure(self):
+		if self.fail_next:
+			self.fail_next = False
+			raise ConnectionError('Dropbox went away')
+
+	def files_upload(self, data, path, mode=None):
+		self.check_failure()
+		self.files[path] = data
+
+	def files_upload_session_start(self, data):
+		self.check_failure()
+		session_id = 'session-{}'.format(len(self.sessions))
+		self.sessions[session_id] = data
+		return SimpleNamespace(session_id=session_id)
+
+	def files_upload_session_append_v2(self, data, cursor):
+		assert len(self.sessions[cursor.session_id]) == cursor.offset, 'appended at the wrong offset'
+		self.sessions[cursor.session_id] += data
+
+	def files_upload_session_finish(self, data, cursor, commit):
+		assert len(self.sessions[cursor.session_id]) == cursor.offset, 'finished at the wrong offset'
+		self.files[commit.path] = self.sessions.pop(cursor.session_id) + data
+
+	def sharing_create_shared_link(self, path):
+		return SimpleNamespace(url='https://dropbox.example/s' + path.replace(' ', '%20'))
+
+def free_port():
+	with socket.socket() as probe:
+		probe.bind(('127.0.0.1', 0))
+		return probe.getsockname()[1]
+
+def make_app(database_path, s3_url):
+	app = Flask(__name__)
+	app.config.from_object(Config)
+	app.config['SECRET_KEY'] = 'check'
+	app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database_path
+	app.config['CACHE_TYPE'] = 'SimpleCache'
+	app.config['WTF_CSRF_ENABLED'] = False
+	app.config['S3_ENDPOINT_URL'] = s3_url
+	app.config['UPLOAD_BUCKET'] = BUCKET
+	app.config['PORTFOLIO_UPLOAD_PART_BYTES'] = PART_BYTES
+	app.config['PORTFOLIO_UPLOAD_MAX_BYTES'] = MAX_BYTES
+	app.config['DROPBOX_CHUNK_BYTES'] = PART_BYTES
+	app.config['DROPBOX_MIRROR_BACKOFF_SECONDS'] = 0
+	db.init_app(app)
+	cache.init_app(app)
+	login_manager.init_app(app)
+	app.register_blueprint(portfolios_blueprint)
+	return app
+
+def seed():
+	db.metadata.create_all(db.engine, tables=[User.__table__, Emergency.__table__, Assignment.__table__, Portfolio.__table__, Log.__table__, portfolio_collaborator])
+	member = User(firstname='Remote', lastname='Supporter', email='supporter@example.org', password='x', status='Active')
+	coordinator = User(firstname='Remote', lastname='Coordinator', email='coordinator@example.org', password='x', status='Active')
+	emergency = Emergency(emergency_name='Check Floods', emergency_status='Active')
+	db.session.add_all([member, coordinator, emergency])
+	db.session.flush()
+	assignment = Assignment(user_id=member.id, emergency_id=emergency.id, role='Remote IM Support', assignment_status='Active')
+	db.session.add_all([assignment, Assignment(user_id=coordinator.id, emergency_id=emergency.id, role='SIMS Remote Coordinator', assignment_status='Active')])
+	db.session.commit()
+	return member.id, emergency.id, assignment.id
+
+def send_parts(upload, data):
+	# what uploadParts() in the upload form's script does
+	parts = []
+	for index, part_url in enumerate(upload['part_urls']):
+		response = requests.put(part_url, data=data[index * upload['part_size']:(index + 1) * upload['part_size']])
+		response.raise_for_status()
+		parts.append({'PartNumber': index + 1, 'ETag': response.headers['ETag']})
+	return parts
+
+def start_upload(client, declared_size):
+	response = client.post('/portfolio/upload/start', json={'filename': 'flood extent.pdf', 'size': declared_size, 'content_type': 'application/pdf', 'type': 'Map'})
+	assert response.status_code == 200, response.get_json()
+	return response.get_json()
+
+def object_exists(key):
+	try:
+		portfolio_utils.get_s3_client().head_object(Bucket=BUCKET, Key=key)
+		return True
+	except botocore.exceptions.ClientError:
+		return False
+
+def check_upload_script():
+	script = open(TEMPLATE_PATH).read()
+	assert PortfolioUploadForm.submit.field_class.__name__ == 'SubmitField', 'the check assumes the form still has a field named submit'
+	assert not re.search(r'\bform\.submit\(\)', script), 'the upload script calls form.submit(), which is the submit button, not the method'
+	assert 'HTMLFormElement.prototype.submit.call(form)' in script
+	print('ok: the upload script submits through HTMLFormElement.prototype.submit')
+
+def check_upload_flow(client, member_id, emergency_id, assignment_id):
+	data = os.urandom(2 * PART_BYTES + 12345)
+	upload = start_upload(client, len(data))
+	assert len(upload['part_urls']) == 3, upload
+	response = client.post('/portfolio/upload/finalize', json={'key': upload['key'], 'upload_id': upload['upload_id'], 'parts': send_parts(upload, data)})
+	assert response.status_code == 200, response.get_json()
+
+	response = client.post('/portfolio/new_from_assignment/{}/{}/{}'.format(assignment_id, member_id, emergency_id), data={
+		'title': 'Flood extent', 'description': 'Checked upload', 'type': 'Map', 'format': 'PDF', 'file_token': response.get_json()['file_token']
+	})
+	assert response.status_code == 302, 'the form POST did not create the product ({})'.format(response.status_code)
+	product = db.session.query(Portfolio).filter(Portfolio.local_file == upload['key']).one()
+	assert product.file_size == len(data), product.file_size
+	assert product.dropbox_status == 'Pending', product.dropbox_status
+	print('ok: started, sent {} parts, finalized and saved product {} with {} bytes'.format(len(upload['part_urls']), product.id, product.file_size))
+	return product.id, data
+
+def check_rejected_uploads(client):
+	# declares one part's worth but sends a second, bigger part in its place
+	upload = start_upload(client, PART_BYTES)
+	part_url = upload['part_urls'][0]
+	response = requests.put(part_url, data=os.urandom(PART_BYTES + 1000))
+	response.raise_for_status()
+	response = client.post('/portfolio/upload/finalize', json={'key': upload['key'], 'upload_id': upload['upload_id'], 'parts': [{'PartNumber': 1, 'ETag': response.headers['ETag']}]})
+	assert response.status_code == 400, response.get_json()
+	assert not object_exists(upload['key']), 'an upload larger than declared was kept'
+
+	# declares just under the cap, then sends a full last part that takes it over
+	upload = start_upload(client, MAX_BYTES - 1000)
+	parts = send_parts(upload, os.urandom(len(upload['part_urls']) * PART_BYTES))
+	response = client.post('/portfolio/upload/finalize', json={'key': upload['key'], 'upload_id': upload['upload_id'], 'parts': parts})
+	assert response.status_code == 400 and 'at most' in response.get_json()['error'], response.get_json()
+	assert not object_exists(upload['key']), 'an upload over PORTFOLIO_UPLOAD_MAX_BYTES was kept'
+	print('ok: uploads larger than declared or over the cap were rejected and deleted')
+
+def check_dropbox_mirror(product_id, data):
+	fake_dropbox = FakeDropbox()
+	get_dropbox_client = portfolio_utils.get_dropbox_client
+	portfolio_utils.get_dropbox_client = lambda: fake_dropbox
+	try:
+		fake_dropbox.fail_next = True
+		assert portfolio_utils.mirror_pending_portfolios() == 0
+		product = db.session.query(Portfolio).get(product_id)
+		assert (product.dropbox_status, product.dropbox_attempts) == ('Pending', 1), (product.dropbox_status, product.dropbox_attempts)
+		assert 'Dropbox went away' in product.dropbox_error
+
+		assert portfolio_utils.mirror_pending_portfolios() == 1
+		db.session.refresh(product)
+		assert product.dropbox_status == 'Copied' and product.dropbox_file, (product.dropbox_status, product.dropbox_file)
+		assert list(fake_dropbox.files.values()) == [data], 'the copy on Dropbox differs from the upload'
+		print('ok: the Dropbox copy failed once, was retried by the next pass and matches the upload')
+
+		# S3 promises one byte more than it sends, as a dropped connection would
+		get_s3_client = portfolio_utils.get_s3_client
+		s3 = get_s3_client()
+		def short_get_object(**params):
+			s3_object = s3.get_object(**params)
+			s3_object['ContentLength'] += 1
+			return s3_object
+		portfolio_utils.get_s3_client = lambda: SimpleNamespace(get_object=short_get_object)
+		try:
+			portfolio_utils.mirror_portfolio_to_dropbox(product_id)
+			raise AssertionError('a short S3 body was copied as if it were complete')
+		except IOError as e:
+			assert 'ended before its ContentLength' in str(e), e
+		finally:
+			portfolio_utils.get_s3_client = get_s3_client
+		print('ok: an S3 body that ends early raises instead of looping')
+	finally:
+		portfolio_utils.get_dropbox_client = get_dropbox_client
+
+def main():
+	os.environ.setdefault('AWS_ACCESS_KEY_ID', 'check')
+	os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'check')
+	os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+	port = free_port()
+	s3_server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+	s3_server.start()
+	try:
+		s3_url = 'http://127.0.0.1:{}'.format(port)
+		boto3.client('s3', endpoint_url=s3_url).create_bucket(Bucket=BUCKET)
+		check_upload_script()
+		with tempfile.TemporaryDirectory() as folder:
+			app = make_app(os.path.join(folder, 'check.db'), s3_url)
+			with app.app_context():
+				member_id, emergency_id, assignment_id = seed()
+				client = app.test_client()
+				with client.session_transaction() as session:
+					session['_user_id'] = str(member_id)
+					session['_fresh'] = True
+				product_id, data = check_upload_flow(client, member_id, emergency_id, assignment_id)
+				check_rejected_uploads(client)
+				check_dropbox_mirror(product_id, data)
+	finally:
+		s3_server.stop()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,152 @@
+"""
+Runs the outbound Slack queue (notifications.utils) against a fake chat.postMessage endpoint on localhost, with a throwaway SQLite database, instead of the real Slack API. Run from the flask_app folder:
+
+	python benchmarks/check_slack_queue.py
+
+The fake endpoint answers per channel: C_OK always succeeds, C_GONE fails with channel_not_found, C_FLAKY returns a 500 once and C_RATE a 429 with Retry-After once. The check covers delivery, permanent failures, retries, the shared rate-limit pause, and a dispatcher that dies mid-batch: what it already posted must not be posted again once its lease runs out.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from fixture_server import serve
+from SIMS_Portal import db, cache
+from SIMS_Portal.config import Config
+from SIMS_Portal.models import SlackMessage
+import SIMS_Portal.notifications.utils as notifications
+
+BOT_TOKEN = 'xoxb-check'
+
+class FakeSlack(BaseHTTPRequestHandler):
+	"""
+	chat.postMessage as Slack answers it. Every post is appended to server.posts; server.misbehave counts how often each channel has been answered badly so far.
+	"""
+	def do_POST(self):
+		if self.path != '/api/chat.postMessage' or self.headers.get('Authorization') != 'Bearer ' + BOT_TOKEN:
+			self.respond(200, {'ok': False, 'error': 'invalid_auth'})
+			return
+		payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+		self.server.posts.append(payload)
+		channel = payload['channel']
+
+		if channel == 'C_GONE':
+			self.respond(200, {'ok': False, 'error': 'channel_not_found'})
+		elif channel == 'C_FLAKY' and not self.server.misbehave[channel]:
+			self.server.misbehave[channel] += 1
+			self.respond(500, {'ok': False})
+		elif channel == 'C_RATE' and not self.server.misbehave[channel]:
+			self.server.misbehave[channel] += 1
+			self.respond(429, {'ok': False, 'error': 'ratelimited'}, {'Retry-After': '1'})
+		else:
+			self.respond(200, {'ok': True, 'channel': channel, 'ts': str(time.time())})
+
+	def respond(self, status, data, headers=None):
+		body = json.dumps(data).encode()
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+def make_app(database_path, slack_url):
+	app = Flask(__name__)
+	app.config.from_object(Config)
+	app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database_path
+	app.config['CACHE_TYPE'] = 'SimpleCache'
+	app.config['SLACK_API_URL'] = slack_url
+	app.config['SIMS_PORTAL_SLACK_BOT'] = BOT_TOKEN
+	app.config['SLACK_QUEUE_MAX_ATTEMPTS'] = 3
+	app.config['SLACK_QUEUE_BACKOFF_SECONDS'] = 0
+	app.config['SLACK_QUEUE_LEASE_SECONDS'] = 1
+	db.init_app(app)
+	cache.init_app(app)
+	return app
+
+def statuses(ids):
+	rows = db.session.query(SlackMessage.id, SlackMessage.status).filter(SlackMessage.id.in_(ids)).all()
+	db.session.commit()
+	return [dict(rows)[message_id] for message_id in ids]
+
+def posted_texts(server):
+	return Counter(post['text'] for post in server.posts)
+
+def check_delivery(server):
+	ids = [notifications.enqueue_slack_message(channel, 'delivery {}'.format(i)) for i, channel in enumerate(['C_OK', 'C_OK', 'C_GONE', 'C_FLAKY'])]
+	assert notifications.dispatch_pending_slack_messages() == 2
+	assert statuses(ids) == ['Sent', 'Sent', 'Failed', 'Pending'], statuses(ids)
+	assert notifications.dispatch_pending_slack_messages() == 1
+	assert statuses(ids) == ['Sent', 'Sent', 'Failed', 'Sent'], statuses(ids)
+	assert db.session.query(SlackMessage.attempts).filter(SlackMessage.id == ids[3]).scalar() == 2
+	print('ok: delivered, failed channel_not_found for good, retried the 500')
+
+def check_rate_limit(server):
+	ids = [notifications.enqueue_slack_message(channel, 'rate limit {}'.format(i)) for i, channel in enumerate(['C_RATE', 'C_OK'])]
+	assert notifications.dispatch_pending_slack_messages() == 0
+	# the 429 pauses everything, so the second message goes back in the queue unposted and without spending an attempt
+	assert statuses(ids) == ['Pending', 'Pending'], statuses(ids)
+	assert posted_texts(server)['rate limit 1'] == 0
+	assert cache.get(notifications.SLACK_PAUSE_CACHE_KEY) is not None, 'the pause should be in the shared cache'
+	count_posts = len(server.posts)
+	assert notifications.dispatch_pending_slack_messages() == 0 and len(server.posts) == count_posts, 'posted while paused'
+
+	time.sleep(1.2)
+	assert notifications.dispatch_pending_slack_messages() == 2
+	assert statuses(ids) == ['Sent', 'Sent'], statuses(ids)
+	assert db.session.query(SlackMessage.attempts).filter(SlackMessage.id == ids[1]).scalar() == 1
+	print('ok: honoured Retry-After through the shared pause')
+
+def check_crash_mid_batch(server):
+	ids = [notifications.enqueue_slack_message('C_OK', 'crash {}'.format(i)) for i in range(3)]
+	post = notifications.post_slack_message
+	calls = []
+	def dies_on_second_post(message):
+		calls.append(message.id)
+		if len(calls) == 2:
+			raise SystemExit('worker killed mid-batch')
+		return post(message)
+
+	notifications.post_slack_message = dies_on_second_post
+	try:
+		notifications.dispatch_pending_slack_messages()
+	except SystemExit:
+		db.session.rollback()
+	finally:
+		notifications.post_slack_message = post
+
+	assert statuses(ids) == ['Sent', 'Sending', 'Sending'], statuses(ids)
+	# still leased to the dead dispatcher
+	assert notifications.dispatch_pending_slack_messages() == 0
+
+	time.sleep(1.2)
+	assert notifications.dispatch_pending_slack_messages() == 2
+	assert statuses(ids) == ['Sent', 'Sent', 'Sent'], statuses(ids)
+	texts = posted_texts(server)
+	assert [texts['crash {}'.format(i)] for i in range(3)] == [1, 1, 1], texts
+	print('ok: a dispatcher that died mid-batch left its sent message alone, the rest were picked up after the lease')
+
+def main():
+	with tempfile.TemporaryDirectory() as folder, serve(FakeSlack) as server:
+		server.posts = []
+		server.misbehave = Counter()
+		app = make_app(os.path.join(folder, 'check.db'), server.base_url + '/api/')
+		with app.app_context():
+			db.metadata.create_all(db.engine, tables=[SlackMessage.__table__])
+			check_delivery(server)
+			check_rate_limit(server)
+			check_crash_mid_batch(server)
+
+if __name__ == '__main__':
+	main()
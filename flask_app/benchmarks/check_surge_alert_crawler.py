@@ -0,0 +1,128 @@
+"""
+Runs the surge alert crawler (alerts.utils) against a local server that replays the recorded 1,000-alert fixture as GO-style limit/offset pages, instead of the live GO API. Run from the flask_app folder:
+
+	python benchmarks/check_surge_alert_crawler.py
+
+fetches and parses every page through the pooled, retrying session, including a page that fails twice before it loads, and checks the result matches parsing the recording directly. With --crawl it also runs refresh_surge_alerts() end to end: the first run hits a page that keeps failing and has to stop with the cursor on the first unsaved chunk, and a second run has to resume from there and save the rest. --crawl writes to the database in SQLALCHEMY_DATABASE_URI, so point it at a scratch Postgres database that `flask db upgrade` has been run on.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixture_server import serve
+from SIMS_Portal.alerts.parser import parse_surge_alerts
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'surge_alerts_1000.json')
+ENDPOINT = '/api/v2/surge_alert/'
+PAGE_SIZE = 100
+
+with open(FIXTURE_PATH) as f:
+	RECORDED_RESULTS = json.load(f)['results']
+
+class SurgeAlertPages(BaseHTTPRequestHandler):
+	"""
+	Serves RECORDED_RESULTS the way GO's surge_alert endpoint pages them. Offsets in server.fail_offsets answer 500 for as many requests as their count says (-1 for always), and server.requests counts the requests per offset.
+	"""
+	def do_GET(self):
+		url = urlparse(self.path)
+		if url.path != ENDPOINT:
+			self.send_error(404)
+			return
+		params = parse_qs(url.query)
+		limit = int(params.get('limit', [PAGE_SIZE])[0])
+		offset = int(params.get('offset', [0])[0])
+		self.server.requests[offset] += 1
+
+		remaining_failures = self.server.fail_offsets.get(offset, 0)
+		if remaining_failures:
+			if remaining_failures > 0:
+				self.server.fail_offsets[offset] -= 1
+			self.send_error(500)
+			return
+
+		next_url = None
+		if offset + limit < len(RECORDED_RESULTS):
+			next_url = self.server.base_url + ENDPOINT + '?' + urlencode({'limit': limit, 'offset': offset + limit})
+		body = json.dumps({'count': len(RECORDED_RESULTS), 'next': next_url, 'previous': None, 'results': RECORDED_RESULTS[offset:offset + limit]}).encode()
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+def check_pages():
+	from SIMS_Portal.alerts.utils import build_surge_alert_session, fetch_surge_alert_page
+
+	count_pages = len(RECORDED_RESULTS) // PAGE_SIZE
+	with serve(SurgeAlertPages) as server:
+		server.requests = Counter()
+		# the fourth page errors twice, which the session's retries have to absorb
+		server.fail_offsets = {3 * PAGE_SIZE: 2}
+		url = server.base_url + ENDPOINT
+		with build_surge_alert_session(4) as session, ThreadPoolExecutor(max_workers=4) as executor:
+			pages = list(executor.map(lambda page_number: fetch_surge_alert_page(session, url, page_number, PAGE_SIZE), range(1, count_pages + 1)))
+
+	assert [page_number for page_number, _, _ in pages] == list(range(1, count_pages + 1))
+	assert [has_next for _, _, has_next in pages] == [True] * (count_pages - 1) + [False], 'only the last page should report no next page'
+	records = [record for _, page_records, _ in pages for record in page_records]
+	assert records == parse_surge_alerts(RECORDED_RESULTS), 'paged records differ from parsing the recording in one go'
+	assert server.requests[3 * PAGE_SIZE] == 3, 'the failing page should have been retried until it loaded'
+	print('ok: {} pages, {} alerts, failing page retried'.format(count_pages, len(records)))
+
+def check_crawl():
+	from SIMS_Portal import create_app, db
+	from SIMS_Portal.models import Alert, AlertCrawlCursor
+	from SIMS_Portal.alerts.utils import refresh_surge_alerts
+
+	app = create_app()
+	count_pages = len(RECORDED_RESULTS) // PAGE_SIZE
+	alert_ids = {record.alert_id for record in parse_surge_alerts(RECORDED_RESULTS)}
+	with serve(SurgeAlertPages) as server:
+		server.requests = Counter()
+		server.fail_offsets = {}
+		app.config['SURGE_ALERT_API_URL'] = server.base_url + ENDPOINT
+		app.config['SURGE_ALERT_PAGE_SIZE'] = PAGE_SIZE
+		app.config['SURGE_ALERT_CRAWL_WORKERS'] = 4
+		with app.app_context():
+			db.session.query(Alert).filter(Alert.alert_id.in_(list(alert_ids))).delete(synchronize_session=False)
+			db.session.query(AlertCrawlCursor).filter(AlertCrawlCursor.name == 'surge_alert').delete()
+			db.session.commit()
+
+			# page 6 sits in the second chunk (pages 5-8), so the first run saves pages 1-4 and stops
+			server.fail_offsets[5 * PAGE_SIZE] = -1
+			first = refresh_surge_alerts(pages_to_fetch=count_pages)
+			cursor = db.session.query(AlertCrawlCursor).filter(AlertCrawlCursor.name == 'surge_alert').one()
+			assert first['inserted'] == 4 * PAGE_SIZE, first
+			assert cursor.next_page == 5 and cursor.completed_at is None, cursor
+
+			del server.fail_offsets[5 * PAGE_SIZE]
+			server.requests.clear()
+			second = refresh_surge_alerts(pages_to_fetch=count_pages)
+			db.session.refresh(cursor)
+			assert server.requests[0] == 0, 'the resumed run refetched pages that were already saved'
+			assert second['inserted'] == (count_pages - 4) * PAGE_SIZE, second
+			assert cursor.completed_at is not None, cursor
+			assert db.session.query(Alert).filter(Alert.alert_id.in_(list(alert_ids))).count() == len(alert_ids)
+	print('ok: interrupted crawl saved {} alerts, resumed from page 5 and saved {} more'.format(first['inserted'], second['inserted']))
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--crawl', action='store_true', help='also run refresh_surge_alerts() against the database in SQLALCHEMY_DATABASE_URI')
+	args = parser.parse_args()
+	check_pages()
+	if args.crawl:
+		check_crawl()
+
+if __name__ == '__main__':
+	main()
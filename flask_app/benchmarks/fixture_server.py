@@ -0,0 +1,21 @@
+"""
+A throwaway local HTTP server for the check scripts in this folder, so code that talks to GO or Slack can be run against recorded or fake responses instead of the real services.
+"""
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer
+
+@contextmanager
+def serve(handler_class):
+	"""
+	Runs handler_class on a free localhost port in a background thread and yields the server, whose base_url attribute is the address to point the code at.
+	"""
+	server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+	server.base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	try:
+		yield server
+	finally:
+		server.shutdown()
+		server.server_close()
@@ -0,0 +1,85 @@
+"""
+Index advisor for the portal's hot queries.
+
+Runs EXPLAIN on each query in KNOWN_QUERIES against the database in SQLALCHEMY_DATABASE_URI (a Postgres database seeded with realistic data, e.g. a restored production dump in the docker-compose postgresdb) and reports every sequential scan in the plans. Sequential scans are switched off for the session, so on a small database a scan that still shows up means there is no usable index rather than the planner preferring a scan on a tiny table. Run from the flask_app folder:
+
+	python benchmarks/index_advisor.py
+
+Each reported scan names the table and the filter or join condition that needed an index. Add the index to models.py and a migration, then re-run until the report is clean.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from SIMS_Portal import create_app, db
+
+# representative statements for the badge, dashboard, profile, availability and API code paths, with :user_id, :emergency_id, :badge_id and :emergency_go_id filled in from SAMPLE_PARAMS_QUERY
+KNOWN_QUERIES = [
+	('badges: award check', 'SELECT 1 FROM user_badge WHERE user_id = :user_id AND badge_id = :badge_id'),
+	('badges: member badges', 'SELECT badge.* FROM badge JOIN user_badge ON user_badge.badge_id = badge.id WHERE user_badge.user_id = :user_id'),
+	('dashboard: my assignments', 'SELECT * FROM assignment JOIN emergency ON emergency.id = assignment.emergency_id WHERE assignment.user_id = :user_id AND assignment.assignment_status = \'Active\''),
+	('dashboard: pending members', 'SELECT COUNT(*) FROM "user" WHERE status = \'Pending\''),
+	('members: active roster', 'SELECT id, firstname, lastname FROM "user" WHERE status = \'Active\' ORDER BY firstname'),
+	('profile: skills', 'SELECT skill.name FROM skill JOIN user_skill ON user_skill.skill_id = skill.id WHERE user_skill.user_id = :user_id'),
+	('profile: languages', 'SELECT language.name FROM language JOIN user_language ON user_language.language_id = language.id WHERE user_language.user_id = :user_id'),
+	('profile: profiles', 'SELECT profile.name, user_profile.tier FROM profile JOIN user_profile ON user_profile.profile_id = profile.id WHERE user_profile.user_id = :user_id'),
+	('profile: products', 'SELECT * FROM portfolio WHERE creator_id = :user_id AND product_status != \'Removed\''),
+	('emergency: assigned members', 'SELECT * FROM assignment JOIN "user" ON "user".id = assignment.user_id WHERE assignment.emergency_id = :emergency_id AND assignment.assignment_status = \'Active\''),
+	('emergency: approved products', 'SELECT COUNT(*) FROM portfolio WHERE emergency_id = :emergency_id AND product_status = \'Approved\''),
+	('availability: latest report', 'SELECT * FROM availability WHERE user_id = :user_id AND emergency_id = :emergency_id AND timeframe = \'current\' ORDER BY created_at DESC LIMIT 1'),
+	('api: products by GO id', 'SELECT portfolio.* FROM portfolio JOIN emergency ON emergency.id = portfolio.emergency_id WHERE emergency.emergency_go_id = :emergency_go_id AND portfolio.product_status = \'Approved\''),
+	('alerts: existing alert', 'SELECT id FROM alert WHERE alert_id = :alert_id'),
+]
+
+SAMPLE_PARAMS_QUERY = """
+	SELECT
+		(SELECT MAX(id) FROM "user") AS user_id,
+		(SELECT MAX(id) FROM emergency) AS emergency_id,
+		(SELECT MAX(emergency_go_id) FROM emergency) AS emergency_go_id,
+		(SELECT MAX(id) FROM badge) AS badge_id,
+		(SELECT MAX(alert_id) FROM alert) AS alert_id
+"""
+
+def find_seq_scans(plan):
+	"""
+	Walks an EXPLAIN (FORMAT JSON) plan and returns (table, condition) for every Seq Scan node in it.
+	"""
+	scans = []
+	if plan.get('Node Type') == 'Seq Scan':
+		scans.append((plan.get('Relation Name'), plan.get('Filter') or plan.get('Join Filter') or ''))
+	for child in plan.get('Plans', []):
+		scans.extend(find_seq_scans(child))
+	return scans
+
+def audit():
+	"""
+	Returns a list of (query name, table, condition) for every sequential scan in KNOWN_QUERIES.
+	"""
+	findings = []
+	with db.engine.connect() as connection:
+		params = dict(connection.execute(text(SAMPLE_PARAMS_QUERY)).fetchone()._mapping)
+		connection.execute(text('SET enable_seqscan = off'))
+		for name, query in KNOWN_QUERIES:
+			plan = connection.execute(text('EXPLAIN (FORMAT JSON) ' + query), params).scalar()[0]['Plan']
+			for table, condition in find_seq_scans(plan):
+				findings.append((name, table, condition))
+	return findings
+
+def main():
+	app = create_app()
+	with app.app_context():
+		if db.engine.dialect.name != 'postgresql':
+			sys.exit('The index advisor reads Postgres plans; point SQLALCHEMY_DATABASE_URI at a seeded Postgres database.')
+		findings = audit()
+
+	if not findings:
+		print('No sequential scans in {} known queries.'.format(len(KNOWN_QUERIES)))
+		return
+	print('{} sequential scan(s) in {} known queries:'.format(len(findings), len(KNOWN_QUERIES)))
+	for name, table, condition in findings:
+		print('{:<32} {:<16} {}'.format(name, table, condition))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,29 @@
+"""unique index on alert.alert_id
+
+Revision ID: a3c91e5d7f20
+Revises: 1f05ced78d0d
+Create Date: 2026-10-17 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c91e5d7f20'
+down_revision = '1f05ced78d0d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # older cron runs could insert the same GO alert twice; keep the oldest row before enforcing uniqueness
+    op.execute(
+        'DELETE FROM alert a USING alert b '
+        'WHERE a.alert_id = b.alert_id AND a.id > b.id'
+    )
+    op.create_index(op.f('ix_alert_alert_id'), 'alert', ['alert_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_alert_alert_id'), table_name='alert')
@@ -0,0 +1,198 @@
+"""user stats read model
+
+Revision ID: b41e6f2d9a73
+Revises: c2d7a94e01b6
+Create Date: 2026-10-17 16:12:40.517204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41e6f2d9a73'
+down_revision = 'c2d7a94e01b6'
+branch_labels = None
+depends_on = None
+
+
+# recomputes the user_stats rows for the given user ids, or for every user when called with NULL
+REFRESH_USER_STATS_FUNCTION = """
+CREATE OR REPLACE FUNCTION refresh_user_stats(user_ids integer[]) RETURNS void AS $$
+BEGIN
+	INSERT INTO user_stats (
+		user_id, count_assignments, count_remote_coordinator, count_countries, count_badges,
+		count_skills, count_languages, count_profiles, count_infographics, bio_length,
+		skills, languages, profiles,
+		tier_geo, tier_webviz, tier_infodes, tier_datatrans, tier_mobdata, tier_simsco, updated_at
+	)
+	SELECT
+		u.id, a.count_assignments, a.count_remote_coordinator, c.count_countries, b.count_badges,
+		s.count_skills, l.count_languages, p.count_profiles, i.count_infographics, LENGTH(COALESCE(u.bio, '')),
+		s.skills, l.languages, p.profiles,
+		p.tier_geo, p.tier_webviz, p.tier_infodes, p.tier_datatrans, p.tier_mobdata, p.tier_simsco, now()
+	FROM "user" u
+	LEFT JOIN LATERAL (
+		SELECT
+			COUNT(*) FILTER (WHERE assignment_status <> 'Removed') AS count_assignments,
+			COUNT(*) FILTER (WHERE role = 'SIMS Remote Coordinator') AS count_remote_coordinator
+		FROM assignment WHERE assignment.user_id = u.id
+	) a ON true
+	LEFT JOIN LATERAL (
+		SELECT COUNT(DISTINCT ns.country_name) AS count_countries
+		FROM assignment
+		JOIN emergency e ON e.id = assignment.emergency_id
+		JOIN nationalsociety ns ON ns.ns_go_id = e.emergency_location_id
+		WHERE assignment.user_id = u.id
+	) c ON true
+	LEFT JOIN LATERAL (
+		SELECT COUNT(*) AS count_badges FROM user_badge WHERE user_badge.user_id = u.id
+	) b ON true
+	LEFT JOIN LATERAL (
+		SELECT COUNT(DISTINCT skill.id) AS count_skills, array_agg(DISTINCT skill.name) AS skills
+		FROM user_skill JOIN skill ON skill.id = user_skill.skill_id
+		WHERE user_skill.user_id = u.id
+	) s ON true
+	LEFT JOIN LATERAL (
+		SELECT COUNT(DISTINCT language.id) AS count_languages, array_agg(DISTINCT language.name) AS languages
+		FROM user_language JOIN language ON language.id = user_language.language_id
+		WHERE user_language.user_id = u.id
+	) l ON true
+	LEFT JOIN LATERAL (
+		SELECT
+			COUNT(DISTINCT profile.id) AS count_profiles,
+			array_agg(DISTINCT profile.name) AS profiles,
+			MAX(user_profile.tier) FILTER (WHERE profile.image = 'Geo') AS tier_geo,
+			MAX(user_profile.tier) FILTER (WHERE profile.image = 'Webviz') AS tier_webviz,
+			MAX(user_profile.tier) FILTER (WHERE profile.image = 'Infodes') AS tier_infodes,
+			MAX(user_profile.tier) FILTER (WHERE profile.image = 'Datatrans') AS tier_datatrans,
+			MAX(user_profile.tier) FILTER (WHERE profile.image = 'Mobdata') AS tier_mobdata,
+			MAX(user_profile.tier) FILTER (WHERE profile.image = 'Simsco') AS tier_simsco
+		FROM user_profile JOIN profile ON profile.id = user_profile.profile_id
+		WHERE user_profile.user_id = u.id
+	) p ON true
+	LEFT JOIN LATERAL (
+		SELECT COUNT(*) AS count_infographics
+		FROM portfolio
+		WHERE portfolio.creator_id = u.id AND product_status = 'Approved' AND type = 'Infographic'
+	) i ON true
+	WHERE user_ids IS NULL OR u.id = ANY(user_ids)
+	ON CONFLICT (user_id) DO UPDATE SET
+		count_assignments = EXCLUDED.count_assignments,
+		count_remote_coordinator = EXCLUDED.count_remote_coordinator,
+		count_countries = EXCLUDED.count_countries,
+		count_badges = EXCLUDED.count_badges,
+		count_skills = EXCLUDED.count_skills,
+		count_languages = EXCLUDED.count_languages,
+		count_profiles = EXCLUDED.count_profiles,
+		count_infographics = EXCLUDED.count_infographics,
+		bio_length = EXCLUDED.bio_length,
+		skills = EXCLUDED.skills,
+		languages = EXCLUDED.languages,
+		profiles = EXCLUDED.profiles,
+		tier_geo = EXCLUDED.tier_geo,
+		tier_webviz = EXCLUDED.tier_webviz,
+		tier_infodes = EXCLUDED.tier_infodes,
+		tier_datatrans = EXCLUDED.tier_datatrans,
+		tier_mobdata = EXCLUDED.tier_mobdata,
+		tier_simsco = EXCLUDED.tier_simsco,
+		updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# row trigger shared by every table that feeds user_stats; TG_ARGV[0] names the column holding the user id
+USER_STATS_TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION user_stats_row_changed() RETURNS trigger AS $$
+DECLARE
+	changed_ids integer[] := '{}';
+BEGIN
+	IF TG_OP IN ('UPDATE', 'DELETE') THEN
+		changed_ids := changed_ids || (to_jsonb(OLD) ->> TG_ARGV[0])::integer;
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') THEN
+		changed_ids := changed_ids || (to_jsonb(NEW) ->> TG_ARGV[0])::integer;
+	END IF;
+	PERFORM refresh_user_stats(array_remove(changed_ids, NULL));
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# an emergency moving country changes count_countries for everyone assigned to it
+EMERGENCY_LOCATION_TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION user_stats_emergency_moved() RETURNS trigger AS $$
+BEGIN
+	PERFORM refresh_user_stats(ARRAY(SELECT DISTINCT user_id FROM assignment WHERE emergency_id = NEW.id AND user_id IS NOT NULL));
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# (trigger name, table, events, user id column)
+USER_STATS_TRIGGERS = [
+	('user_stats_user_skill', 'user_skill', 'INSERT OR UPDATE OR DELETE', 'user_id'),
+	('user_stats_user_language', 'user_language', 'INSERT OR UPDATE OR DELETE', 'user_id'),
+	('user_stats_user_badge', 'user_badge', 'INSERT OR UPDATE OR DELETE', 'user_id'),
+	('user_stats_user_profile', 'user_profile', 'INSERT OR UPDATE OR DELETE', 'user_id'),
+	('user_stats_assignment', 'assignment', 'INSERT OR UPDATE OR DELETE', 'user_id'),
+	('user_stats_portfolio', 'portfolio', 'INSERT OR UPDATE OR DELETE', 'creator_id'),
+	('user_stats_user', 'user', 'INSERT OR UPDATE OF bio', 'id'),
+]
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('count_assignments', sa.Integer(), nullable=True),
+    sa.Column('count_remote_coordinator', sa.Integer(), nullable=True),
+    sa.Column('count_countries', sa.Integer(), nullable=True),
+    sa.Column('count_badges', sa.Integer(), nullable=True),
+    sa.Column('count_skills', sa.Integer(), nullable=True),
+    sa.Column('count_languages', sa.Integer(), nullable=True),
+    sa.Column('count_profiles', sa.Integer(), nullable=True),
+    sa.Column('count_infographics', sa.Integer(), nullable=True),
+    sa.Column('bio_length', sa.Integer(), nullable=True),
+    sa.Column('skills', postgresql.ARRAY(sa.String()), nullable=True),
+    sa.Column('languages', postgresql.ARRAY(sa.String()), nullable=True),
+    sa.Column('profiles', postgresql.ARRAY(sa.String()), nullable=True),
+    sa.Column('tier_geo', sa.Integer(), nullable=True),
+    sa.Column('tier_webviz', sa.Integer(), nullable=True),
+    sa.Column('tier_infodes', sa.Integer(), nullable=True),
+    sa.Column('tier_datatrans', sa.Integer(), nullable=True),
+    sa.Column('tier_mobdata', sa.Integer(), nullable=True),
+    sa.Column('tier_simsco', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # ### end Alembic commands ###
+
+    op.execute(REFRESH_USER_STATS_FUNCTION)
+    op.execute(USER_STATS_TRIGGER_FUNCTION)
+    op.execute(EMERGENCY_LOCATION_TRIGGER_FUNCTION)
+    for trigger_name, table_name, events, user_id_column in USER_STATS_TRIGGERS:
+        op.execute(
+            'CREATE TRIGGER {} AFTER {} ON "{}" FOR EACH ROW EXECUTE PROCEDURE user_stats_row_changed(\'{}\')'.format(trigger_name, events, table_name, user_id_column)
+        )
+    op.execute(
+        'CREATE TRIGGER user_stats_emergency AFTER UPDATE OF emergency_location_id ON emergency FOR EACH ROW EXECUTE PROCEDURE user_stats_emergency_moved()'
+    )
+
+    # initial full build
+    op.execute('SELECT refresh_user_stats(NULL)')
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS user_stats_emergency ON emergency')
+    for trigger_name, table_name, events, user_id_column in USER_STATS_TRIGGERS:
+        op.execute('DROP TRIGGER IF EXISTS {} ON "{}"'.format(trigger_name, table_name))
+    op.execute('DROP FUNCTION IF EXISTS user_stats_emergency_moved()')
+    op.execute('DROP FUNCTION IF EXISTS user_stats_row_changed()')
+    op.execute('DROP FUNCTION IF EXISTS refresh_user_stats(integer[])')
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('user_stats')
+    # ### end Alembic commands ###
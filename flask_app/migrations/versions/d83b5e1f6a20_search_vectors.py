@@ -0,0 +1,102 @@
+"""full-text search vectors on user, portfolio, emergency and acronym
+
+Revision ID: d83b5e1f6a20
+Revises: a41f7c3e9d62
+Create Date: 2026-10-18 09:41:27.603118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd83b5e1f6a20'
+down_revision = 'a41f7c3e9d62'
+branch_labels = None
+depends_on = None
+
+
+# initial build of each search_vector, as search/utils.py computed it at the time; the app keeps them current from here on
+BACKFILL_SEARCH_VECTORS = [
+    """
+    UPDATE "user" AS target SET search_vector =
+        setweight(to_tsvector('simple', COALESCE(d.name, '')), 'A') ||
+        setweight(to_tsvector('simple', COALESCE(d.skills, '')), 'B') ||
+        setweight(to_tsvector('simple', COALESCE(d.languages, '')), 'B') ||
+        setweight(to_tsvector('english', COALESCE(d.job_title, '')), 'C') ||
+        setweight(to_tsvector('english', COALESCE(d.bio, '')), 'C')
+    FROM (
+        SELECT t.id,
+            t.firstname || ' ' || t.lastname AS name,
+            (SELECT string_agg(skill.name, ' ') FROM user_skill JOIN skill ON skill.id = user_skill.skill_id WHERE user_skill.user_id = t.id) AS skills,
+            (SELECT string_agg(language.name, ' ') FROM user_language JOIN language ON language.id = user_language.language_id WHERE user_language.user_id = t.id) AS languages,
+            t.job_title, t.bio
+        FROM "user" t
+    ) d
+    WHERE target.id = d.id
+    """,
+    """
+    UPDATE portfolio SET search_vector =
+        setweight(to_tsvector('simple', COALESCE(title, '')), 'A') ||
+        setweight(to_tsvector('simple', COALESCE(type, '')), 'B') ||
+        setweight(to_tsvector('simple', COALESCE(format, '')), 'B') ||
+        setweight(to_tsvector('english', COALESCE(description, '')), 'C')
+    """,
+    """
+    UPDATE emergency AS target SET search_vector =
+        setweight(to_tsvector('simple', COALESCE(t.emergency_name, '')), 'A') ||
+        setweight(to_tsvector('simple', COALESCE(t.emergency_glide, '')), 'B') ||
+        setweight(to_tsvector('simple', COALESCE(et.emergency_type_name, '')), 'B') ||
+        setweight(to_tsvector('simple', COALESCE(ns.country_name, '')), 'B') ||
+        setweight(to_tsvector('english', COALESCE(t.activation_details, '')), 'C')
+    FROM emergency t
+    LEFT JOIN emergencytype et ON et.id = t.emergency_type_id
+    LEFT JOIN nationalsociety ns ON ns.ns_go_id = t.emergency_location_id
+    WHERE target.id = t.id
+    """,
+    """
+    UPDATE acronym SET search_vector =
+        setweight(to_tsvector('simple', COALESCE(acronym_eng, '')), 'A') ||
+        setweight(to_tsvector('simple', COALESCE(acronym_esp, '')), 'A') ||
+        setweight(to_tsvector('simple', COALESCE(acronym_fra, '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(def_eng, '')), 'B') ||
+        setweight(to_tsvector('spanish', COALESCE(def_esp, '')), 'B') ||
+        setweight(to_tsvector('french', COALESCE(def_fra, '')), 'B') ||
+        setweight(to_tsvector('english', COALESCE(expl_eng, '')), 'C') ||
+        setweight(to_tsvector('spanish', COALESCE(expl_esp, '')), 'C') ||
+        setweight(to_tsvector('french', COALESCE(expl_fra, '')), 'C')
+    """,
+]
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.add_column('user', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.add_column('portfolio', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.add_column('emergency', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.add_column('acronym', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    # ### end Alembic commands ###
+
+    # filled before indexing, so the GIN indexes are built once rather than updated row by row
+    for statement in BACKFILL_SEARCH_VECTORS:
+        op.execute(statement)
+
+    op.create_index('ix_user_search_vector', 'user', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_portfolio_search_vector', 'portfolio', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_emergency_search_vector', 'emergency', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_acronym_search_vector', 'acronym', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_acronym_search_vector', table_name='acronym')
+    op.drop_index('ix_emergency_search_vector', table_name='emergency')
+    op.drop_index('ix_portfolio_search_vector', table_name='portfolio')
+    op.drop_index('ix_user_search_vector', table_name='user')
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_column('acronym', 'search_vector')
+    op.drop_column('emergency', 'search_vector')
+    op.drop_column('portfolio', 'search_vector')
+    op.drop_column('user', 'search_vector')
+    # ### end Alembic commands ###
@@ -0,0 +1,7 @@
+from SIMS_Portal import create_app
+from SIMS_Portal.jobs.utils import run_worker
+
+app = create_app()
+
+if __name__ == '__main__':
+	run_worker(app)